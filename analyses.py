@@ -0,0 +1,209 @@
+"""Registro das análises do Proteoanalyzer (gráficos e métodos de enriquecimento).
+
+Cada análise é um plugin registrado com register, que declara os módulos
+pesados de que depende (matplotlib, scipy...). Eles só são importados quando a
+análise é executada (Analysis.load), e cada importação é medida por
+import_module como a etapa import[módulo] do metrics.json. Assim, iniciar o
+programa ou retomar um projeto já concluído não paga a importação do
+OmicScope, do pandas e do matplotlib.
+
+Os gráficos do OmicScope são registrados aqui, na ordem em que são gerados; os
+métodos de enriquecimento ("ora" e "gsea") são registrados em main.py.
+
+As etapas de uma execução podem ser filtradas com StageSelection (--only e
+--skip na linha de comando, only e skip no manifesto do batch).
+"""
+import importlib
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+from instrumentation import add_records, metrics_config
+
+
+# Grupos de etapas aceitos em --only/--skip, além dos nomes de cada etapa
+STAGE_GROUPS = ["tables", "plots", "enrichment", "redundancy", "contrasts", "fc_sweep", "store"]
+
+# Resolução dos gráficos (também faz parte da chave do cache de figuras)
+FIGURE_DPI = 300
+
+_pending_imports = []
+
+
+def import_module(name):
+    """Importa um módulo sob demanda, medindo o tempo da primeira importação.
+
+    O registro import[nome] vai para o metrics.json do projeto; importações
+    feitas antes de start_metrics são guardadas e gravadas por flush_import_records.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    record_import(name, time.perf_counter() - started)
+    return module
+
+
+def record_import(name, seconds):
+    """Registra o tempo de importação de um módulo (ou do início do programa, em import[main])."""
+    logging.info(f"[métricas] import[{name}]: {seconds:.3f} s")
+    _pending_imports.append({"stage": f"import[{name}]", "sizes": {}, "error": None,
+                             "started_at": datetime.now().isoformat(timespec="milliseconds"),
+                             "pid": os.getpid(), "wall_s": round(seconds, 4)})
+    flush_import_records()
+
+
+def flush_import_records():
+    """Grava no metrics.json as importações registradas, se a instrumentação estiver ativa."""
+    if metrics_config() is None:
+        return
+    records, _pending_imports[:] = list(_pending_imports), []
+    add_records(records)
+
+
+class Analysis:
+    """Uma análise registrada.
+
+    Atributos:
+        name: identificador (ex: "pca"), usado nas etapas plot[name] e em --only/--skip.
+        kind: "plot" ou "enrichment".
+        description: descrição usada nas mensagens.
+        message: mensagem exibida antes de solicitar as proteínas do gráfico.
+        weight: custo relativo de renderização (gráficos mais caros são enviados primeiro ao pool).
+        proteins: o gráfico aponta proteínas informadas pelo usuário.
+        palette: o gráfico usa uma paleta informada pelo usuário.
+        requires: módulos importados antes da primeira execução.
+        settings: função que retorna as configurações que alteram o gráfico (ex: backend de
+            coorte), incluídas na chave do cache de figuras.
+        run: função que executa a análise, ou None se ela é executada pelo chamador
+            (o volcano plot é gerado a partir da tabela de DEPs por create_volcano_plot).
+    """
+
+    def __init__(self, name, kind, description, run, message="", weight=1, proteins=False, palette=False,
+                 requires=(), settings=None):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.run = run
+        self.message = message
+        self.weight = weight
+        self.proteins = proteins
+        self.palette = palette
+        self.requires = tuple(requires)
+        self.settings = settings
+
+    def load(self):
+        """Importa as dependências da análise e retorna a função que a executa."""
+        for module in self.requires:
+            import_module(module)
+        return self.run
+
+
+ANALYSES = {}
+
+
+def register(name, kind, description, **options):
+    """Decorador que registra uma função como a análise name (ver Analysis)."""
+    def decorator(run):
+        ANALYSES[name] = Analysis(name, kind, description, run, **options)
+        return run
+    return decorator
+
+
+def analyses(kind):
+    """Análises de um tipo ("plot" ou "enrichment"), na ordem de registro."""
+    return [analysis for analysis in ANALYSES.values() if analysis.kind == kind]
+
+
+def _omicscope_plot(method, **fixed):
+    """Gráfico gerado por um método do objeto OmicScope, ex: rawfiledata.pca(dpi=300, save=...)."""
+    def run(rawfiledata, save, proteins=(), **options):
+        return getattr(rawfiledata, method)(*proteins, dpi=FIGURE_DPI, save=save, **fixed, **options)
+    run.__name__ = method
+    return run
+
+
+def _cohort_plot(view, fallback):
+    """Gráfico de coorte (ver cohort.py): usa o backend em float32 em coortes grandes e o OmicScope nas demais."""
+    def run(rawfiledata, save, proteins=(), **options):
+        cohort = import_module("cohort")
+        if cohort.use_native(rawfiledata):
+            return cohort.plot_view(view, rawfiledata, save, dpi=FIGURE_DPI)
+        return fallback(rawfiledata, save, proteins, **options)
+    run.__name__ = fallback.__name__
+    return run
+
+
+def _cohort_settings():
+    return import_module("cohort").settings()
+
+
+# Gráficos do projeto, na ordem em que são gerados: (nome, método do OmicScope e opções fixas,
+# descrição, mensagem, custo, opções do registro). "cohort" indica a vista de cohort.py usada em coortes grandes.
+for _name, _plot, _description, _message, _weight, _options in [
+    ("id_barplot", ("bar_ident", {}), "barplot de identificação",
+     "Iniciando plotagem de barplot de identificação das condições...", 1, {}),
+    ("dynamic_range", ("DynamicRange", {}), "gráfico de dynamic range",
+     "Iniciando plotagem de Dynamic Range...", 1, {"proteins": True}),
+    ("volcano", None, "volcano plot", "Iniciando plotagem de Volcano Plot...", 2, {"proteins": True}),
+    ("ma_plot", ("MAplot", {}), "gráfico de MA", "Iniciando plotagem de MA plot...", 2, {"proteins": True}),
+    ("normalization_plot", ("normalization_boxplot", {}), "gráfico de normalização",
+     "Iniciando plotagem de gráfico de normalização...", 2, {}),
+    ("conditions_barplot", ("bar_protein", {}), "gráfico barplot de comparação de proteínas entre condições",
+     "Iniciando plotagem de barplot comparando proteínas entre condições...", 1,
+     {"proteins": True, "palette": True}),
+    ("conditions_boxplot", ("boxplot_protein", {}), "gráfico boxplot de comparação de proteínas entre condições",
+     "Iniciando plotagem de boxplot comparando proteínas entre condições...", 1,
+     {"proteins": True, "palette": True}),
+    ("expression_heatmap", ("heatmap", {"linewidth": 0}), "gráfico heatmap de expressão",
+     "Iniciando plotagem de heatmap de expressão...", 10, {"cohort": "heatmap"}),
+    ("correlation_heatmap", ("correlation", {"linewidth": 0}), "gráfico heatmap de correlação",
+     "Iniciando plotagem de heatmap de correlação...", 5, {"cohort": "correlation"}),
+    ("pca", ("pca", {}), "gráfico de PCA", "Iniciando plotagem de gráfico de PCA...", 2, {"cohort": "pca"}),
+    ("kmeans", ("k_trend", {}), "gráfico de K-means", "Iniciando plotagem de gráfico de K-means...", 10,
+     {"cohort": "kmeans"}),
+]:
+    _run = _omicscope_plot(_plot[0], **_plot[1]) if _plot else None
+    _view = _options.pop("cohort", None)
+    if _view:
+        _run = _cohort_plot(_view, _run)
+        _options["settings"] = _cohort_settings
+    register(_name, "plot", _description, message=_message, weight=_weight, requires=("matplotlib.pyplot",),
+             **_options)(_run)
+
+
+def parse_stage_names(names):
+    """Normaliza uma seleção de etapas: aceita "pca,KEGG_2021_Human" ou uma lista."""
+    if not names:
+        return set()
+    if isinstance(names, str):
+        names = names.split(",")
+    return {str(name).strip() for name in names if str(name).strip()}
+
+
+class StageSelection:
+    """Etapas selecionadas por only (apenas estas) e skip (todas menos estas).
+
+    Cada etapa é identificada pelo grupo (STAGE_GROUPS) e pelo nome (ex: "deps",
+    "pca", "KEGG_2021_Human"), e only/skip aceitam ambos: --only plots,KEGG_2021_Human
+    gera todos os gráficos e apenas o enriquecimento do KEGG.
+    """
+
+    def __init__(self, only=None, skip=None, known=None):
+        self.only = parse_stage_names(only)
+        self.skip = parse_stage_names(skip)
+        if known is not None:
+            unknown = (self.only | self.skip) - set(known)
+            if unknown:
+                raise ValueError(f"Etapas desconhecidas: {', '.join(sorted(unknown))}. "
+                                 f"Etapas válidas: {', '.join(known)}")
+
+    def __call__(self, group, name=None):
+        """Indica se a etapa name do grupo group deve ser executada."""
+        names = {group} if name is None else {group, name}
+        if self.only and not names & self.only:
+            return False
+        return not names & self.skip
@@ -0,0 +1,237 @@
+"""Modo batch (sem interação) do Proteoanalyzer, guiado por um manifesto.
+
+O manifesto (JSON ou YAML) descreve um conjunto de dados por entrada; as
+chaves de "defaults" valem para todas as entradas que não as redefinem:
+
+    concurrency: 4
+    defaults:
+      user: Laboratório
+      target_directory: /dados/projetos
+      method: DIA-NN
+      fc: 1.5
+      palette: viridis
+      table_formats: [parquet, xlsx]
+    datasets:
+      - project: Coorte_A
+        input: coorte_a/report.tsv
+        control: CTRL
+        proteins: [ALB, APOA1]
+      - project: Coorte_B
+        input: coorte_b/proteinGroups.txt
+        pdata: coorte_b/pdata.xlsx
+        method: MaxQuant
+        control: WT
+        proteins:
+          volcano: [TP53]
+          dynamic_range: [ALB]
+
+Chaves de cada conjunto de dados: project, input, method, control, fc e
+target_directory (obrigatórias); pdata, user, proteins, palette, overwrite,
+enrichment_workers, enrichment_executor, plot_workers, table_formats,
+profile, resume, fc_sweep, enrichment_method, contrasts, contrast_workers,
+only e skip (opcionais). pdata é o arquivo de fenótipo exigido na leitura de
+exportações do MaxQuant e do DIA-NN. Caminhos relativos são resolvidos a partir da pasta do
+manifesto. Cada projeto mantém sua própria estrutura tables/, plots/ e
+app.log, como em create_dir. Com resume: true, um projeto existente é
+retomado, pulando as etapas já concluídas (checkpoints.json). fc_sweep é uma
+lista de valores de FC (ex: [1, 1.25, 1.5, 1.75, 2]) analisados em uma única
+passada, além do fc principal. contrasts ("control" ou "pairwise") analisa
+cada condição contra o controle, ou todos os pares, em contrast_workers
+processos. only e skip selecionam as etapas executadas, por grupo (tables,
+plots, enrichment, redundancy, contrasts, fc_sweep, store) ou por nome (ex:
+[pca, KEGG_2021_Human]).
+
+Uso: python batch.py manifesto.yaml [--workers N]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import main
+from analyses import StageSelection
+from main import PROTEIN_PLOTS, VALID_METHODS, enrichment_methods, parse_fc_cutoff, stage_names
+from tables import parse_table_formats
+
+
+REQUIRED_KEYS = ['project', 'input', 'method', 'control', 'fc', 'target_directory']
+OPTIONAL_KEYS = ['pdata', 'user', 'proteins', 'palette', 'overwrite', 'enrichment_workers', 'enrichment_executor',
+                 'plot_workers', 'table_formats', 'profile', 'resume', 'fc_sweep', 'enrichment_method',
+                 'contrasts', 'contrast_workers', 'only', 'skip']
+PLOT_PROTEIN_KEYS = sorted(PROTEIN_PLOTS)
+
+
+def read_manifest(manifestpath):
+    """Lê um manifesto JSON ou YAML e retorna seu conteúdo como dicionário."""
+    if not os.path.exists(manifestpath):
+        raise FileNotFoundError(f"Manifesto não encontrado: {manifestpath}")
+    with open(manifestpath, encoding="utf-8") as manifest_file:
+        content = manifest_file.read()
+    if manifestpath.lower().endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("O pacote PyYAML é necessário para ler manifestos YAML (pip install pyyaml).")
+        return yaml.safe_load(content) or {}
+    return json.loads(content)
+
+
+def load_manifest(manifestpath):
+    """Lê e valida o manifesto, retornando a concorrência indicada e a lista de conjuntos de dados."""
+    manifest = read_manifest(manifestpath)
+    base_dir = os.path.dirname(os.path.abspath(manifestpath))
+    defaults = manifest.get("defaults", {})
+    datasets = manifest.get("datasets", [])
+    if not datasets:
+        raise ValueError(f"O manifesto não possui conjuntos de dados em 'datasets': {manifestpath}")
+
+    jobs = []
+    projects = set()
+    for position, entry in enumerate(datasets, start=1):
+        job = dict(defaults)
+        job.update(entry)
+        unknown = set(job) - set(REQUIRED_KEYS) - set(OPTIONAL_KEYS)
+        if unknown:
+            raise ValueError(f"Conjunto de dados {position}: chaves desconhecidas {sorted(unknown)}")
+        missing = [key for key in REQUIRED_KEYS if job.get(key) in (None, "")]
+        if missing:
+            raise ValueError(f"Conjunto de dados {position}: chaves obrigatórias ausentes {missing}")
+        if job['method'] not in VALID_METHODS:
+            raise ValueError(f"Conjunto de dados {position}: método '{job['method']}' inválido. "
+                             f"Métodos válidos: {', '.join(VALID_METHODS)}")
+        if isinstance(job.get('proteins'), dict):
+            unknown_plots = set(job['proteins']) - set(PLOT_PROTEIN_KEYS)
+            if unknown_plots:
+                raise ValueError(f"Conjunto de dados {position}: gráficos desconhecidos em 'proteins' {sorted(unknown_plots)}")
+        if job.get('table_formats') is not None:
+            try:
+                job['table_formats'] = parse_table_formats(job['table_formats'])
+            except ValueError as error:
+                raise ValueError(f"Conjunto de dados {position}: {error}")
+
+        if job.get('enrichment_method') is not None and job['enrichment_method'] not in enrichment_methods():
+            raise ValueError(f"Conjunto de dados {position}: método de enriquecimento "
+                             f"'{job['enrichment_method']}' inválido. "
+                             f"Use {' ou '.join(repr(method) for method in enrichment_methods())}.")
+        if job.get('contrasts') not in (None, 'control', 'pairwise'):
+            raise ValueError(f"Conjunto de dados {position}: modo de contrastes '{job['contrasts']}' inválido. "
+                             f"Use 'control' ou 'pairwise'.")
+        try:
+            StageSelection(job.get('only'), job.get('skip'), stage_names())
+        except ValueError as error:
+            raise ValueError(f"Conjunto de dados {position}: {error}")
+        try:
+            parse_fc_cutoff(job['fc'])
+        except ValueError as error:
+            raise ValueError(f"Conjunto de dados {position}: {error}")
+        if job.get('fc_sweep') is not None:
+            if not isinstance(job['fc_sweep'], list) or not job['fc_sweep']:
+                raise ValueError(f"Conjunto de dados {position}: 'fc_sweep' deve ser uma lista de valores de FC")
+            try:
+                for value in job['fc_sweep']:
+                    parse_fc_cutoff(value)
+            except ValueError as error:
+                raise ValueError(f"Conjunto de dados {position}: {error}")
+
+        for key in ('input', 'pdata', 'target_directory'):
+            if job.get(key) in (None, ""):
+                continue
+            job[key] = os.path.normpath(os.path.join(base_dir, os.path.expanduser(str(job[key]))))
+        target = (job['target_directory'], job['project'])
+        if target in projects:
+            raise ValueError(f"Conjunto de dados {position}: projeto '{job['project']}' repetido em {job['target_directory']}")
+        projects.add(target)
+        jobs.append(job)
+    return manifest.get("concurrency"), jobs
+
+
+def _init_batch_worker():
+    # Os gráficos são gerados sem interface gráfica nos processos do batch
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def run_dataset(job):
+    """Executa a análise completa de um conjunto de dados do manifesto, sem interação.
+
+    Retorna o diretório do projeto e a duração da análise em segundos.
+    """
+    started = time.perf_counter()
+    directory = main.create_dir(job['target_directory'], job['project'], job.get('user', ""),
+                                overwrite=bool(job.get('overwrite', False)),
+                                resume=bool(job.get('resume', False)))
+    try:
+        main.run_analysis(directory, job['project'], job['input'], job['method'], job['control'],
+                          fc=job['fc'],
+                          proteins=job.get('proteins') or [],
+                          palette=job.get('palette') or "",
+                          enrichment_workers=job.get('enrichment_workers', 1),
+                          enrichment_executor=job.get('enrichment_executor'),
+                          plot_workers=job.get('plot_workers', 1),
+                          table_formats=job.get('table_formats'),
+                          profile=job.get('profile'),
+                          fc_sweep=job.get('fc_sweep'),
+                          enrichment_method=job.get('enrichment_method'),
+                          contrasts=job.get('contrasts'),
+                          contrast_workers=job.get('contrast_workers', 1),
+                          only=job.get('only'),
+                          skip=job.get('skip'),
+                          pdata=job.get('pdata'))
+    except Exception as error:
+        logging.error(f"Erro inesperado: {error}", exc_info=True)
+        raise
+    finally:
+        logging.shutdown()
+    return directory, time.perf_counter() - started
+
+
+def run_manifest(manifestpath, workers=None):
+    """Executa todos os conjuntos de dados do manifesto em um pool de processos.
+
+    Args:
+        manifestpath: caminho do manifesto JSON/YAML.
+        workers: número máximo de conjuntos de dados processados simultaneamente.
+            Padrão: "concurrency" do manifesto ou 1.
+
+    Returns:
+        lista de dicionários com projeto, status, diretório, duração e erro de cada conjunto de dados.
+    """
+    concurrency, jobs = load_manifest(manifestpath)
+    workers = max(1, int(workers or concurrency or 1))
+    print(f"Proteoanalyzer 1.0 - modo batch: {len(jobs)} conjunto(s) de dados, {workers} em paralelo.")
+
+    summary = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as pool:
+        futures = {pool.submit(run_dataset, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                directory, duration = future.result()
+                summary.append({"project": job['project'], "status": "ok", "directory": directory,
+                                "duration": round(duration, 1), "error": None})
+                print(f"[ok] {job['project']} concluído em {duration:.1f} s: {directory}")
+            except Exception as error:
+                summary.append({"project": job['project'], "status": "erro", "directory": None,
+                                "duration": None, "error": str(error)})
+                print(f"[erro] {job['project']}: {error}")
+    return summary
+
+
+def run_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Executa o Proteoanalyzer sem interação a partir de um manifesto.")
+    parser.add_argument("manifest", help="Manifesto JSON ou YAML com um conjunto de dados por entrada.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Número máximo de conjuntos de dados processados simultaneamente.")
+    args = parser.parse_args(argv)
+
+    summary = run_manifest(args.manifest, args.workers)
+    failures = [item for item in summary if item["status"] != "ok"]
+    print(f"Batch concluído: {len(summary) - len(failures)} de {len(summary)} conjunto(s) de dados analisados com sucesso.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
@@ -0,0 +1,397 @@
+"""Benchmark das etapas do Proteoanalyzer com conjuntos de dados sintéticos.
+
+Gera exportações sintéticas de cada método suportado (MaxQuant, Progenesis,
+General, DIA-NN e PatternLab) nos tamanhos pedidos e mede, etapa por etapa,
+o tempo de parede, o tempo de CPU e o pico de memória residente (RSS):
+read_proteomics_file, filter_deps_dataframe, cada tabela de create_table_file,
+cada gráfico de plot_data, create_volcano_plot, perform_ora_enrichment e
+perform_gsea_enrichment de cada banco. Cada conjunto de dados é medido em um
+processo novo, para que o pico de memória de um não contamine o do seguinte.
+
+Os resultados podem ser gravados como referência (--save-baseline) e
+comparados com uma referência anterior; etapas mais lentas ou com mais
+memória que a tolerância são apontadas como regressões.
+
+Uso:
+    python benchmark.py --methods General DIA-NN --proteins 1000 5000 --samples 6 50
+    python benchmark.py --save-baseline
+    python benchmark.py --baseline benchmarks/baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import PeakMemory
+
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+DEFAULT_METHODS = ['MaxQuant', 'Progenesis', 'General', 'DIA-NN', 'PatternLab']
+DEFAULT_PROTEINS = [1000, 5000, 20000]
+DEFAULT_SAMPLES = [6, 50, 200]
+
+CONTROL_GROUP = "CTRL"
+TREATMENT_GROUP = "TRT"
+BENCHMARK_FC = 1.5
+
+# Regressão: etapa pelo menos TOLERANCE mais lenta (ou com mais memória) que a referência,
+# ignorando diferenças absolutas abaixo dos mínimos abaixo
+TOLERANCE = 0.25
+MIN_DELTA_SECONDS = 0.05
+MIN_DELTA_MB = 20
+
+
+# ---------------------------------------------------------------------------------#
+# Medição
+def measure(records, dataset, stage, function, *args, **kwargs):
+    """Executa uma etapa registrando tempo de parede, tempo de CPU, pico de RSS e erro (se houver)."""
+    record = {"dataset": dataset, "stage": stage, "error": None}
+    result = None
+    with PeakMemory() as memory:
+        wall_started, cpu_started = time.perf_counter(), time.process_time()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as error:
+            record["error"] = f"{type(error).__name__}: {error}"
+        record["wall_s"] = round(time.perf_counter() - wall_started, 4)
+        record["cpu_s"] = round(time.process_time() - cpu_started, 4)
+    record["peak_rss_mb"] = round(memory.peak / 1024 / 1024, 1)
+    records.append(record)
+    status = "erro" if record["error"] else "ok"
+    print(f"  {stage:<45} {record['wall_s']:>9.3f} s {record['peak_rss_mb']:>9.1f} MB  {status}")
+    return result
+
+
+# ---------------------------------------------------------------------------------#
+# Conjuntos de dados sintéticos
+def _synthetic_matrix(proteins, samples, seed=0):
+    """Abundâncias sintéticas com 10% das proteínas aumentadas e 10% diminuídas no tratamento."""
+    from libraries import load_gene_set_libraries
+    from main import DATA_DIR, ENRICHMENT_DATABASES
+
+    rng = np.random.default_rng(seed)
+    # Genes reais das bibliotecas, para que o enriquecimento encontre termos
+    known_genes = np.asarray(load_gene_set_libraries([db for db, _, _ in ENRICHMENT_DATABASES], DATA_DIR).genes)
+    genes = list(rng.permutation(known_genes)[:proteins])
+    genes += [f"SYN{i}" for i in range(proteins - len(genes))]
+    accessions = [f"P{i:06d}" for i in range(proteins)]
+
+    controls = samples - samples // 2
+    conditions = [CONTROL_GROUP] * controls + [TREATMENT_GROUP] * (samples - controls)
+    biological = list(range(1, controls + 1)) + list(range(1, samples - controls + 1))
+    sample_names = [f"S{i:03d}" for i in range(1, samples + 1)]
+
+    baseline = rng.lognormal(20, 1.5, (proteins, 1))
+    abundance = baseline * rng.lognormal(0, 0.25, (proteins, samples))
+    regulated = rng.permutation(proteins)
+    treated = np.array(conditions) == TREATMENT_GROUP
+    abundance[np.ix_(regulated[:proteins // 10], treated)] *= 4
+    abundance[np.ix_(regulated[proteins // 10:proteins // 5], treated)] /= 4
+    return {"genes": genes, "accessions": accessions, "samples": sample_names, "conditions": conditions,
+            "biological": biological, "abundance": abundance}
+
+
+def _pdata(data):
+    return pd.DataFrame({"Sample": data["samples"], "Condition": data["conditions"],
+                         "Biological": data["biological"]})
+
+
+def _descriptions(data):
+    return [f"Synthetic protein {accession} OS=Homo sapiens OX=9606 GN={gene} PE=1 SV=1"
+            for accession, gene in zip(data["accessions"], data["genes"])]
+
+
+def _write_general(data, basepath):
+    path = f"{basepath}.xlsx"
+    rdata = pd.DataFrame({"Accession": data["accessions"], "gene_name": data["genes"],
+                          "Description": _descriptions(data)})
+    with pd.ExcelWriter(path) as workbook:
+        pd.DataFrame(data["abundance"], columns=data["samples"]).to_excel(workbook, index=False, sheet_name="assay")
+        rdata.to_excel(workbook, index=False, sheet_name="rdata")
+        _pdata(data).to_excel(workbook, index=False, sheet_name="pdata")
+    return path, None
+
+
+def _write_maxquant(data, basepath):
+    path, pdata_path = f"{basepath}_proteinGroups.txt", f"{basepath}_pdata.csv"
+    table = pd.DataFrame({"Protein IDs": data["accessions"], "Majority protein IDs": data["accessions"],
+                          "Gene names": data["genes"], "Fasta headers": _descriptions(data),
+                          "Score": 100.0, "Peptides": 10, "Unique peptides": 8})
+    intensities = pd.DataFrame(data["abundance"], columns=[f"LFQ intensity {sample}" for sample in data["samples"]])
+    pd.concat([table, intensities], axis=1).to_csv(path, sep="\t", index=False)
+    _pdata(data).to_csv(pdata_path, index=False)
+    return path, pdata_path
+
+
+def _write_diann(data, basepath):
+    """Relatório longo do DIA-NN (report.tsv), com um precursor por proteína e corrida."""
+    path, pdata_path = f"{basepath}_report.tsv", f"{basepath}_pdata.csv"
+    proteins, samples = data["abundance"].shape
+    header = True
+    for column in range(samples):
+        pd.DataFrame({"Run": data["samples"][column],
+                      "Protein.Group": data["accessions"],
+                      "Protein.Ids": data["accessions"],
+                      "Protein.Names": [f"{gene}_HUMAN" for gene in data["genes"]],
+                      "Genes": data["genes"],
+                      "First.Protein.Description": [f"Synthetic protein {gene}" for gene in data["genes"]],
+                      "Precursor.Id": [f"PEPTIDE{i}2" for i in range(proteins)],
+                      "PG.MaxLFQ": data["abundance"][:, column]}).to_csv(path, sep="\t", index=False,
+                                                                            mode="w" if header else "a",
+                                                                            header=header)
+        header = False
+    _pdata(data).to_csv(pdata_path, index=False)
+    return path, pdata_path
+
+
+def _write_progenesis(data, basepath):
+    """CSV do Progenesis QI: cabeçalho de três linhas (grupo de colunas, condições e nomes)."""
+    path = f"{basepath}_progenesis.csv"
+    metadata = ["Accession", "Peptide count", "Unique peptides", "Confidence score", "Description"]
+    samples = len(data["samples"])
+    groups = ["Normalized abundance"] + [""] * (samples - 1)
+    conditions = [condition if position == 0 or condition != data["conditions"][position - 1] else ""
+                  for position, condition in enumerate(data["conditions"])]
+    header = pd.DataFrame([[""] * len(metadata) + conditions, metadata + data["samples"]],
+                          columns=metadata + groups)
+    table = pd.DataFrame({"Accession": data["accessions"], "Peptide count": 10, "Unique peptides": 8,
+                          "Confidence score": 100.0, "Description": _descriptions(data)})
+    table = pd.concat([table, pd.DataFrame(data["abundance"])], axis=1)
+    table.columns = header.columns
+    pd.concat([header, table]).to_csv(path, index=False)
+    return path, None
+
+
+def _write_patternlab(data, basepath):
+    """Arquivo .plp do PatternLab V (matriz esparsa por corrida, índice de proteínas e fatores)."""
+    path = f"{basepath}.plp"
+    classes = {CONTROL_GROUP: 1, TREATMENT_GROUP: 2}
+    with open(path, "w") as plp:
+        plp.write("###Description\n")
+        for condition, class_id in classes.items():
+            plp.write(f"#ClassDescription\t{class_id}\t{condition}\n")
+        plp.write("###SparseMatrix\n")
+        for column, sample in enumerate(data["samples"]):
+            plp.write(f"#C:\\runs\\{sample}.raw\n")
+            values = " ".join(f"{i}:{value:.2f}" for i, value in enumerate(data["abundance"][:, column]))
+            plp.write(f"{classes[data['conditions'][column]]} {values}\n")
+        plp.write("###Index\n")
+        for i, description in enumerate(_descriptions(data)):
+            plp.write(f"{i}\t{data['accessions'][i]}\t{description}\n")
+        plp.write("###SecondaryLabels\n")
+        for column, sample in enumerate(data["samples"]):
+            plp.write(f"{column}\t{sample}.raw\t1.0\n")
+    return path, None
+
+
+SYNTHETIC_WRITERS = {
+    "General": _write_general,
+    "MaxQuant": _write_maxquant,
+    "DIA-NN": _write_diann,
+    "Progenesis": _write_progenesis,
+    "PatternLab": _write_patternlab,
+}
+
+
+def synthetic_dataset(method, proteins, samples, directory, seed=0):
+    """Gera (ou reaproveita, se já existir em directory) a exportação sintética de um método.
+
+    Returns:
+        tupla (caminho do arquivo, caminho da pdata ou None).
+    """
+    if method not in SYNTHETIC_WRITERS:
+        raise ValueError(f"Método sem gerador sintético: {method}. Métodos: {', '.join(SYNTHETIC_WRITERS)}")
+    basepath = os.path.join(directory, f"{method}_{proteins}x{samples}_{seed}")
+    marker = f"{basepath}.json"
+    if os.path.exists(marker):
+        with open(marker) as source:
+            paths = json.load(source)
+        if all(path is None or os.path.exists(path) for path in paths):
+            return tuple(paths)
+    paths = SYNTHETIC_WRITERS[method](_synthetic_matrix(proteins, samples, seed), basepath)
+    with open(marker, "w") as target:
+        json.dump(paths, target)
+    return paths
+
+
+# ---------------------------------------------------------------------------------#
+# Etapas
+def _init_benchmark_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def benchmark_dataset(method, proteins, samples, rawfilepath, pdatapath, outputdir, table_formats, databases):
+    """Mede todas as etapas da análise de um conjunto de dados. Retorna a lista de registros."""
+    import main
+    from libraries import load_gene_set_libraries
+    from matplotlib import pyplot as plt
+
+    dataset = f"{method}/{proteins}x{samples}"
+    tablesdir = os.path.join(outputdir, "tables")
+    plotsdir = os.path.join(outputdir, "plots")
+    os.makedirs(tablesdir, exist_ok=True)
+    os.makedirs(plotsdir, exist_ok=True)
+    # Compila o índice das bibliotecas fora das medições
+    load_gene_set_libraries([db for db, _, _ in databases], main.DATA_DIR)
+
+    records = []
+    print(f"{dataset}")
+    data = measure(records, dataset, "read_proteomics_file", main.read_proteomics_file,
+                   rawfilepath, method, CONTROL_GROUP, use_cache=False, pdata=pdatapath)
+    if data is None:
+        return records
+
+    deps = pd.DataFrame(data.deps)
+    log2fc_cutoff = main.parse_fc_cutoff(BENCHMARK_FC)
+    filtered = measure(records, dataset, "filter_deps_dataframe", main.filter_deps_dataframe, log2fc_cutoff, deps)
+
+    tables = [("Parâmetros", pd.DataFrame(data.Params)), ("Dados brutos", pd.DataFrame(data.quant_data)),
+              ("DEPs", deps), ("DEPs filtradas", filtered)]
+    for name, dataframe in tables:
+        if dataframe is None:
+            continue
+        for table_format in table_formats:
+            measure(records, dataset, f"create_table_file[{name}.{table_format}]", main.create_table_file,
+                    dataframe, name, tablesdir, [table_format])
+
+    labels = list(deps.sort_values("pAdjusted")["gene_name"].dropna().head(3))
+    for analysis_type, analysis, _, _ in main.PLOTS:
+        if analysis_type == "volcano":
+            measure(records, dataset, "create_volcano_plot", main.create_volcano_plot,
+                    deps, log2fc_cutoff, 0.05, plotsdir, f"{method}_Volcano_plot", proteins=labels)
+        else:
+            measure(records, dataset, f"plot_data[{analysis_type}]", main.plot_data,
+                    data, analysis_type, method, plotsdir, analysis,
+                    proteins=labels if analysis_type in main.PROTEIN_PLOTS else [], palette="")
+        plt.close("all")
+
+    for db, analysis, _ in databases:
+        measure(records, dataset, f"perform_ora_enrichment[{db}]", main.perform_ora_enrichment,
+                data, [(db, analysis)], main.DATA_DIR)
+        measure(records, dataset, f"perform_gsea_enrichment[{db}]", main.perform_gsea_enrichment,
+                data, [(db, analysis)], main.DATA_DIR, permutations=main.GSEA_PERMUTATIONS, seed=main.GSEA_SEED)
+    return records
+
+
+def run_benchmarks(methods, proteins, samples, workdir, table_formats=("csv", "xlsx"), databases=None, seed=0):
+    """Gera os conjuntos de dados e mede cada um em um processo separado."""
+    from main import ENRICHMENT_DATABASES
+
+    databases = databases or ENRICHMENT_DATABASES
+    datadir = os.path.join(workdir, "data")
+    os.makedirs(datadir, exist_ok=True)
+    records = []
+    for method in methods:
+        for protein_count in proteins:
+            for sample_count in samples:
+                print(f"Gerando {method} com {protein_count} proteínas e {sample_count} amostras...")
+                rawfilepath, pdatapath = synthetic_dataset(method, protein_count, sample_count, datadir, seed)
+                outputdir = os.path.join(workdir, "output", f"{method}_{protein_count}x{sample_count}")
+                with ProcessPoolExecutor(max_workers=1, initializer=_init_benchmark_worker) as pool:
+                    records += pool.submit(benchmark_dataset, method, protein_count, sample_count, rawfilepath,
+                                           pdatapath, outputdir, list(table_formats), databases).result()
+    return records
+
+
+# ---------------------------------------------------------------------------------#
+# Referência
+def _result_key(record):
+    return f"{record['dataset']}|{record['stage']}"
+
+
+def save_baseline(records, path=BASELINE_PATH):
+    """Grava os resultados (sem erro) como referência."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    baseline = {"created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(), "machine": platform.platform(),
+                "results": {_result_key(record): {"wall_s": record["wall_s"], "peak_rss_mb": record["peak_rss_mb"]}
+                            for record in records if record["error"] is None}}
+    with open(path, "w", encoding="utf-8") as target:
+        json.dump(baseline, target, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare_with_baseline(records, baseline, tolerance=TOLERANCE):
+    """Compara os resultados com a referência e retorna a lista de regressões."""
+    regressions = []
+    for record in records:
+        reference = baseline.get("results", {}).get(_result_key(record))
+        if reference is None:
+            continue
+        if record["error"] is not None:
+            regressions.append({"key": _result_key(record), "metric": "error", "baseline": None,
+                                "current": record["error"]})
+            continue
+        for metric, minimum in (("wall_s", MIN_DELTA_SECONDS), ("peak_rss_mb", MIN_DELTA_MB)):
+            before, after = reference[metric], record[metric]
+            if after > before * (1 + tolerance) and after - before > minimum:
+                regressions.append({"key": _result_key(record), "metric": metric, "baseline": before,
+                                    "current": after})
+    return regressions
+
+
+def run_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark das etapas do Proteoanalyzer com dados sintéticos.")
+    parser.add_argument("--methods", nargs="+", default=DEFAULT_METHODS, choices=DEFAULT_METHODS)
+    parser.add_argument("--proteins", nargs="+", type=int, default=DEFAULT_PROTEINS)
+    parser.add_argument("--samples", nargs="+", type=int, default=DEFAULT_SAMPLES)
+    parser.add_argument("--table-formats", default="csv,xlsx", help="Formatos medidos em create_table_file.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None,
+                        help="Pasta dos dados sintéticos e saídas; reaproveitada entre execuções. "
+                             "Padrão: pasta temporária removida ao final.")
+    parser.add_argument("--output", default=None, help="Arquivo JSON com os resultados.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Referência usada na comparação.")
+    parser.add_argument("--save-baseline", action="store_true", help="Grava os resultados como nova referência.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Aumento relativo tolerado antes de apontar regressão (padrão: 0.25).")
+    args = parser.parse_args(argv)
+
+    from tables import parse_table_formats
+    table_formats = parse_table_formats(args.table_formats)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="proteoanalyzer-benchmark-")
+    try:
+        records = run_benchmarks(args.methods, args.proteins, args.samples, workdir, table_formats, seed=args.seed)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as target:
+            json.dump(records, target, ensure_ascii=False, indent=2)
+        print(f"Resultados gravados em {args.output}")
+
+    failures = [record for record in records if record["error"]]
+    for record in failures:
+        print(f"[erro] {record['dataset']} {record['stage']}: {record['error']}")
+
+    if args.save_baseline:
+        print(f"Referência gravada em {save_baseline(records, args.baseline)}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"Sem referência em {args.baseline}; use --save-baseline para gravar uma.")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as source:
+        regressions = compare_with_baseline(records, json.load(source), args.tolerance)
+    for regression in regressions:
+        print(f"[regressão] {regression['key']} {regression['metric']}: "
+              f"{regression['baseline']} -> {regression['current']}")
+    print(f"{len(regressions)} regressão(ões) em relação a {args.baseline}.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
@@ -0,0 +1,111 @@
+"""Checkpoints das etapas da análise de um projeto.
+
+A análise é dividida em etapas com entradas declaradas: leitura dos dados,
+tabelas de parâmetros, condições, dados brutos e DEPs, filtro de FC, cada
+gráfico e cada banco de enriquecimento. Ao ser concluída, cada etapa é
+registrada em checkpoints.json, na pasta do projeto, com o hash das suas
+entradas e o hash (SHA-256), o tamanho e o mtime dos arquivos que gerou.
+
+Ao retomar um projeto, as etapas cujas entradas não mudaram e cujos arquivos
+continuam intactos são puladas. As entradas de uma etapa incluem a impressão
+digital das etapas de que ela depende, de modo que uma mudança se propaga
+apenas para as etapas seguintes: alterar o cutoff de FC, por exemplo, refaz
+somente o filtro das DEPs e o volcano plot.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+
+CHECKPOINTS_FILE = "checkpoints.json"
+CHECKPOINTS_VERSION = 1
+
+
+def fingerprint(*inputs):
+    """Hash das entradas de uma etapa.
+
+    As entradas devem ser serializáveis em JSON; outros valores são convertidos
+    com str. Retorna None se alguma entrada for None (dependência desconhecida),
+    o que faz a etapa sempre ser executada.
+    """
+    if any(value is None for value in inputs):
+        return None
+    identity = json.dumps([CHECKPOINTS_VERSION, list(inputs)], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def _sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Checkpoints:
+    """Registro das etapas concluídas de um projeto, gravado em checkpoints.json.
+
+    Pode ser usado por várias threads (as tabelas são registradas pela thread
+    de escrita em segundo plano).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, CHECKPOINTS_FILE)
+        self._lock = threading.Lock()
+        self._stages = {}
+        try:
+            with open(self.path, encoding="utf-8") as source:
+                content = json.load(source)
+            if content.get("version") == CHECKPOINTS_VERSION:
+                self._stages = content.get("stages", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as error:
+            logging.warning(f"Checkpoints ilegíveis, todas as etapas serão refeitas: {self.path} ({error})")
+
+    def _intact(self, output):
+        filepath = os.path.join(self.directory, output["path"])
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return False
+        if stat.st_size != output["size"]:
+            return False
+        if stat.st_mtime_ns == output["mtime_ns"]:
+            return True
+        return _sha256(filepath) == output["sha256"]
+
+    def done(self, stage, digest):
+        """Indica se a etapa já foi concluída com as mesmas entradas e seus arquivos continuam intactos."""
+        with self._lock:
+            record = self._stages.get(stage)
+        if digest is None or record is None or record["inputs"] != digest:
+            return False
+        return all(self._intact(output) for output in record["outputs"])
+
+    def complete(self, stage, digest, outputs=()):
+        """Registra a etapa como concluída, com o hash das entradas e os arquivos gerados."""
+        if digest is None:
+            return
+        stamps = []
+        for filepath in outputs:
+            stat = os.stat(filepath)
+            stamps.append({"path": os.path.relpath(filepath, self.directory), "size": stat.st_size,
+                           "mtime_ns": stat.st_mtime_ns, "sha256": _sha256(filepath)})
+        with self._lock:
+            self._stages[stage] = {"inputs": digest, "outputs": stamps}
+            self._save()
+
+    def _save(self):
+        try:
+            descriptor, partial = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".json")
+            with os.fdopen(descriptor, "w", encoding="utf-8") as target:
+                json.dump({"version": CHECKPOINTS_VERSION, "stages": self._stages}, target,
+                          ensure_ascii=False, indent=2)
+            os.replace(partial, self.path)
+        except OSError as error:
+            logging.warning(f"Não foi possível gravar {self.path}: {error}")
@@ -0,0 +1,384 @@
+"""Backend numérico dos gráficos de coorte: PCA, correlação, heatmap de expressão e K-means.
+
+Os métodos do OmicScope (pca, correlation, heatmap e k_trend) trabalham sobre a
+matriz proteínas x amostras inteira em float64, e o heatmap agrupa todas as
+proteínas hierarquicamente. Com centenas de amostras e milhares de proteínas,
+são as etapas mais lentas e que mais usam memória. Aqui as mesmas vistas são
+calculadas sobre o log2 das abundâncias em float32:
+
+- PCA aleatorizada (Halko et al.), com iterações de potência, sem formar a
+  matriz de covariância;
+- correlação entre amostras como um único produto matricial (BLAS) das
+  colunas padronizadas;
+- heatmap de expressão sobre as COHORT_TOP_PROTEINS proteínas de maior
+  variância, ou sobre os centroides de um K-means com esse número de grupos
+  (COHORT_SUBSAMPLE = "cluster"), antes do agrupamento hierárquico;
+- K-means em mini-lotes sobre os perfis médios por condição (padronizados).
+
+Os resultados de cada vista (escores, correlações, ordem do agrupamento,
+rótulos) são guardados como arrays em COHORT_CACHE_DIR, indexados pelo
+conteúdo da matriz e pelos parâmetros, de modo que refazer um gráfico não
+refaz o cálculo. O cache tem tamanho máximo (COHORT_CACHE_SIZE_MB); ao
+excedê-lo, os arrays usados há mais tempo são removidos primeiro.
+
+O backend é escolhido por COHORT_BACKEND: "omicscope", "native" ou "auto"
+(padrão), que usa este backend a partir de COHORT_MIN_SAMPLES amostras.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib import pyplot as plt
+
+
+COHORT_VERSION = 1
+
+COHORT_BACKEND = os.environ.get("PROTEOANALYZER_COHORT_BACKEND", "auto")
+COHORT_MIN_SAMPLES = int(os.environ.get("PROTEOANALYZER_COHORT_MIN_SAMPLES", "60"))
+
+# Proteínas do heatmap de expressão e forma de seleção: "variance" (maior variância) ou "cluster" (centroides)
+COHORT_TOP_PROTEINS = int(os.environ.get("PROTEOANALYZER_COHORT_TOP_PROTEINS", "2000"))
+COHORT_SUBSAMPLE = os.environ.get("PROTEOANALYZER_COHORT_SUBSAMPLE", "variance")
+
+# Número de grupos do K-means e semente das etapas aleatorizadas
+COHORT_CLUSTERS = int(os.environ.get("PROTEOANALYZER_COHORT_CLUSTERS", "6"))
+COHORT_SEED = int(os.environ.get("PROTEOANALYZER_COHORT_SEED", "42"))
+
+# Formatos dos gráficos do backend, separados por vírgula: svg, png, pdf
+COHORT_FORMATS = os.environ.get("PROTEOANALYZER_COHORT_FORMATS", "svg").split(",")
+
+COHORT_CACHE_DIR = os.environ.get("PROTEOANALYZER_COHORT_CACHE_DIR",
+                                  os.path.join(os.path.expanduser("~"), ".cache", "proteoanalyzer", "cohort"))
+
+COHORT_CACHE_SIZE_MB = float(os.environ.get("PROTEOANALYZER_COHORT_CACHE_SIZE_MB", "512"))
+
+# Vistas mantidas em memória por processo (o serviço local refaz gráficos sem ler o disco)
+COMPUTED_VIEWS = 8
+
+MINIBATCH_SIZE = 1024
+MINIBATCH_ITERATIONS = 100
+
+# Acima deste número de grupos o K-means é inicializado ao acaso em vez de k-means++
+KMEANS_PLUSPLUS_CLUSTERS = 64
+
+VIEWS = ("pca", "correlation", "heatmap", "kmeans")
+
+_computed = OrderedDict()
+
+
+def use_native(rawfiledata):
+    """Indica se as vistas de coorte de um conjunto de dados usam este backend."""
+    if COHORT_BACKEND not in ("auto", "native", "omicscope"):
+        raise ValueError(f"Backend de coorte inválido: {COHORT_BACKEND}. Use 'auto', 'native' ou 'omicscope'.")
+    if COHORT_BACKEND != "auto":
+        return COHORT_BACKEND == "native"
+    return len(rawfiledata.pdata.drop_duplicates('Sample')) >= COHORT_MIN_SAMPLES
+
+
+def settings():
+    """Parâmetros que alteram os gráficos de coorte (usados também na chave do cache de figuras)."""
+    return {"backend": COHORT_BACKEND, "min_samples": COHORT_MIN_SAMPLES, "top": COHORT_TOP_PROTEINS,
+            "subsample": COHORT_SUBSAMPLE, "clusters": COHORT_CLUSTERS, "seed": COHORT_SEED,
+            "formats": COHORT_FORMATS, "version": COHORT_VERSION}
+
+
+def cohort_matrix(rawfiledata):
+    """log2 das abundâncias (proteínas x amostras, float32), com as condições das amostras.
+
+    Valores ausentes ou não positivos são substituídos pela média da proteína;
+    proteínas sem nenhum valor são descartadas.
+
+    Returns:
+        tupla (matriz, amostras, condições das amostras).
+    """
+    pdata = rawfiledata.pdata.drop_duplicates('Sample')
+    assay = rawfiledata.assay
+    samples = [sample for sample in pdata['Sample'] if sample in assay.columns]
+    conditions = pdata.set_index('Sample').loc[samples, 'Condition'].astype(str).to_numpy()
+    matrix = assay[samples].to_numpy(dtype=np.float32)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        matrix = np.log2(matrix, out=np.full_like(matrix, np.nan), where=matrix > 0)
+    quantified = ~np.isnan(matrix).all(axis=1)
+    matrix = matrix[quantified]
+    missing = np.isnan(matrix)
+    if missing.any():
+        matrix[missing] = np.take(np.nanmean(matrix, axis=1), np.nonzero(missing)[0])
+    return matrix, np.asarray(samples, dtype=str), conditions
+
+
+def standardize(matrix, axis=1):
+    """Padroniza (média 0, desvio 1) as linhas (axis=1) ou colunas (axis=0), em float32."""
+    centered = matrix - matrix.mean(axis=axis, keepdims=True)
+    scale = centered.std(axis=axis, keepdims=True)
+    scale[scale == 0] = 1
+    return (centered / scale).astype(np.float32, copy=False)
+
+
+def randomized_pca(data, components=2, oversampling=10, iterations=4, seed=COHORT_SEED):
+    """PCA aleatorizada das linhas de data (observações x variáveis).
+
+    Returns:
+        tupla (escores observações x componentes, fração da variância explicada por componente).
+    """
+    rng = np.random.default_rng(seed)
+    centered = (data - data.mean(axis=0)).astype(np.float32, copy=False)
+    rank = min(components + oversampling, *centered.shape)
+    # Base aproximada da imagem de centered, refinada por iterações de potência
+    basis, _ = np.linalg.qr(centered @ rng.standard_normal((centered.shape[1], rank), dtype=np.float32))
+    for _ in range(iterations):
+        basis, _ = np.linalg.qr(centered.T @ basis)
+        basis, _ = np.linalg.qr(centered @ basis)
+    left, singular, _ = np.linalg.svd(basis.T @ centered, full_matrices=False)
+    components = min(components, len(singular))
+    scores = (basis @ left[:, :components]) * singular[:components]
+    total = float(np.square(centered, dtype=np.float64).sum())
+    explained = np.square(singular[:components].astype(np.float64)) / total if total else np.zeros(components)
+    return scores.astype(np.float32), explained
+
+
+def sample_correlation(matrix):
+    """Correlação de Pearson entre as colunas (amostras), com um único produto matricial."""
+    standardized = standardize(matrix, axis=0)
+    return np.clip((standardized.T @ standardized) / matrix.shape[0], -1, 1)
+
+
+def minibatch_kmeans(data, clusters, batch=MINIBATCH_SIZE, iterations=MINIBATCH_ITERATIONS, seed=COHORT_SEED):
+    """K-means em mini-lotes (Sculley, 2010) sobre as linhas de data.
+
+    Returns:
+        tupla (rótulos das linhas, centroides).
+    """
+    rng = np.random.default_rng(seed)
+    clusters = max(1, min(clusters, len(data)))
+    if clusters > KMEANS_PLUSPLUS_CLUSTERS:
+        # Muitos grupos (subamostragem por centroides): linhas distintas ao acaso
+        centroids = data[rng.choice(len(data), size=clusters, replace=False)].astype(np.float32)
+    else:
+        # Inicialização k-means++ sobre uma amostra das linhas
+        sample = data[rng.choice(len(data), size=min(len(data), max(batch, 10 * clusters)), replace=False)]
+        centroids = [sample[rng.integers(len(sample))]]
+        distances = np.square(sample - centroids[0]).sum(axis=1, dtype=np.float64)
+        for _ in range(1, clusters):
+            total = distances.sum()
+            chosen = rng.choice(len(sample), p=distances / total) if total > 0 else rng.integers(len(sample))
+            centroids.append(sample[chosen])
+            distances = np.minimum(distances, np.square(sample - sample[chosen]).sum(axis=1, dtype=np.float64))
+        centroids = np.array(centroids, dtype=np.float32)
+
+    counts = np.zeros(clusters, dtype=np.float64)
+    for _ in range(iterations):
+        rows = data[rng.choice(len(data), size=min(batch, len(data)), replace=False)]
+        nearest = _nearest(rows, centroids)
+        for cluster in np.unique(nearest):
+            members = rows[nearest == cluster]
+            counts[cluster] += len(members)
+            # Taxa de aprendizado 1/n por centroide
+            centroids[cluster] += (members.sum(axis=0) - len(members) * centroids[cluster]) / counts[cluster]
+    return _nearest(data, centroids), centroids
+
+
+def _nearest(rows, centroids):
+    distances = (np.square(rows).sum(axis=1)[:, None] - 2 * rows @ centroids.T
+                 + np.square(centroids).sum(axis=1)[None, :])
+    return distances.argmin(axis=1)
+
+
+def subsample_proteins(matrix, top=COHORT_TOP_PROTEINS, mode=COHORT_SUBSAMPLE, seed=COHORT_SEED):
+    """Linhas usadas no agrupamento: as top de maior variância, ou os centroides de top grupos.
+
+    Returns:
+        tupla (linhas selecionadas, índices das linhas na matriz ou None para centroides,
+        tamanho do grupo de cada linha).
+    """
+    if top <= 0 or len(matrix) <= top:
+        return matrix, np.arange(len(matrix)), np.ones(len(matrix), dtype=np.int64)
+    if mode == "variance":
+        rows = np.sort(np.argpartition(matrix.var(axis=1), -top)[-top:])
+        return matrix[rows], rows, np.ones(top, dtype=np.int64)
+    if mode == "cluster":
+        labels, centroids = minibatch_kmeans(standardize(matrix), top, seed=seed)
+        sizes = np.bincount(labels, minlength=len(centroids))
+        return centroids[sizes > 0], None, sizes[sizes > 0]
+    raise ValueError(f"Subamostragem inválida: {mode}. Use 'variance' ou 'cluster'.")
+
+
+def _leaf_order(data):
+    """Ordem das linhas no agrupamento hierárquico (ligação média, distância de correlação)."""
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import pdist
+
+    if len(data) < 3:
+        return np.arange(len(data))
+    # Linhas constantes não têm correlação definida e ficam à distância 1 das demais
+    distances = np.nan_to_num(pdist(data.astype(np.float64), metric="correlation"), nan=1.0)
+    return leaves_list(linkage(distances, method="average"))
+
+
+def compute_view(view, matrix, conditions):
+    """Arrays de uma vista de coorte ("pca", "correlation", "heatmap" ou "kmeans")."""
+    if view == "pca":
+        scores, explained = randomized_pca(matrix.T)
+        return {"scores": scores, "explained": explained}
+    if view == "correlation":
+        correlation = sample_correlation(matrix)
+        return {"correlation": correlation, "order": _leaf_order(correlation)}
+    if view == "heatmap":
+        rows, selected, sizes = subsample_proteins(matrix)
+        rows = standardize(rows)
+        return {"values": rows, "rows": selected if selected is not None else np.zeros(0, dtype=np.int64),
+                "sizes": sizes, "row_order": _leaf_order(rows), "column_order": _leaf_order(rows.T)}
+    if view == "kmeans":
+        groups = list(dict.fromkeys(conditions))
+        profiles = np.stack([matrix[:, conditions == group].mean(axis=1) for group in groups], axis=1)
+        profiles = standardize(profiles)
+        labels, centroids = minibatch_kmeans(profiles, COHORT_CLUSTERS)
+        return {"profiles": profiles, "labels": labels, "centroids": centroids, "groups": np.asarray(groups)}
+    raise ValueError(f"Vista de coorte inválida: {view}. Vistas válidas: {', '.join(VIEWS)}")
+
+
+def cached_view(view, matrix, conditions, cachedir=None):
+    """Arrays de uma vista, lidos da memória ou de COHORT_CACHE_DIR quando já calculados."""
+    identity = hashlib.sha1(json.dumps([view, settings(), conditions.tolist()]).encode("utf-8"))
+    identity.update(np.ascontiguousarray(matrix).tobytes())
+    key = f"{view}-{identity.hexdigest()[:24]}"
+    if key in _computed:
+        _computed.move_to_end(key)
+        return _computed[key]
+
+    path = os.path.join(cachedir or COHORT_CACHE_DIR, f"{key}.npz")
+    try:
+        with np.load(path, allow_pickle=False) as stored:
+            arrays = {name: stored[name] for name in stored.files}
+        os.utime(path)
+    except (OSError, ValueError, zipfile.BadZipFile):
+        arrays = compute_view(view, matrix, conditions)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            descriptor, partial = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".npz")
+            with os.fdopen(descriptor, "wb") as target:
+                np.savez(target, **arrays)
+            os.replace(partial, path)
+            evict_views(os.path.dirname(path), keep=os.path.basename(path))
+        except OSError as error:
+            logging.warning(f"Não foi possível gravar a vista {view} no cache de coorte: {error}")
+    _computed[key] = arrays
+    while len(_computed) > COMPUTED_VIEWS:
+        _computed.popitem(last=False)
+    return arrays
+
+
+def evict_views(cachedir=None, max_size_mb=None, keep=None):
+    """Remove os arrays usados há mais tempo até o cache de coorte caber no limite de tamanho."""
+    cachedir = cachedir or COHORT_CACHE_DIR
+    limit = (COHORT_CACHE_SIZE_MB if max_size_mb is None else max_size_mb) * 1024 * 1024
+    entries = []
+    for name in os.listdir(cachedir):
+        path = os.path.join(cachedir, name)
+        if name.endswith(".npz") and not name.startswith("."):
+            entries.append((os.path.getmtime(path), os.path.getsize(path), name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= limit:
+            break
+        if name != keep:
+            os.remove(os.path.join(cachedir, name))
+            total -= size
+
+
+def _condition_colors(conditions):
+    groups = list(dict.fromkeys(conditions))
+    palette = plt.get_cmap("tab10")
+    return {group: palette(position % 10) for position, group in enumerate(groups)}
+
+
+def _save(figure, save, name, dpi):
+    written = []
+    for image_format in COHORT_FORMATS:
+        image_format = image_format.strip().lower()
+        path = f"{save}{name}.{image_format}"
+        figure.savefig(path, format=image_format, dpi=dpi, bbox_inches="tight")
+        written.append(path)
+    plt.close(figure)
+    return written
+
+
+def plot_pca(arrays, samples, conditions, save, dpi):
+    colors = _condition_colors(conditions)
+    figure, axis = plt.subplots(figsize=(6, 5))
+    scores, explained = arrays["scores"], arrays["explained"]
+    second = scores[:, 1] if scores.shape[1] > 1 else np.zeros(len(scores))
+    for group, color in colors.items():
+        members = conditions == group
+        axis.scatter(scores[members, 0], second[members], s=18, color=color, label=group, edgecolors="none")
+    axis.set_xlabel(f"PC1 ({explained[0] * 100:.1f}%)")
+    axis.set_ylabel(f"PC2 ({explained[1] * 100:.1f}%)" if len(explained) > 1 else "PC2")
+    axis.legend(frameon=False, fontsize=8)
+    return _save(figure, save, "PCA", dpi)
+
+
+def plot_correlation(arrays, samples, conditions, save, dpi):
+    order = arrays["order"]
+    correlation = arrays["correlation"][np.ix_(order, order)]
+    size = min(4 + len(samples) * 0.06, 30)
+    figure, axis = plt.subplots(figsize=(size, size))
+    image = axis.imshow(correlation, cmap="RdBu_r", vmin=-1, vmax=1, interpolation="nearest")
+    labels = samples[order] if len(samples) <= 100 else []
+    axis.set_xticks(range(len(labels)), labels, rotation=90, fontsize=5)
+    axis.set_yticks(range(len(labels)), labels, fontsize=5)
+    figure.colorbar(image, ax=axis, fraction=0.04, label="Pearson")
+    return _save(figure, save, "correlation", dpi)
+
+
+def plot_heatmap(arrays, samples, conditions, save, dpi):
+    values = arrays["values"][np.ix_(arrays["row_order"], arrays["column_order"])]
+    colors = _condition_colors(conditions)
+    figure, (band, axis) = plt.subplots(2, 1, figsize=(min(6 + len(samples) * 0.05, 30), 10),
+                                        gridspec_kw={"height_ratios": [1, 40], "hspace": 0.02})
+    band.imshow([[colors[group] for group in conditions[arrays["column_order"]]]], aspect="auto")
+    band.set_axis_off()
+    image = axis.imshow(values, cmap="RdBu_r", vmin=-3, vmax=3, aspect="auto", interpolation="nearest")
+    axis.set_yticks([])
+    labels = samples[arrays["column_order"]] if len(samples) <= 100 else []
+    axis.set_xticks(range(len(labels)), labels, rotation=90, fontsize=5)
+    axis.set_ylabel(f"{len(values)} proteínas" if len(arrays["rows"]) else f"{len(values)} grupos de proteínas")
+    figure.colorbar(image, ax=axis, fraction=0.03, label="z-score")
+    band.legend(handles=[plt.Rectangle((0, 0), 1, 1, color=color) for color in colors.values()],
+                labels=list(colors), ncol=min(len(colors), 6), loc="lower center", bbox_to_anchor=(0.5, 1),
+                frameon=False, fontsize=7)
+    return _save(figure, save, "heatmap", dpi)
+
+
+def plot_kmeans(arrays, samples, conditions, save, dpi, seed=COHORT_SEED):
+    profiles, labels, centroids = arrays["profiles"], arrays["labels"], arrays["centroids"]
+    groups = arrays["groups"]
+    columns = min(3, len(centroids))
+    lines = -(-len(centroids) // columns)
+    figure, axes = plt.subplots(lines, columns, figsize=(4 * columns, 3 * lines), squeeze=False, sharey=True)
+    rng = np.random.default_rng(seed)
+    for cluster, axis in enumerate(axes.ravel()):
+        if cluster >= len(centroids):
+            axis.set_axis_off()
+            continue
+        members = np.flatnonzero(labels == cluster)
+        # No máximo 200 perfis desenhados por grupo
+        drawn = members if len(members) <= 200 else rng.choice(members, 200, replace=False)
+        axis.plot(profiles[drawn].T, color="lightgrey", linewidth=0.5, rasterized=True)
+        axis.plot(centroids[cluster], color="#4d4dff", linewidth=2)
+        axis.set_title(f"Cluster {cluster + 1} ({len(members)} proteínas)", fontsize=9)
+        axis.set_xticks(range(len(groups)), groups, rotation=45, fontsize=7)
+    return _save(figure, save, "k_trend", dpi)
+
+
+PLOTTERS = {"pca": plot_pca, "correlation": plot_correlation, "heatmap": plot_heatmap, "kmeans": plot_kmeans}
+
+
+def plot_view(view, rawfiledata, save, dpi=300):
+    """Calcula (ou lê do cache) uma vista de coorte e grava o gráfico com o prefixo save."""
+    matrix, samples, conditions = cohort_matrix(rawfiledata)
+    logging.info(f"Vista de coorte {view}: {matrix.shape[0]} proteínas x {matrix.shape[1]} amostras (float32)")
+    return PLOTTERS[view](cached_view(view, matrix, conditions), samples, conditions, save, dpi)
@@ -0,0 +1,176 @@
+"""Análise de vários contrastes (condição x controle ou todos os pares) em paralelo.
+
+O OmicScope calcula as DEPs de um único grupo controle. Aqui a matriz de
+abundâncias do objeto OmicScope é gravada uma única vez em um arquivo .npy,
+mapeado em memória (somente leitura) por todos os processos do pool, e cada
+processo calcula as DEPs de um contraste com um teste t de Welch vetorizado
+sobre o log2 das abundâncias, com correção de Benjamini-Hochberg. O log2(fc)
+é a razão entre as médias das abundâncias das duas condições, como no
+OmicScope. As tabelas, o volcano plot e o enriquecimento de cada contraste
+são gerados no próprio processo por uma função recebida do chamador.
+
+Esse teste não é o do OmicScope (que usa, com mais de duas condições, ANOVA e
+teste post hoc): os p-valores e as DEPs de um contraste não são comparáveis
+aos da tabela DEPs principal, mesmo para o par controle x condição. O método
+é registrado na coluna "Statistical_test" de cada tabela de contraste.
+"""
+import itertools
+import logging
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib import pyplot as plt
+from scipy import stats
+
+from enrichment import benjamini_hochberg
+from instrumentation import add_records, drain_records, metrics_config, start_worker_metrics
+
+
+CONTRAST_MODES = ("control", "pairwise")
+
+MATRIX_FILE = "expression.npy"
+
+# Teste estatístico dos contrastes, registrado em cada tabela
+CONTRAST_TEST = "Welch t-test (log2) + Benjamini-Hochberg"
+
+
+def contrast_pairs(conditions, control, mode="control"):
+    """Lista os contrastes (condição, referência).
+
+    mode "control" compara cada condição com o controle; "pairwise" compara
+    todos os pares de condições, usando como referência a que aparece primeiro
+    (o controle sempre é a referência).
+    """
+    if mode not in CONTRAST_MODES:
+        raise ValueError(f"Modo de contrastes inválido: {mode}. Use 'control' ou 'pairwise'.")
+    conditions = [str(condition) for condition in conditions]
+    control = str(control)
+    if mode == "control":
+        return [(condition, control) for condition in conditions if condition != control]
+    ordered = [control] + [condition for condition in conditions if condition != control]
+    return [(case, reference) for reference, case in itertools.combinations(ordered, 2)]
+
+
+def contrast_name(case, reference):
+    """Nome da pasta de um contraste, ex: "T1_vs_CTRL"."""
+    return re.sub(r"[^\w.-]+", "_", f"{case}_vs_{reference}").strip("_")
+
+
+def expression_matrix(rawfiledata):
+    """Abundâncias do OmicScope (proteínas x amostras) e a condição de cada amostra.
+
+    Usa assay (abundâncias com as amostras de pdata nas colunas) e rdata (descrição
+    das proteínas, alinhada às linhas de assay).
+
+    Returns:
+        tupla (matriz, condições das colunas, rdata).
+    """
+    pdata = rawfiledata.pdata
+    assay = rawfiledata.assay
+    samples = [sample for sample in pdata['Sample'] if sample in assay.columns]
+    conditions = pdata.drop_duplicates('Sample').set_index('Sample').loc[samples, 'Condition'].astype(str).tolist()
+    return assay[samples].to_numpy(dtype=np.float64), conditions, rawfiledata.rdata.reset_index(drop=True)
+
+
+def welch_statistics(case, reference):
+    """log2(fc), p-valor e p-valor ajustado de todas as proteínas de uma vez.
+
+    Args:
+        case, reference: abundâncias (proteínas x amostras) das duas condições.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log2fc = np.log2(np.nanmean(case, axis=1) / np.nanmean(reference, axis=1))
+        case = np.log2(np.where(case > 0, case, np.nan))
+        reference = np.log2(np.where(reference > 0, reference, np.nan))
+        n1, n2 = np.sum(~np.isnan(case), axis=1), np.sum(~np.isnan(reference), axis=1)
+        v1, v2 = np.nanvar(case, axis=1, ddof=1) / n1, np.nanvar(reference, axis=1, ddof=1) / n2
+        t = (np.nanmean(case, axis=1) - np.nanmean(reference, axis=1)) / np.sqrt(v1 + v2)
+        dof = (v1 + v2) ** 2 / (v1 ** 2 / (n1 - 1) + v2 ** 2 / (n2 - 1))
+        pvalues = 2 * stats.t.sf(np.abs(t), dof)
+    tested = np.isfinite(pvalues)
+    adjusted = np.full(len(pvalues), np.nan)
+    adjusted[tested] = benjamini_hochberg(pvalues[tested])
+    return log2fc, pvalues, adjusted
+
+
+def contrast_table(rdata, matrix, conditions, case, reference):
+    """Tabela de DEPs de um contraste, com as colunas usadas pelas tabelas e pelo volcano plot."""
+    conditions = np.asarray(conditions)
+    log2fc, pvalues, adjusted = welch_statistics(matrix[:, conditions == case], matrix[:, conditions == reference])
+    table = rdata.copy()
+    table['log2(fc)'] = log2fc
+    table['pvalue'] = pvalues
+    table['pAdjusted'] = adjusted
+    table['-log10(pAdjusted)'] = -np.log10(adjusted)
+    table['Statistical_test'] = CONTRAST_TEST
+    return table[np.isfinite(log2fc) & np.isfinite(adjusted)].reset_index(drop=True)
+
+
+_worker_state = {}
+
+
+def _init_contrast_worker(analyze, context, matrixpath, conditions, rdata, metrics=None):
+    plt.switch_backend("Agg")
+    start_worker_metrics(metrics)
+    # Todos os processos leem a mesma matriz pelo cache de páginas, sem cópias
+    _worker_state.update(analyze=analyze, context=context, matrix=np.load(matrixpath, mmap_mode='r'),
+                         conditions=conditions, rdata=rdata)
+
+
+def _analyze_contrast(analyze, context, matrix, conditions, rdata, contrast):
+    """Analisa um contraste e retorna (contraste, resultado, erro ou None, duração em segundos)."""
+    started = time.perf_counter()
+    try:
+        result = analyze(context, *contrast, contrast_table(rdata, matrix, conditions, *contrast))
+        error = None
+    except Exception as analyze_error:
+        result, error = None, f"{type(analyze_error).__name__}: {analyze_error}"
+    finally:
+        plt.close("all")
+    return contrast, result, error, time.perf_counter() - started
+
+
+def _contrast_in_worker(contrast):
+    state = _worker_state
+    return (_analyze_contrast(state["analyze"], state["context"], state["matrix"], state["conditions"],
+                              state["rdata"], contrast), drain_records())
+
+
+def run_contrasts(analyze, context, rawfiledata, contrasts, workers=1):
+    """Analisa todos os contrastes.
+
+    Args:
+        analyze: função de nível de módulo analyze(context, condição, referência, tabela de DEPs)
+            que escreve as saídas de um contraste e retorna um resultado serializável.
+        context: dados compartilhados por todos os contrastes.
+        contrasts: lista de tuplas (condição, referência), ver contrast_pairs.
+        workers: número de processos. Com workers <= 1 os contrastes são analisados no
+            processo atual, um após o outro.
+
+    Returns:
+        lista de tuplas (contraste, resultado, erro ou None, duração), na ordem de contrasts.
+    """
+    message = (f"Contrastes calculados com {CONTRAST_TEST}, não com a estatística do OmicScope: "
+               f"os p-valores e as DEPs dos contrastes não são comparáveis aos da tabela DEPs principal.")
+    print(message)
+    logging.warning(message)
+    matrix, conditions, rdata = expression_matrix(rawfiledata)
+    if workers <= 1 or len(contrasts) <= 1:
+        return [_analyze_contrast(analyze, context, matrix, conditions, rdata, contrast) for contrast in contrasts]
+
+    with tempfile.TemporaryDirectory(prefix="proteoanalyzer-contrasts-") as workdir:
+        matrixpath = os.path.join(workdir, MATRIX_FILE)
+        np.save(matrixpath, matrix)
+        del matrix
+        with ProcessPoolExecutor(max_workers=min(workers, len(contrasts)), initializer=_init_contrast_worker,
+                                 initargs=(analyze, context, matrixpath, conditions, rdata,
+                                           metrics_config())) as pool:
+            results = []
+            for result, records in pool.map(_contrast_in_worker, contrasts):
+                add_records(records)
+                results.append(result)
+            return results
@@ -0,0 +1,313 @@
+"""Cache em disco dos conjuntos de dados já analisados pelo OmicScope.
+
+A leitura de um arquivo de proteômica pelo OmicScope refaz a importação,
+a normalização, a imputação e a estatística a cada execução. Este cache guarda
+o estado do objeto resultante (quant_data, deps, Params, Conditions e as demais
+tabelas usadas pelos gráficos) em formato binário, com as tabelas em Parquet e
+os arrays em .npy, indexado pelo hash do conteúdo do arquivo de entrada, pelo
+método e pelo grupo controle. Ao
+reanalisar o mesmo arquivo, com outro cutoff de FC ou outras proteínas
+apontadas, o objeto é reconstruído diretamente do cache.
+
+O cache tem tamanho máximo (PROTEOANALYZER_DATASET_CACHE_SIZE_MB); ao excedê-lo, as
+entradas usadas há mais tempo são removidas primeiro.
+
+Uso: python dataset_cache.py [--clear]
+"""
+import hashlib
+import importlib.metadata
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+
+CACHE_VERSION = 2
+
+DATASET_CACHE_DIR = os.environ.get("PROTEOANALYZER_DATASET_CACHE_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".cache", "proteoanalyzer", "datasets"))
+
+DATASET_CACHE_SIZE_MB = float(os.environ.get("PROTEOANALYZER_DATASET_CACHE_SIZE_MB", "2048"))
+
+STATE_FILE = "state.json"
+FRAMES_DIR = "frames"
+
+# Entradas da versão 1 do cache (objeto inteiro em pickle): não são lidas, apenas removidas pela política LRU
+LEGACY_STATE_FILE = "state.pkl"
+
+# Atributos que todo conjunto de dados gravado no cache deve ter
+REQUIRED_ATTRIBUTES = ("quant_data", "deps", "Params", "Conditions")
+META_FILE = "meta.json"
+SOURCES_FILE = "sources.json"
+
+
+def _sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_json(filepath, default):
+    try:
+        with open(filepath, encoding="utf-8") as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_json(filepath, content):
+    descriptor, partial = tempfile.mkstemp(dir=os.path.dirname(filepath), prefix=".", suffix=".json")
+    with os.fdopen(descriptor, "w", encoding="utf-8") as target:
+        json.dump(content, target, ensure_ascii=False, indent=2)
+    os.replace(partial, filepath)
+
+
+def file_digest(filepath, cachedir=None):
+    """Hash SHA-256 do conteúdo do arquivo.
+
+    O hash fica registrado no cache junto com o tamanho e o mtime do arquivo e só
+    é recalculado quando algum deles muda.
+    """
+    cachedir = cachedir or DATASET_CACHE_DIR
+    filepath = os.path.abspath(filepath)
+    stat = os.stat(filepath)
+    sources_path = os.path.join(cachedir, SOURCES_FILE)
+    sources = _read_json(sources_path, {})
+    known = sources.get(filepath)
+    if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+        return known["sha256"]
+
+    digest = _sha256(filepath)
+    sources[filepath] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+    try:
+        os.makedirs(cachedir, exist_ok=True)
+        _write_json(sources_path, sources)
+    except OSError as error:
+        logging.warning(f"Não foi possível registrar o hash de {filepath} no cache: {error}")
+    return digest
+
+
+def _package_version(name):
+    """Versão instalada de um pacote, lida dos metadados (sem importá-lo)."""
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return ""
+
+
+def dataset_key(digest, method, control, pdata_digest=None):
+    """Chave do cache: conteúdo do arquivo (e da pdata), método, grupo controle e versões do OmicScope/pandas.
+
+    As versões vêm dos metadados dos pacotes: calcular a chave (ex: na impressão
+    digital dos checkpoints) não importa o OmicScope nem o pandas.
+    """
+    identity = "|".join([str(CACHE_VERSION), digest, str(method), str(control), pdata_digest or "",
+                         _package_version("omicscope"), _package_version("pandas")])
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()[:24]
+
+
+def _encode_attributes(data, directory):
+    """Grava os atributos do objeto OmicScope em directory e retorna a descrição do estado.
+
+    Tabelas (DataFrame/Series) são gravadas em Parquet e arrays em .npy; valores
+    simples (listas, dicionários, números, textos) vão para o próprio estado.
+    Levanta ValueError se algum atributo não puder ser gravado: uma entrada
+    parcial reconstruiria um objeto sem atributos que os gráficos e o
+    enriquecimento podem usar.
+    """
+    import numpy as np
+    import pandas as pd
+
+    missing = [name for name in REQUIRED_ATTRIBUTES if name not in vars(data)]
+    if missing:
+        raise ValueError(f"Atributos ausentes no conjunto de dados: {', '.join(missing)}")
+    state = {"frames": [], "series": [], "arrays": [], "values": {}}
+    skipped = []
+    os.makedirs(os.path.join(directory, FRAMES_DIR))
+    for name, value in vars(data).items():
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            # O Parquet exige nomes de coluna em texto (uma Series sem nome teria a coluna 0)
+            frame = value.to_frame(name=str(value.name if value.name is not None else name)) \
+                if isinstance(value, pd.Series) else value
+            frame.to_parquet(os.path.join(directory, FRAMES_DIR, f"{name}.parquet"), index=True)
+            state["series" if isinstance(value, pd.Series) else "frames"].append(name)
+        elif isinstance(value, np.ndarray) and value.dtype != object:
+            np.save(os.path.join(directory, FRAMES_DIR, f"{name}.npy"), value, allow_pickle=False)
+            state["arrays"].append(name)
+        else:
+            if isinstance(value, np.generic):
+                value = value.item()
+            try:
+                json.dumps(value)
+            except (TypeError, ValueError):
+                skipped.append(f"{name} ({type(value).__name__})")
+                continue
+            state["values"][name] = value
+
+    if skipped:
+        raise ValueError(f"Atributos do conjunto de dados que não podem ser gravados: {', '.join(skipped)}")
+    return state
+
+
+def _decode_attributes(state, directory):
+    """Reconstrói os atributos gravados por _encode_attributes."""
+    import numpy as np
+    import pandas as pd
+
+    attributes = dict(state["values"])
+    for name in state["frames"]:
+        attributes[name] = pd.read_parquet(os.path.join(directory, FRAMES_DIR, f"{name}.parquet"))
+    for name in state["series"]:
+        attributes[name] = pd.read_parquet(os.path.join(directory, FRAMES_DIR, f"{name}.parquet")).iloc[:, 0]
+    for name in state["arrays"]:
+        attributes[name] = np.load(os.path.join(directory, FRAMES_DIR, f"{name}.npy"), allow_pickle=False)
+    return attributes
+
+
+def load_dataset(key, cachedir=None):
+    """Reconstrói o objeto OmicScope de uma entrada do cache, ou retorna None se ela não existir."""
+    from omicscope.General.Omicscope import Omicscope
+
+    entry = os.path.join(cachedir or DATASET_CACHE_DIR, key)
+    state_path = os.path.join(entry, STATE_FILE)
+    state = _read_json(state_path, None)
+    if state is None:
+        return None
+    try:
+        attributes = _decode_attributes(state, entry)
+    except Exception as error:
+        logging.warning(f"Entrada do cache de dados corrompida, descartada: {entry} ({error})")
+        shutil.rmtree(entry, ignore_errors=True)
+        return None
+
+    # O mtime do estado marca o último uso da entrada (política LRU)
+    try:
+        os.utime(state_path)
+    except OSError:
+        pass
+    data = Omicscope.__new__(Omicscope)
+    data.__dict__.update(attributes)
+    return data
+
+
+def store_dataset(key, data, description=None, cachedir=None, max_size_mb=None):
+    """Grava o estado do objeto OmicScope no cache e aplica o limite de tamanho.
+
+    description: dicionário com a origem da entrada (arquivo, método, controle), gravado em meta.json.
+    """
+    cachedir = cachedir or DATASET_CACHE_DIR
+    os.makedirs(cachedir, exist_ok=True)
+    entry = os.path.join(cachedir, key)
+    if not os.path.exists(entry):
+        building = tempfile.mkdtemp(dir=cachedir, prefix=f".{key}-")
+        try:
+            state = _encode_attributes(data, building)
+            _write_json(os.path.join(building, META_FILE),
+                        dict(description or {}, version=CACHE_VERSION, conditions=list(data.Conditions)))
+            # O estado é gravado por último: uma entrada sem state.json está incompleta
+            _write_json(os.path.join(building, STATE_FILE), state)
+        except Exception:
+            shutil.rmtree(building, ignore_errors=True)
+            raise
+        try:
+            os.rename(building, entry)
+        except OSError:
+            # Outro processo publicou a mesma entrada primeiro
+            shutil.rmtree(building, ignore_errors=True)
+    evict_datasets(cachedir, max_size_mb, keep=key)
+    return entry
+
+
+def _entry_size(entry):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(entry) for name in names)
+
+
+def cached_entries(cachedir=None):
+    """Lista as entradas do cache como tuplas (chave, tamanho em bytes, último uso), da mais antiga à mais recente."""
+    cachedir = cachedir or DATASET_CACHE_DIR
+    if not os.path.isdir(cachedir):
+        return []
+    entries = []
+    for key in os.listdir(cachedir):
+        entry = os.path.join(cachedir, key)
+        state_path = os.path.join(entry, STATE_FILE)
+        if not os.path.isfile(state_path):
+            state_path = os.path.join(entry, LEGACY_STATE_FILE)
+        if key.startswith(".") or not os.path.isfile(state_path):
+            continue
+        try:
+            entries.append((key, _entry_size(entry), os.path.getmtime(state_path)))
+        except OSError:
+            continue
+    return sorted(entries, key=lambda item: item[2])
+
+
+def evict_datasets(cachedir=None, max_size_mb=None, keep=None):
+    """Remove as entradas usadas há mais tempo até o cache caber no limite de tamanho."""
+    cachedir = cachedir or DATASET_CACHE_DIR
+    limit = (DATASET_CACHE_SIZE_MB if max_size_mb is None else max_size_mb) * 1024 * 1024
+    entries = cached_entries(cachedir)
+    total = sum(size for _, size, _ in entries)
+    for key, size, _ in entries:
+        if total <= limit:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(os.path.join(cachedir, key), ignore_errors=True)
+        total -= size
+        logging.info(f"Entrada {key} removida do cache de dados (limite de {limit / 1024 / 1024:.0f} MB).")
+
+
+def clear_dataset_cache(cachedir=None):
+    """Remove todas as entradas do cache de dados."""
+    cachedir = cachedir or DATASET_CACHE_DIR
+    if os.path.isdir(cachedir):
+        shutil.rmtree(cachedir)
+
+
+def read_cached_dataset(rawfilepath, method, control, build, cachedir=None, pdata=None):
+    """Retorna o objeto OmicScope do cache ou o constrói com build() e o armazena.
+
+    pdata: arquivo de fenótipo usado na leitura (MaxQuant, DIA-NN), que também
+    faz parte da chave do cache.
+
+    Falhas do cache (disco cheio, permissões, pyarrow ausente, atributos que
+    não podem ser gravados) não interrompem a análise: o objeto é construído
+    normalmente e apenas um aviso é registrado.
+
+    Returns:
+        tupla (objeto OmicScope, True se veio do cache).
+    """
+    try:
+        key = dataset_key(file_digest(rawfilepath, cachedir), method, control,
+                          file_digest(pdata, cachedir) if pdata else None)
+        data = load_dataset(key, cachedir)
+    except OSError as error:
+        logging.warning(f"Cache de dados indisponível: {error}")
+        return build(), False
+    if data is not None:
+        return data, True
+
+    data = build()
+    try:
+        store_dataset(key, data, {"source": os.path.abspath(rawfilepath), "method": method, "control": control,
+                                  "pdata": os.path.abspath(pdata) if pdata else None}, cachedir)
+    except Exception as error:
+        logging.warning(f"Não foi possível gravar o conjunto de dados no cache: {error}")
+    return data, False
+
+
+if __name__ == "__main__":
+    if "--clear" in sys.argv[1:]:
+        clear_dataset_cache()
+        print(f"Cache de dados removido: {DATASET_CACHE_DIR}")
+    else:
+        entries = cached_entries()
+        for key, size, _ in entries:
+            meta = _read_json(os.path.join(DATASET_CACHE_DIR, key, META_FILE), {})
+            print(f"{key}  {size / 1024 / 1024:8.1f} MB  {meta.get('method')}  {meta.get('control')}  {meta.get('source')}")
+        print(f"{len(entries)} entrada(s) em {DATASET_CACHE_DIR}")
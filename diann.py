@@ -0,0 +1,106 @@
+"""Pré-carregamento em blocos dos relatórios longos (report.tsv) do DIA-NN.
+
+O relatório do DIA-NN tem uma linha por precursor e corrida e chega a vários
+GB, enquanto a análise usa apenas a quantificação de cada grupo de proteínas em
+cada corrida (PG.MaxLFQ, que se repete em todos os precursores do grupo). Este
+módulo lê o relatório em blocos, mantendo só as colunas necessárias com tipos
+compactos (float32 e categorias para corridas e identificadores), agrega cada
+bloco a proteína x corrida e combina os agregados de forma incremental. O
+resultado é gravado como um relatório com uma linha por proteína e corrida,
+lido normalmente pelo OmicScope.
+
+O tamanho dos blocos é calculado a partir do orçamento de memória
+(PROTEOANALYZER_DIANN_MEMORY_MB), de modo que o pico de memória depende do
+orçamento e do número de proteínas x corridas, e não do tamanho do arquivo.
+"""
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Relatórios a partir deste tamanho são pré-carregados em blocos
+DIANN_STREAMING_MB = float(os.environ.get("PROTEOANALYZER_DIANN_STREAMING_MB", "512"))
+
+DIANN_MEMORY_MB = float(os.environ.get("PROTEOANALYZER_DIANN_MEMORY_MB", "1024"))
+
+KEY_COLUMNS = ["Protein.Group", "Run"]
+QUANTITY_COLUMN = "PG.MaxLFQ"
+# Descrição da proteína e um precursor representativo (primeiro valor do grupo)
+TEXT_COLUMNS = ["Protein.Ids", "Protein.Names", "Genes", "First.Protein.Description", "Precursor.Id"]
+# Um grupo é mantido em uma corrida se algum de seus precursores passar no filtro de q-valor
+QVALUE_COLUMNS = ["Q.Value", "PG.Q.Value", "Global.Q.Value", "Global.PG.Q.Value", "Lib.Q.Value", "Lib.PG.Q.Value"]
+
+SAMPLE_ROWS = 10000
+MIN_CHUNK_ROWS = 1000
+# Memória transitória do leitor de CSV em relação ao bloco já convertido
+PARSER_OVERHEAD = 4
+
+
+def _chunk_rows(reportpath, usecols, dtypes, memory_mb):
+    """Número de linhas por bloco que cabe em metade do orçamento, estimado por uma amostra."""
+    sample = pd.read_csv(reportpath, sep="\t", usecols=usecols, dtype=dtypes, nrows=SAMPLE_ROWS)
+    if sample.empty:
+        return MIN_CHUNK_ROWS
+    row_bytes = sample.memory_usage(deep=True).sum() / len(sample) * PARSER_OVERHEAD
+    return max(MIN_CHUNK_ROWS, int(memory_mb * 1024 * 1024 / 2 / row_bytes))
+
+
+def _combine(parts, aggregation, text_columns):
+    combined = pd.concat(parts).groupby(level=[0, 1], observed=True, sort=False).agg(aggregation)
+    combined[text_columns] = combined[text_columns].astype("category")
+    return combined
+
+
+def compact_diann_report(reportpath, targetpath, memory_mb=None):
+    """Agrega um relatório longo do DIA-NN a uma linha por grupo de proteínas e corrida.
+
+    Args:
+        reportpath: report.tsv do DIA-NN.
+        targetpath: relatório compacto gravado (mesmas colunas, separado por tabulação).
+        memory_mb: orçamento de memória da leitura. Padrão: DIANN_MEMORY_MB.
+
+    Returns:
+        targetpath, ou None se o relatório estiver vazio ou não tiver as colunas
+        Protein.Group, Run e PG.MaxLFQ (nesse caso ele deve ser lido diretamente).
+    """
+    memory_mb = memory_mb or DIANN_MEMORY_MB
+    header = list(pd.read_csv(reportpath, sep="\t", nrows=0).columns)
+    missing = [column for column in KEY_COLUMNS + [QUANTITY_COLUMN] if column not in header]
+    if missing:
+        logging.warning(f"Relatório do DIA-NN sem as colunas {missing}; o arquivo será lido sem agregação prévia.")
+        return None
+
+    text_columns = [column for column in TEXT_COLUMNS if column in header]
+    qvalue_columns = [column for column in QVALUE_COLUMNS if column in header]
+    usecols = [column for column in header
+               if column in KEY_COLUMNS + [QUANTITY_COLUMN] + text_columns + qvalue_columns]
+    dtypes = {column: "category" for column in KEY_COLUMNS + text_columns}
+    dtypes.update({column: np.float32 for column in [QUANTITY_COLUMN] + qvalue_columns})
+    aggregation = {QUANTITY_COLUMN: "max", **{column: "first" for column in text_columns},
+                   **{column: "min" for column in qvalue_columns}}
+
+    chunk_rows = _chunk_rows(reportpath, usecols, dtypes, memory_mb)
+    # Agregados parciais são combinados quando passam de um quarto do orçamento
+    pending_limit = memory_mb * 1024 * 1024 / 4
+    compact, pending, pending_bytes, rows = None, [], 0, 0
+    for chunk in pd.read_csv(reportpath, sep="\t", usecols=usecols, dtype=dtypes, chunksize=chunk_rows):
+        rows += len(chunk)
+        part = chunk.groupby(KEY_COLUMNS, observed=True, sort=False).agg(aggregation)
+        pending.append(part)
+        pending_bytes += part.memory_usage(deep=True).sum()
+        if pending_bytes > pending_limit:
+            compact = _combine(([compact] if compact is not None else []) + pending, aggregation, text_columns)
+            pending, pending_bytes = [], 0
+    if not rows:
+        return None
+    if pending:
+        compact = _combine(([compact] if compact is not None else []) + pending, aggregation, text_columns)
+
+    compact = compact.reset_index()[usecols]
+    compact.to_csv(targetpath, sep="\t", index=False)
+    logging.info(f"Relatório do DIA-NN agregado em blocos de {chunk_rows} linhas: {rows} precursores -> "
+                 f"{len(compact)} linhas proteína x corrida ({compact['Protein.Group'].nunique()} grupos, "
+                 f"{compact['Run'].nunique()} corridas).")
+    return targetpath
@@ -0,0 +1,271 @@
+"""Análise de sobre-representação (ORA) nativa sobre as bibliotecas da pasta data/.
+
+Reproduz o teste hipergeométrico e a correção de Benjamini-Hochberg do
+enriquecimento do OmicScope/gseapy, mas calcula as sobreposições de todos os
+termos de todas as bibliotecas com um único produto matriz esparsa x vetor.
+"""
+import numpy as np
+import pandas as pd
+from scipy.stats import hypergeom
+
+from symbols import canonical_symbol
+
+
+ORA_COLUMNS = ['Gene_set', 'Term', 'Overlap', 'P-value', 'Adjusted P-value',
+               'Odds Ratio', 'Combined Score', 'Genes']
+
+
+class EnrichmentResult:
+    """Resultado de enriquecimento compatível com a visualização do OmicScope.
+
+    Expõe os mesmos atributos que o objeto EnrichmentScope usa para plotagem
+    (results, dbs, Analysis), de modo que plot_enrichment_data funcione sem
+    alterações.
+    """
+
+    def __init__(self, results, dbs, analysis='ORA', omicscope=None, padjust_cutoff=0.05):
+        self.results = results
+        self.dbs = list(dbs)
+        self.Analysis = analysis
+        self.OmicScope = omicscope
+        self.padjust_cutoff = padjust_cutoff
+
+    def dotplot(self, *args, **kwargs):
+        from omicscope.EnrichmentAnalysis.EnrichmentVisualization import dotplot
+        return dotplot(self, *args, **kwargs)
+
+
+def benjamini_hochberg(pvalues):
+    """Correção de Benjamini-Hochberg (FDR) vetorizada."""
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    n = len(pvalues)
+    if n == 0:
+        return pvalues.copy()
+    order = np.argsort(pvalues, kind='mergesort')
+    ranked = pvalues[order] * n / np.arange(1, n + 1)
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    adjusted = np.empty(n, dtype=np.float64)
+    adjusted[order] = np.minimum(ranked, 1)
+    return adjusted
+
+
+def hypergeometric_sf(overlap, background, term_size, query_size):
+    """P(X >= overlap) da distribuição hipergeométrica, vetorizado sobre todos os termos.
+
+    Parte da pmf em X = overlap e soma a cauda pela razão entre termos
+    consecutivos, avançando apenas os termos cuja cauda ainda contribui.
+    Abaixo da média a cauda superior é próxima de 1 e a pmf em X = overlap
+    pode ser nula (fora do suporte ou underflow); esses termos usam o sf do scipy.
+    """
+    x = np.asarray(overlap, dtype=np.float64)
+    total_genes = np.asarray(background, dtype=np.float64)
+    successes = np.asarray(term_size, dtype=np.float64)
+    draws = np.asarray(query_size, dtype=np.float64)
+    sf = np.ones_like(x)
+    tested = np.flatnonzero(x >= 1)
+    if len(tested) == 0:
+        return sf
+
+    lower_tail = successes[tested] * draws[tested] >= x[tested] * total_genes[tested]
+    below = tested[lower_tail]
+    sf[below] = hypergeom.sf(x[below] - 1, total_genes[below], successes[below], draws[below])
+    tested = tested[~lower_tail]
+    if len(tested) == 0:
+        return sf
+
+    x, total_genes, successes, draws = x[tested], total_genes[tested], successes[tested], draws[tested]
+    upper = np.minimum(successes, draws)
+    first = np.exp(hypergeom.logpmf(x, total_genes, successes, draws))
+    current = np.ones_like(x)
+    tail = np.ones_like(x)
+    i = x.copy()
+    active = np.flatnonzero(i < upper)
+    while len(active):
+        ia = i[active]
+        ratio = ((successes[active] - ia) * (draws[active] - ia)) / \
+                ((ia + 1) * (total_genes[active] - successes[active] - draws[active] + ia + 1))
+        current[active] *= ratio
+        tail[active] += current[active]
+        i[active] += 1
+        keep = (i[active] < upper[active]) & ((ratio >= 1) | (current[active] > tail[active] * 1e-17))
+        active = active[keep]
+    sf[tested] = np.minimum(first * tail, 1)
+    return sf
+
+
+def query_from_omicscope(rawfiledata):
+    """Obtém os genes regulados e seus log2(fc) com os mesmos critérios do ORA do OmicScope."""
+    omics = rawfiledata.quant_data
+    fc_cutoff = rawfiledata.FoldChange_cutoff
+    omics = omics.loc[(omics['log2(fc)'] <= -fc_cutoff) | (omics['log2(fc)'] >= fc_cutoff)]
+    genes = list(omics[omics[rawfiledata.pvalue] <= rawfiledata.PValue_cutoff]['gene_name'].dropna())
+    foldchange = dict(zip(omics.gene_name.str.upper(), omics['log2(fc)']))
+    return genes, foldchange
+
+
+def overlap_statistics(libraries, query):
+    """Calcula sobreposição e p-valor hipergeométrico de todos os termos de uma vez.
+
+    Args:
+        libraries: GeneSetLibraries carregado por load_gene_set_libraries.
+        query: vetor indicador dos genes consultados (GeneSetLibraries.query_vector).
+
+    Returns:
+        dicionário de arrays alinhados aos termos: overlap, term_size, query_size,
+        background, pvalue, odds_ratio.
+    """
+    # Uma única multiplicação esparsa conta a sobreposição de todos os termos
+    overlap = libraries.membership @ query
+    return term_statistics(libraries, overlap, libraries.library_membership @ query)
+
+
+def term_statistics(libraries, overlap, library_hits):
+    """Estatísticas de overlap_statistics a partir das contagens já calculadas.
+
+    Args:
+        overlap: genes consultados presentes em cada termo.
+        library_hits: genes consultados presentes em cada biblioteca.
+    """
+    # Genes consultados presentes em cada biblioteca e tamanho do background de cada uma
+    query_size = np.asarray(library_hits)[libraries.term_library]
+    background = libraries.library_sizes[libraries.term_library]
+    term_size = libraries.term_sizes
+
+    pvalue = hypergeometric_sf(overlap, background, term_size, query_size)
+    # Razão de chances da tabela 2x2 com correção de Haldane-Anscombe, como no gseapy
+    odds_ratio = ((overlap + 0.5) * (background - term_size - query_size + overlap + 0.5)) / \
+                 ((term_size - overlap + 0.5) * (query_size - overlap + 0.5))
+    return {'overlap': overlap.astype(np.int64),
+            'term_size': term_size.astype(np.int64),
+            'query_size': query_size.astype(np.int64),
+            'background': background.astype(np.int64),
+            'pvalue': pvalue,
+            'odds_ratio': odds_ratio}
+
+
+def _hit_genes(libraries, rows, query, names):
+    """Lista, em ordem alfabética, os genes consultados presentes em cada termo selecionado."""
+    hits = libraries.membership[rows].multiply(query).tocsr()
+    hits.eliminate_zeros()
+    return [sorted(names.get(g, g) for g in libraries.genes[hits.indices[hits.indptr[i]:hits.indptr[i + 1]]])
+            for i in range(len(rows))]
+
+
+def format_ora_results(libraries, statistics, query, foldchange, genes, padjust_cutoff=0.05):
+    """Monta uma tabela de resultados por biblioteca no mesmo formato do EnrichmentScope."""
+    # Genes da matriz (símbolo oficial) -> grafia usada na consulta
+    names = {canonical_symbol(g, libraries.aliases): g for g in genes}
+    tables = {}
+    for library_number, db in enumerate(libraries.dbs):
+        rows = np.flatnonzero((libraries.term_library == library_number) & (statistics['overlap'] >= 1))
+        adjusted = benjamini_hochberg(statistics['pvalue'][rows])
+        keep = adjusted <= padjust_cutoff
+        selected = rows[keep]
+
+        df = pd.DataFrame({
+            'Gene_set': db,
+            'Term': libraries.terms[selected],
+            'Overlap': [f"{x}/{m}" for x, m in zip(statistics['overlap'][selected],
+                                                    statistics['term_size'][selected])],
+            'P-value': statistics['pvalue'][selected],
+            'Adjusted P-value': adjusted[keep],
+            'Odds Ratio': statistics['odds_ratio'][selected],
+            'Combined Score': -np.log(statistics['pvalue'][selected]) * statistics['odds_ratio'][selected],
+            'Genes': _hit_genes(libraries, selected, query, names),
+        }, columns=ORA_COLUMNS, index=np.flatnonzero(keep))
+
+        # p-valores ajustados iguais a zero são substituídos pelo menor valor não nulo
+        nonzero = df.loc[df['Adjusted P-value'] != 0, 'Adjusted P-value']
+        if len(nonzero):
+            df['Adjusted P-value'] = df['Adjusted P-value'].replace(0, nonzero.min())
+
+        df['-log10(pAdj)'] = -np.log10(df['Adjusted P-value'])
+        df['N_Proteins'] = df['Genes'].apply(len)
+        df['regulation'] = df['Genes'].apply(lambda x: [foldchange[i.upper()] for i in x])
+        df['down-regulated'] = df['regulation'].apply(lambda x: len([i for i in x if i < 0]))
+        df['up-regulated'] = df['regulation'].apply(lambda x: len([i for i in x if i > 0]))
+        df = df.sort_values(['Adjusted P-value', 'Combined Score'], ascending=[True, False], kind='mergesort')
+        tables[db] = df.reset_index(drop=True)
+    return tables
+
+
+def query_sweep_from_omicscope(rawfiledata, log2fc_cutoffs):
+    """Consultas do ORA para vários cutoffs de log2(fc), com o p-valor de query_from_omicscope.
+
+    Um gene entra na consulta de um cutoff se |log2(fc)| > cutoff (critério
+    estrito, o mesmo das tabelas "DEPs filtradas" da varredura, ver run_fc_sweep).
+    O |log2(fc)| de cada gene (o maior entre suas proteínas significativas) é
+    ordenado uma única vez e a consulta de cada cutoff é obtida por busca binária.
+    Como as consultas são aninhadas, todas são prefixos de uma mesma lista.
+
+    Returns:
+        tupla (genes em ordem decrescente de |log2(fc)|, número de genes da consulta
+        de cada cutoff, dicionário gene (maiúsculo) -> log2(fc)).
+    """
+    omics = rawfiledata.quant_data
+    significant = omics[(omics[rawfiledata.pvalue] <= rawfiledata.PValue_cutoff) & omics['gene_name'].notna()]
+    strength = significant['log2(fc)'].abs().groupby(significant['gene_name']).max().sort_values(kind='mergesort')
+    ascending = strength.to_numpy()
+    counts = [len(ascending) - int(np.searchsorted(ascending, cutoff, side='right')) for cutoff in log2fc_cutoffs]
+    foldchange = dict(zip(omics.gene_name.str.upper(), omics['log2(fc)']))
+    return list(strength.index[::-1]), counts, foldchange
+
+
+def _column_counts(matrix, columns):
+    """Soma as colunas indicadas de uma matriz binária CSC, retornando a contagem por linha."""
+    if not len(columns):
+        return np.zeros(matrix.shape[0], dtype=np.int64)
+    rows = np.concatenate([matrix.indices[matrix.indptr[c]:matrix.indptr[c + 1]] for c in columns])
+    return np.bincount(rows, minlength=matrix.shape[0])
+
+
+def ora_sweep(libraries, genes, counts, foldchange, padjust_cutoff=0.05):
+    """Executa o ORA de consultas aninhadas: genes[:count] para cada count.
+
+    As sobreposições não são recalculadas do zero: partindo da menor consulta,
+    cada uma soma às contagens da anterior apenas as colunas dos genes que ela
+    acrescenta.
+
+    Returns:
+        lista, na ordem de counts, de dicionários banco -> DataFrame (como ora_enrichment).
+    """
+    membership = libraries.membership.tocsc()
+    library_membership = libraries.library_membership.tocsc()
+    query = np.zeros(len(libraries.genes), dtype=np.float64)
+    overlap = np.zeros(len(libraries.terms), dtype=np.int64)
+    library_hits = np.zeros(len(libraries.dbs), dtype=np.int64)
+
+    results = [None] * len(counts)
+    previous = 0
+    for position in np.argsort(counts, kind='stable'):
+        count = counts[position]
+        added = libraries.query_vector(genes[previous:count])
+        # Símbolos repetidos (maiúsculas/minúsculas) já presentes na consulta não são contados de novo
+        added[query > 0] = 0
+        columns = np.flatnonzero(added)
+        overlap += _column_counts(membership, columns)
+        library_hits += _column_counts(library_membership, columns)
+        query += added
+        previous = max(previous, count)
+
+        statistics = term_statistics(libraries, overlap.astype(np.float64), library_hits)
+        results[position] = format_ora_results(libraries, statistics, query, foldchange, genes[:count],
+                                               padjust_cutoff)
+    return results
+
+
+def ora_enrichment(libraries, genes, foldchange, padjust_cutoff=0.05):
+    """Executa o ORA de uma lista de genes contra todas as bibliotecas carregadas.
+
+    Args:
+        libraries: GeneSetLibraries com os bancos a serem testados.
+        genes: lista de genes regulados (consulta).
+        foldchange: dicionário gene (maiúsculo) -> log2(fc).
+        padjust_cutoff: corte do p-valor ajustado. Padrão 0.05.
+
+    Returns:
+        dicionário banco -> DataFrame de resultados.
+    """
+    query = libraries.query_vector(genes)
+    statistics = overlap_statistics(libraries, query)
+    return format_ora_results(libraries, statistics, query, foldchange, genes, padjust_cutoff)
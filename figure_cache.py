@@ -0,0 +1,288 @@
+"""Cache em disco dos gráficos já renderizados.
+
+Um gráfico do OmicScope é determinado pelo conjunto de dados (impressão
+digital de dataset_fingerprint), pelo tipo de gráfico e pelos parâmetros da
+renderização (proteínas apontadas, paleta, dpi, cutoffs e formatos). Este cache
+guarda os arquivos gerados para cada combinação e, ao receber o mesmo pedido
+(em outra execução, em um projeto refeito com overwrite ou no serviço local),
+copia-os para a pasta plots/ em vez de renderizá-los novamente; heatmaps,
+correlação e K-means são os que mais se beneficiam.
+
+Os arquivos são guardados sem o prefixo do projeto (titlename), que é
+reaplicado na cópia. Com PROTEOANALYZER_FIGURE_CACHE_LINK=1 os gráficos são
+ligados por hard link em vez de copiados (mesmo sistema de arquivos).
+
+O cache tem tamanho máximo (PROTEOANALYZER_FIGURE_CACHE_SIZE_MB); ao excedê-lo, as
+entradas usadas há mais tempo são removidas primeiro.
+
+Uso: python figure_cache.py [--clear] [--dataset CHAVE] [--plot TIPO]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+
+FIGURE_CACHE_VERSION = 1
+
+FIGURE_CACHE_DIR = os.environ.get("PROTEOANALYZER_FIGURE_CACHE_DIR",
+                                  os.path.join(os.path.expanduser("~"), ".cache", "proteoanalyzer", "figures"))
+
+FIGURE_CACHE_SIZE_MB = float(os.environ.get("PROTEOANALYZER_FIGURE_CACHE_SIZE_MB", "1024"))
+
+FIGURE_CACHE_LINK = os.environ.get("PROTEOANALYZER_FIGURE_CACHE_LINK", "0") == "1"
+
+META_FILE = "meta.json"
+FILES_DIR = "files"
+
+
+def _read_json(filepath, default):
+    try:
+        with open(filepath, encoding="utf-8") as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_json(filepath, content):
+    descriptor, partial = tempfile.mkstemp(dir=os.path.dirname(filepath), prefix=".", suffix=".json")
+    with os.fdopen(descriptor, "w", encoding="utf-8") as target:
+        json.dump(content, target, ensure_ascii=False, indent=2)
+    os.replace(partial, filepath)
+
+
+def figure_key(dataset, plot, parameters):
+    """Chave do cache: conjunto de dados, tipo de gráfico, parâmetros e versão do matplotlib."""
+    import matplotlib
+
+    identity = json.dumps([FIGURE_CACHE_VERSION, dataset, plot, parameters, matplotlib.__version__],
+                          sort_keys=True, default=str)
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()[:24]
+
+
+def _entry_files(directory):
+    """Arquivos de uma pasta, como caminhos relativos a ela."""
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            files.append(os.path.relpath(os.path.join(root, name), directory))
+    return sorted(files)
+
+
+def _publish(source, target, link=False):
+    """Copia (ou liga) source em target, substituindo target de forma atômica."""
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    descriptor, partial = tempfile.mkstemp(dir=os.path.dirname(target) or ".", prefix=".")
+    os.close(descriptor)
+    try:
+        if link:
+            try:
+                os.remove(partial)
+                os.link(source, partial)
+            except OSError:
+                shutil.copyfile(source, partial)
+        else:
+            shutil.copyfile(source, partial)
+        os.replace(partial, target)
+    except OSError:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+def render_files(plotsdir, name, draw):
+    """Gera um gráfico com draw(save) em uma pasta temporária e move os arquivos para plotsdir.
+
+    Uma renderização interrompida não deixa arquivos incompletos em plotsdir, e
+    os arquivos gerados são conhecidos mesmo quando o nome é escolhido pelo OmicScope.
+
+    Returns:
+        caminhos gerados em plotsdir.
+    """
+    rendering = tempfile.mkdtemp(dir=plotsdir, prefix=".render-")
+    try:
+        draw(os.path.join(rendering, name))
+        written = []
+        for filename in _entry_files(rendering):
+            target = os.path.join(plotsdir, filename)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(os.path.join(rendering, filename), target)
+            written.append(target)
+    finally:
+        shutil.rmtree(rendering, ignore_errors=True)
+    return written
+
+
+class FigureCache:
+    """Cache de figuras de um conjunto de dados.
+
+    Atributos:
+        dataset: impressão digital do conjunto de dados (ver dataset_fingerprint); com None
+            os gráficos são sempre renderizados.
+    """
+
+    def __init__(self, dataset, cachedir=None, max_size_mb=None, link=None):
+        self.dataset = dataset
+        self.cachedir = cachedir or FIGURE_CACHE_DIR
+        self.max_size_mb = max_size_mb
+        self.link = FIGURE_CACHE_LINK if link is None else link
+
+    def restore(self, key, plotsdir, name):
+        """Copia os arquivos de uma entrada para plotsdir, com o prefixo name. Retorna os caminhos, ou None."""
+        entry = os.path.join(self.cachedir, key)
+        meta_path = os.path.join(entry, META_FILE)
+        meta = _read_json(meta_path, None)
+        if meta is None:
+            return None
+        written = []
+        try:
+            for filename in meta["files"]:
+                target = os.path.join(plotsdir, name + filename)
+                _publish(os.path.join(entry, FILES_DIR, filename), target, self.link)
+                written.append(target)
+            # O mtime de meta.json marca o último uso da entrada (política LRU)
+            os.utime(meta_path)
+        except (OSError, KeyError) as error:
+            logging.warning(f"Entrada do cache de figuras indisponível, o gráfico será refeito: {entry} ({error})")
+            return None
+        return written
+
+    def store(self, key, plot, parameters, directory):
+        """Publica no cache os arquivos renderizados em directory e aplica o limite de tamanho."""
+        entry = os.path.join(self.cachedir, key)
+        if not os.path.exists(entry):
+            building = tempfile.mkdtemp(dir=self.cachedir, prefix=f".{key}-")
+            try:
+                os.rename(directory, os.path.join(building, FILES_DIR))
+                _write_json(os.path.join(building, META_FILE),
+                            {"version": FIGURE_CACHE_VERSION, "dataset": self.dataset, "plot": plot,
+                             "parameters": parameters, "files": _entry_files(os.path.join(building, FILES_DIR))})
+                os.rename(building, entry)
+            except OSError:
+                # Outro processo publicou a mesma entrada primeiro
+                shutil.rmtree(building, ignore_errors=True)
+        evict_figures(self.cachedir, self.max_size_mb, keep=key)
+
+    def render(self, plot, plotsdir, name, draw, **parameters):
+        """Gera um gráfico em plotsdir com draw(save), reaproveitando a renderização em cache.
+
+        draw recebe o prefixo dos arquivos (pasta e name), como o parâmetro save do
+        OmicScope; os parâmetros identificam a renderização (proteínas, paleta, dpi...).
+
+        Returns:
+            tupla (caminhos gerados em plotsdir, True se vieram do cache).
+        """
+        if self.dataset is None:
+            return render_files(plotsdir, name, draw), False
+        key = figure_key(self.dataset, plot, parameters)
+        written = self.restore(key, plotsdir, name)
+        if written is not None:
+            print(f"Gráfico {plot} reaproveitado do cache de figuras.")
+            logging.info(f"Gráfico {plot} reaproveitado do cache de figuras ({key}).")
+            return written, True
+
+        try:
+            os.makedirs(self.cachedir, exist_ok=True)
+            rendering = tempfile.mkdtemp(dir=self.cachedir, prefix=f".{key}-render-")
+        except OSError as error:
+            logging.warning(f"Cache de figuras indisponível: {error}")
+            return render_files(plotsdir, name, draw), False
+        try:
+            draw(os.path.join(rendering, name))
+            # Os arquivos são guardados sem o prefixo do projeto
+            for filename in _entry_files(rendering):
+                if filename.startswith(name) and filename != name:
+                    os.rename(os.path.join(rendering, filename), os.path.join(rendering, filename[len(name):]))
+            written = [os.path.join(plotsdir, name + filename) for filename in _entry_files(rendering)]
+            for filename, target in zip(_entry_files(rendering), written):
+                _publish(os.path.join(rendering, filename), target)
+            try:
+                self.store(key, plot, parameters, rendering)
+            except OSError as error:
+                logging.warning(f"Não foi possível gravar o gráfico {plot} no cache de figuras: {error}")
+        finally:
+            shutil.rmtree(rendering, ignore_errors=True)
+        return written, False
+
+
+def _entry_size(entry):
+    return sum(os.path.getsize(os.path.join(entry, filename)) for filename in _entry_files(entry))
+
+
+def cached_figures(cachedir=None):
+    """Lista as entradas do cache como tuplas (chave, tamanho em bytes, último uso), da mais antiga à mais recente."""
+    cachedir = cachedir or FIGURE_CACHE_DIR
+    if not os.path.isdir(cachedir):
+        return []
+    entries = []
+    for key in os.listdir(cachedir):
+        entry = os.path.join(cachedir, key)
+        meta_path = os.path.join(entry, META_FILE)
+        if key.startswith(".") or not os.path.isfile(meta_path):
+            continue
+        try:
+            entries.append((key, _entry_size(entry), os.path.getmtime(meta_path)))
+        except OSError:
+            continue
+    return sorted(entries, key=lambda item: item[2])
+
+
+def evict_figures(cachedir=None, max_size_mb=None, keep=None):
+    """Remove as entradas usadas há mais tempo até o cache caber no limite de tamanho."""
+    cachedir = cachedir or FIGURE_CACHE_DIR
+    limit = (FIGURE_CACHE_SIZE_MB if max_size_mb is None else max_size_mb) * 1024 * 1024
+    entries = cached_figures(cachedir)
+    total = sum(size for _, size, _ in entries)
+    for key, size, _ in entries:
+        if total <= limit:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(os.path.join(cachedir, key), ignore_errors=True)
+        total -= size
+        logging.info(f"Entrada {key} removida do cache de figuras (limite de {limit / 1024 / 1024:.0f} MB).")
+
+
+def clear_figure_cache(cachedir=None, dataset=None, plot=None):
+    """Remove as entradas do cache de figuras: todas, ou apenas as de um conjunto de dados e/ou tipo de gráfico.
+
+    Returns:
+        número de entradas removidas.
+    """
+    cachedir = cachedir or FIGURE_CACHE_DIR
+    removed = 0
+    for key, _, _ in cached_figures(cachedir):
+        meta = _read_json(os.path.join(cachedir, key, META_FILE), {})
+        if dataset is not None and meta.get("dataset") != dataset:
+            continue
+        if plot is not None and meta.get("plot") != plot:
+            continue
+        shutil.rmtree(os.path.join(cachedir, key), ignore_errors=True)
+        removed += 1
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lista ou invalida o cache de figuras do Proteoanalyzer.")
+    parser.add_argument("--clear", action="store_true", help="Remove as entradas (todas, ou as filtradas abaixo).")
+    parser.add_argument("--dataset", default=None, help="Apenas as entradas deste conjunto de dados (chave).")
+    parser.add_argument("--plot", default=None, help="Apenas as entradas deste tipo de gráfico (ex: heatmap).")
+    args = parser.parse_args()
+
+    if args.clear:
+        removed = clear_figure_cache(dataset=args.dataset, plot=args.plot)
+        print(f"{removed} entrada(s) removida(s) do cache de figuras: {FIGURE_CACHE_DIR}")
+    else:
+        entries = cached_figures()
+        shown = 0
+        for key, size, _ in entries:
+            meta = _read_json(os.path.join(FIGURE_CACHE_DIR, key, META_FILE), {})
+            if args.dataset not in (None, meta.get("dataset")) or args.plot not in (None, meta.get("plot")):
+                continue
+            shown += 1
+            print(f"{key}  {size / 1024 / 1024:8.1f} MB  {meta.get('dataset')}  {meta.get('plot')}  "
+                  f"{json.dumps(meta.get('parameters'), ensure_ascii=False)}")
+        print(f"{shown} entrada(s) em {FIGURE_CACHE_DIR}")
@@ -0,0 +1,273 @@
+"""Enriquecimento preranked (GSEA) sobre as bibliotecas da pasta data/.
+
+As proteínas são ordenadas pelo log2(fc) e, para cada termo, a soma corrente
+ponderada do GSEA (peso |log2(fc)|, p = 1) é avaliada apenas nas posições dos
+genes do termo: o máximo da soma ocorre logo após um acerto e o mínimo logo
+antes de um. Assim, os escores de enriquecimento (ES) de todos os termos são
+calculados de uma vez com somas acumuladas e reduções por segmento sobre a
+matriz esparsa termo x posição no ranking.
+
+A distribuição nula é obtida por permutação dos genes (conjuntos aleatórios do
+mesmo tamanho), em lotes vetorizados de permutações. Os lotes têm tamanho fixo e
+sementes derivadas de uma semente única, de modo que o resultado não depende do
+número de processos usados.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from enrichment import ORA_COLUMNS
+
+
+GSEA_COLUMNS = ['ES', 'NES']
+
+# Permutações por tarefa do pool (fixo, para que o resultado independa do número de processos)
+PERMUTATION_CHUNK = 100
+
+# Permutações avaliadas juntas em uma única ordenação vetorizada
+PERMUTATION_BATCH = 20
+
+MIN_SIZE = 15
+MAX_SIZE = 500
+
+
+def ranking_from_omicscope(rawfiledata):
+    """Ranking dos genes por log2(fc), do mais positivo ao mais negativo.
+
+    Usa todas as proteínas quantificadas (quant_data); genes com várias proteínas
+    ficam com o log2(fc) de maior valor absoluto.
+
+    Returns:
+        tupla (genes, log2(fc) em ordem decrescente, dicionário gene (maiúsculo) -> log2(fc)).
+    """
+    omics = rawfiledata.quant_data
+    omics = omics[omics['gene_name'].notna() & omics['log2(fc)'].notna()]
+    strongest = omics['log2(fc)'].abs().groupby(omics['gene_name'].str.strip().str.upper()).idxmax()
+    ranked = omics.loc[strongest.to_numpy()].sort_values('log2(fc)', ascending=False, kind='mergesort')
+    foldchange = dict(zip(omics.gene_name.str.upper(), omics['log2(fc)']))
+    return list(ranked['gene_name']), ranked['log2(fc)'].to_numpy(dtype=np.float64), foldchange
+
+
+def ranked_hits(libraries, genes, min_size=MIN_SIZE, max_size=MAX_SIZE):
+    """Posições no ranking dos genes de cada termo.
+
+    Returns:
+        tupla (termos mantidos, linha de cada acerto, posição de cada acerto), com os
+        acertos ordenados por termo e posição. São mantidos os termos com
+        min_size a max_size genes presentes no ranking.
+    """
+    columns, positions, seen = [], [], set()
+    for position, gene in enumerate(genes):
+        column = libraries.gene_column(gene)
+        # Um símbolo antigo e o oficial no mesmo ranking ocupam a mesma coluna: vale a melhor posição
+        if column is not None and column not in seen:
+            seen.add(column)
+            columns.append(column)
+            positions.append(position)
+    ranked = libraries.membership[:, columns].tocsr()
+    sizes = np.diff(ranked.indptr)
+    terms = np.flatnonzero((sizes >= min_size) & (sizes <= max_size))
+    ranked = ranked[terms]
+    ranked.sort_indices()
+    rows = np.repeat(np.arange(len(terms)), np.diff(ranked.indptr))
+    # As colunas seguem a ordem do ranking, de modo que índices ordenados são posições ordenadas
+    return terms, rows, np.asarray(positions, dtype=np.int64)[ranked.indices]
+
+
+def enrichment_scores(rows, positions, weights, n_rows, n_genes):
+    """ES de todos os conjuntos de uma vez.
+
+    Args:
+        rows: conjunto de cada acerto (todos os conjuntos com ao menos um acerto).
+        positions: posição de cada acerto no ranking, ordenados por (conjunto, posição).
+        weights: |métrica| de cada posição do ranking.
+
+    Returns:
+        tupla (ES de cada conjunto, índice do acerto em que a soma atinge o ES; para ES
+        negativos, o primeiro acerto após o mínimo).
+    """
+    counts = np.bincount(rows, minlength=n_rows)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    hit_weights = weights[positions]
+    totals = np.bincount(rows, weights=hit_weights, minlength=n_rows)
+    totals = np.where(totals > 0, totals, 1)
+    misses = np.maximum(n_genes - counts, 1)
+
+    cumulative = np.cumsum(hit_weights)
+    before_start = np.where(starts > 0, cumulative[starts - 1], 0)
+    within = cumulative - before_start[rows]
+    hit_number = np.arange(len(rows)) - starts[rows] + 1
+    # Soma corrente logo após cada acerto e logo antes dele
+    after = within / totals[rows] - (positions + 1 - hit_number) / misses[rows]
+    before = (within - hit_weights) / totals[rows] - (positions - hit_number + 1) / misses[rows]
+
+    maximum = np.maximum.reduceat(after, starts)
+    minimum = np.minimum.reduceat(before, starts)
+    positive = maximum >= -minimum
+    scores = np.where(positive, maximum, minimum)
+
+    index = np.arange(len(rows))
+    at_maximum = np.minimum.reduceat(np.where(after == maximum[rows], index, len(rows)), starts)
+    at_minimum = np.minimum.reduceat(np.where(before == minimum[rows], index, len(rows)), starts)
+    return scores, np.where(positive, at_maximum, at_minimum)
+
+
+_worker_state = {}
+
+
+def _init_permutation_worker(rows, positions, weights, n_rows):
+    _worker_state.update(rows=rows, positions=positions, weights=weights, n_rows=n_rows)
+
+
+def permutation_scores(rows, positions, weights, n_rows, permutations, seed):
+    """ES de conjuntos aleatórios do mesmo tamanho de cada termo, para um lote de permutações.
+
+    Returns:
+        matriz n_rows x permutations.
+    """
+    rng = np.random.default_rng(seed)
+    n_genes = len(weights)
+    nulls = np.empty((n_rows, permutations), dtype=np.float64)
+    for start in range(0, permutations, PERMUTATION_BATCH):
+        size = min(PERMUTATION_BATCH, permutations - start)
+        # Cada permutação vira um bloco de n_rows conjuntos, avaliados em uma única chamada
+        shuffled = np.stack([rng.permutation(n_genes) for _ in range(size)])[:, positions].ravel()
+        batch_rows = (rows[None, :] + (np.arange(size) * n_rows)[:, None]).ravel()
+        order = np.lexsort((shuffled, batch_rows))
+        scores, _ = enrichment_scores(batch_rows[order], shuffled[order], weights, n_rows * size, n_genes)
+        nulls[:, start:start + size] = scores.reshape(size, n_rows).T
+    return nulls
+
+
+def _permutations_in_worker(permutations, seed):
+    state = _worker_state
+    return permutation_scores(state["rows"], state["positions"], state["weights"], state["n_rows"],
+                              permutations, seed)
+
+
+def null_distribution(rows, positions, weights, n_rows, permutations=1000, seed=42, workers=1):
+    """Distribuição nula de todos os termos, em tarefas de PERMUTATION_CHUNK permutações.
+
+    Com workers > 1 as tarefas são executadas em um pool de processos. Cada tarefa
+    tem sua própria semente, derivada de seed, e o resultado é o mesmo para
+    qualquer número de processos.
+    """
+    chunks = [min(PERMUTATION_CHUNK, permutations - start) for start in range(0, permutations, PERMUTATION_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    if workers <= 1 or len(chunks) <= 1:
+        parts = [permutation_scores(rows, positions, weights, n_rows, size, chunk_seed)
+                 for size, chunk_seed in zip(chunks, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_permutation_worker,
+                                 initargs=(rows, positions, weights, n_rows)) as pool:
+            parts = list(pool.map(_permutations_in_worker, chunks, seeds))
+    return np.hstack(parts) if parts else np.empty((n_rows, 0))
+
+
+def gsea_statistics(scores, nulls):
+    """NES, p-valor nominal e FDR (q) de cada termo, como no GSEA.
+
+    O ES é normalizado pela média dos ES nulos de mesmo sinal do próprio termo. O
+    FDR compara, para cada NES, a fração de NES nulos (de todos os termos) e a
+    fração de NES observados tão ou mais extremos, com o mesmo sinal.
+    """
+    positive = scores >= 0
+    null_positive = nulls >= 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        positive_mean = np.where(null_positive, nulls, 0).sum(axis=1) / null_positive.sum(axis=1)
+        negative_mean = -np.where(~null_positive, nulls, 0).sum(axis=1) / (~null_positive).sum(axis=1)
+        nes = np.where(positive, scores / positive_mean, scores / negative_mean)
+        null_nes = np.where(null_positive, nulls / positive_mean[:, None], nulls / negative_mean[:, None])
+
+        as_extreme = np.where(positive[:, None], null_positive & (nulls >= scores[:, None]),
+                              ~null_positive & (nulls <= scores[:, None]))
+        same_sign = np.where(positive[:, None], null_positive, ~null_positive).sum(axis=1)
+        pvalues = np.where(same_sign > 0, as_extreme.sum(axis=1) / same_sign, 1.0)
+
+    nes = np.nan_to_num(nes, nan=0.0, posinf=0.0, neginf=0.0)
+    null_nes = null_nes[np.isfinite(null_nes)]
+    fdr = np.ones_like(nes)
+    for sign in (1, -1):
+        observed = np.sort(nes[(nes >= 0) if sign > 0 else (nes < 0)] * sign)
+        null = np.sort(null_nes[(null_nes >= 0) if sign > 0 else (null_nes < 0)] * sign)
+        selected = np.flatnonzero((nes >= 0) if sign > 0 else (nes < 0))
+        if not len(selected) or not len(null):
+            continue
+        values = nes[selected] * sign
+        null_fraction = (len(null) - np.searchsorted(null, values, side='left')) / len(null)
+        observed_fraction = (len(observed) - np.searchsorted(observed, values, side='left')) / len(observed)
+        fdr[selected] = np.minimum(null_fraction / observed_fraction, 1)
+    return nes, pvalues, fdr
+
+
+def format_gsea_results(libraries, terms, rows, positions, scores, extremes, nes, pvalues, fdr, genes,
+                        foldchange, padjust_cutoff=0.05, permutations=1000):
+    """Monta uma tabela por biblioteca com as colunas do ORA (ORA_COLUMNS), mais ES e NES.
+
+    Assim as tabelas e o dotplot seguem o mesmo caminho do ORA: "Adjusted P-value"
+    recebe o FDR, "Combined Score" recebe o NES, "Genes" e "Overlap" descrevem o
+    leading edge (genes até o pico da soma corrente) e "Odds Ratio" fica vazio.
+    FDR iguais a zero estão abaixo da resolução das permutações e são
+    reportados como 1 / permutations.
+    """
+    fdr = np.where(fdr > 0, fdr, 1 / max(permutations, 1))
+    genes = np.asarray(genes, dtype=object)
+    starts = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(terms)))[:-1]])
+    ends = np.append(starts[1:], len(rows))
+    leading = [positions[start:extreme + 1] if score >= 0 else positions[extreme:end]
+               for start, end, extreme, score in zip(starts, ends, extremes, scores)]
+
+    tables = {}
+    for library_number, db in enumerate(libraries.dbs):
+        selected = np.flatnonzero((libraries.term_library[terms] == library_number) & (fdr <= padjust_cutoff))
+        df = pd.DataFrame({
+            'Gene_set': db,
+            'Term': libraries.terms[terms[selected]],
+            'Overlap': [f"{len(leading[i])}/{ends[i] - starts[i]}" for i in selected],
+            'P-value': pvalues[selected],
+            'Adjusted P-value': fdr[selected],
+            'Odds Ratio': np.nan,
+            'Combined Score': nes[selected],
+            'Genes': [sorted(genes[leading[i]]) for i in selected],
+            'ES': scores[selected],
+            'NES': nes[selected],
+        }, columns=ORA_COLUMNS + GSEA_COLUMNS)
+
+        df['-log10(pAdj)'] = -np.log10(df['Adjusted P-value'])
+        df['N_Proteins'] = df['Genes'].apply(len)
+        df['regulation'] = df['Genes'].apply(lambda x: [foldchange[i.upper()] for i in x])
+        df['down-regulated'] = df['regulation'].apply(lambda x: len([i for i in x if i < 0]))
+        df['up-regulated'] = df['regulation'].apply(lambda x: len([i for i in x if i > 0]))
+        df = df.sort_values(['Adjusted P-value', 'NES'], ascending=[True, False], kind='mergesort',
+                            key=lambda column: column.abs() if column.name == 'NES' else column)
+        tables[db] = df.reset_index(drop=True)
+    return tables
+
+
+def gsea_enrichment(libraries, genes, metric, foldchange, padjust_cutoff=0.05, permutations=1000, seed=42,
+                    workers=1, min_size=MIN_SIZE, max_size=MAX_SIZE):
+    """Executa o GSEA preranked de um ranking contra todas as bibliotecas carregadas.
+
+    Args:
+        libraries: GeneSetLibraries com os bancos a serem testados.
+        genes: genes em ordem decrescente de metric.
+        metric: métrica do ranking (log2(fc)), alinhada a genes.
+        foldchange: dicionário gene (maiúsculo) -> log2(fc).
+        permutations, seed: número de permutações da distribuição nula e semente.
+        workers: processos usados nas permutações.
+
+    Returns:
+        dicionário banco -> DataFrame de resultados.
+    """
+    terms, rows, positions = ranked_hits(libraries, genes, min_size, max_size)
+    weights = np.abs(np.asarray(metric, dtype=np.float64))
+    if not len(terms):
+        empty = np.empty(0)
+        return format_gsea_results(libraries, terms, rows, positions, empty, empty.astype(np.int64),
+                                   empty, empty, empty, genes, foldchange, padjust_cutoff, permutations)
+    scores, extremes = enrichment_scores(rows, positions, weights, len(terms), len(genes))
+    nulls = null_distribution(rows, positions, weights, len(terms), permutations, seed, workers)
+    nes, pvalues, fdr = gsea_statistics(scores, nulls)
+    return format_gsea_results(libraries, terms, rows, positions, scores, extremes, nes, pvalues, fdr,
+                               genes, foldchange, padjust_cutoff, permutations)
@@ -0,0 +1,250 @@
+"""Instrumentação das etapas da análise: tempo, memória e tamanho das entradas.
+
+Cada etapa instrumentada (decorador instrumented ou gerenciador de contexto
+stage) registra o tempo de parede, o tempo de CPU, o pico de memória
+residente (RSS) do processo e os tamanhos das entradas (proteínas, amostras,
+DEPs, termos). Os registros vão para o app.log e para o metrics.json do
+projeto, reescrito a cada etapa. As etapas escolhidas em
+PROTEOANALYZER_PROFILE (ex: "read_proteomics_file,plot_data[heatmap]") também
+são perfiladas com cProfile, com um .prof por execução em profiles/.
+
+A instrumentação só é ativada por start_metrics; fora dela as funções
+decoradas executam sem medição. Em pools de processos, os workers acumulam os
+registros em memória (start_worker_metrics) e os devolvem ao processo
+principal com drain_records/add_records.
+
+O pico de memória é o do processo inteiro: etapas executadas ao mesmo tempo
+(tabelas escritas em segundo plano, por exemplo) compartilham o mesmo pico.
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+METRICS_FILE = "metrics.json"
+PROFILES_DIR = "profiles"
+
+RSS_SAMPLING_INTERVAL = 0.005
+
+_state = {"active": False, "path": None, "directory": None, "profile": set(), "records": [],
+          "started": None, "clock": None}
+_lock = threading.Lock()
+
+
+def current_rss():
+    """Memória residente atual do processo, em bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    # Sem /proc (macOS): usa o pico do processo, em KB no Linux e em bytes no macOS
+    try:
+        import resource
+    except ImportError:
+        # Windows: sem resource, a memória não é medida
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakMemory:
+    """Acompanha o pico de RSS enquanto o bloco executa, amostrando em uma thread."""
+
+    def __init__(self, interval=RSS_SAMPLING_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+        return False
+
+
+def parse_profile_stages(profile):
+    """Normaliza as etapas a perfilar: aceita "etapa1,etapa2" ou uma lista."""
+    if not profile:
+        return set()
+    if isinstance(profile, str):
+        profile = profile.split(",")
+    return {str(name).strip() for name in profile if str(name).strip()}
+
+
+def start_metrics(directory, profile=None, persist=True):
+    """Ativa a instrumentação para um projeto.
+
+    Args:
+        directory: diretório do projeto; metrics.json e profiles/ são criados nele.
+        profile: etapas perfiladas com cProfile. Padrão: PROTEOANALYZER_PROFILE.
+        persist: grava metrics.json a cada etapa (False nos workers de pools de processos).
+    """
+    with _lock:
+        _state.update(active=True, directory=directory, records=[],
+                      path=os.path.join(directory, METRICS_FILE) if persist else None,
+                      profile=parse_profile_stages(profile if profile is not None
+                                                   else os.environ.get("PROTEOANALYZER_PROFILE")),
+                      started=datetime.now().isoformat(timespec="seconds"), clock=time.perf_counter())
+
+
+def stop_metrics():
+    """Grava o metrics.json final e desativa a instrumentação."""
+    write_metrics()
+    with _lock:
+        _state.update(active=False, path=None)
+
+
+def metrics_config():
+    """Configuração repassada aos workers de pools de processos (ou None se inativa)."""
+    if not _state["active"]:
+        return None
+    return {"directory": _state["directory"], "profile": sorted(_state["profile"])}
+
+
+def start_worker_metrics(config):
+    """Ativa a instrumentação em memória em um worker, a partir de metrics_config()."""
+    if config is not None:
+        start_metrics(config["directory"], config["profile"], persist=False)
+
+
+def drain_records():
+    """Retorna e descarta os registros acumulados (usado pelos workers)."""
+    with _lock:
+        records, _state["records"] = _state["records"], []
+    return records
+
+
+def add_records(records):
+    """Acrescenta registros vindos de workers e atualiza o metrics.json."""
+    if not records or not _state["active"]:
+        return
+    with _lock:
+        _state["records"].extend(records)
+    write_metrics()
+
+
+def write_metrics():
+    with _lock:
+        path = _state["path"]
+        if path is None:
+            return
+        content = {"started": _state["started"], "python": platform.python_version(),
+                   "machine": platform.platform(), "cpus": os.cpu_count(),
+                   "elapsed_s": round(time.perf_counter() - _state["clock"], 4),
+                   "stages": list(_state["records"])}
+    try:
+        descriptor, partial = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".json")
+        with os.fdopen(descriptor, "w", encoding="utf-8") as target:
+            json.dump(content, target, ensure_ascii=False, indent=2)
+        os.replace(partial, path)
+    except OSError as error:
+        logging.warning(f"Não foi possível gravar {path}: {error}")
+
+
+def _profile_path(name):
+    directory = os.path.join(_state["directory"], PROFILES_DIR)
+    os.makedirs(directory, exist_ok=True)
+    filename = re.sub(r"[^\w.-]+", "_", name).strip("_")
+    return os.path.join(directory, f"{filename}-{os.getpid()}-{time.time_ns()}.prof")
+
+
+_local = threading.local()
+
+
+@contextmanager
+def stage(name, **sizes):
+    """Mede um bloco como uma etapa. O registro é devolvido para que o bloco acrescente tamanhos
+    em record["sizes"] depois de conhecer o resultado."""
+    if not _state["active"]:
+        yield {"stage": name, "sizes": dict(sizes)}
+        return
+
+    record = {"stage": name, "sizes": dict(sizes), "error": None,
+              "started_at": datetime.now().isoformat(timespec="milliseconds"),
+              "pid": os.getpid(), "thread": threading.current_thread().name}
+    # Etapas executadas dentro de outras (ex: tabela escrita pelo enriquecimento) são marcadas
+    depth = getattr(_local, "depth", 0)
+    if depth:
+        record["nested"] = True
+    _local.depth = depth + 1
+    profiler = None
+    if name in _state["profile"] or name.split("[")[0] in _state["profile"]:
+        profiler = cProfile.Profile()
+    memory = PeakMemory()
+    memory.__enter__()
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    except BaseException as error:
+        record["error"] = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record["wall_s"] = round(time.perf_counter() - wall_started, 4)
+        record["cpu_s"] = round(time.process_time() - cpu_started, 4)
+        memory.__exit__(None, None, None)
+        record["peak_rss_mb"] = round(memory.peak / 1024 / 1024, 1)
+        _local.depth = depth
+        if profiler is not None:
+            record["profile"] = _profile_path(name)
+            profiler.dump_stats(record["profile"])
+        sizes_text = ", ".join(f"{key}={value}" for key, value in record["sizes"].items())
+        logging.info(f"[métricas] {name}: {record['wall_s']:.3f} s, CPU {record['cpu_s']:.3f} s, "
+                     f"pico {record['peak_rss_mb']:.0f} MB" + (f" ({sizes_text})" if sizes_text else ""))
+        with _lock:
+            _state["records"].append(record)
+        write_metrics()
+
+
+def instrumented(name, label=None, sizes=None):
+    """Decorador que executa a função como uma etapa instrumentada.
+
+    Args:
+        name: nome da etapa.
+        label: função (mesmos argumentos da decorada) que retorna um sufixo, ex: "heatmap",
+            gerando a etapa "plot_data[heatmap]".
+        sizes: função sizes(resultado, *args, **kwargs) que retorna um dicionário com os
+            tamanhos das entradas (proteínas, amostras, DEPs, termos...).
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state["active"]:
+                return function(*args, **kwargs)
+            stage_name = f"{name}[{label(*args, **kwargs)}]" if label is not None else name
+            with stage(stage_name) as record:
+                result = function(*args, **kwargs)
+                if sizes is not None:
+                    try:
+                        record["sizes"].update(sizes(result, *args, **kwargs))
+                    except Exception as error:
+                        logging.debug(f"Tamanhos da etapa {stage_name} indisponíveis: {error}")
+            return result
+        return wrapper
+    return decorator
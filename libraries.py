@@ -0,0 +1,356 @@
+"""Leitura das bibliotecas de conjuntos gênicos da pasta data/.
+
+As bibliotecas seguem o formato do Enrichr (termo, descrição vazia e genes
+separados por tabulação). Todas são carregadas em uma única matriz esparsa
+termo x gene, de modo que o enriquecimento de todos os bancos pode ser feito
+em uma só passada.
+
+Na primeira leitura as bibliotecas são compiladas para um índice binário
+(tabela de genes, arrays CSR termo -> gene e tabela de termos) em
+data/.compiled. As execuções seguintes mapeiam esse índice em memória
+(np.load com mmap_mode), compartilhando o cache de páginas entre processos.
+O índice é reconstruído quando o tamanho, o mtime e o hash de alguma
+biblioteca mudam, ou quando a tabela de sinônimos (data/gene_aliases.tsv)
+muda: os genes das bibliotecas são gravados já convertidos para o símbolo
+oficial (ver symbols.py), de modo que símbolos antigos como IL8RB e CDC2
+ocupam a mesma coluna que CXCR2 e CDK1.
+
+Os índices abertos são mantidos em memória (até OPENED_LIBRARIES conjuntos de
+bibliotecas) enquanto continuarem válidos, de modo que enriquecimentos
+repetidos no mesmo processo (contrastes, varredura de FC, o serviço local de
+service.py) não reconstroem as tabelas de genes e de termos.
+
+Uso para compilar manualmente: python libraries.py [pasta_de_dados]
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+
+from symbols import aliases_stamp, canonical_symbol, load_aliases
+
+
+LIBRARY_EXTENSION = ".txt"
+COMPILED_DIR_NAME = ".compiled"
+INDEX_VERSION = 2
+
+# Conjuntos de bibliotecas abertos mantidos em memória por processo
+OPENED_LIBRARIES = int(os.environ.get("PROTEOANALYZER_OPENED_LIBRARIES", "4"))
+
+_opened = OrderedDict()
+_opened_lock = threading.Lock()
+
+
+def library_path(db, datadir):
+    """Retorna o caminho do arquivo de uma biblioteca dentro de datadir."""
+    return os.path.join(datadir, f"{db}{LIBRARY_EXTENSION}")
+
+
+def library_stamp(db, datadir):
+    """Tamanho e mtime do arquivo de uma biblioteca, ou None se ele não existir."""
+    try:
+        stat = os.stat(library_path(db, datadir))
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def read_gene_set_library(filepath):
+    """Lê um arquivo de biblioteca e retorna a lista de termos e de genes de cada termo."""
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"Biblioteca de conjuntos gênicos não encontrada: {filepath}")
+
+    terms = []
+    gene_sets = []
+    with open(filepath, encoding="utf-8") as library:
+        for line in library:
+            fields = line.rstrip("\r\n").split("\t")
+            if not fields[0]:
+                continue
+            # Genes em maiúsculas e sem repetições, preservando a ordem do arquivo
+            genes = list(dict.fromkeys(g.strip().upper() for g in fields[2:] if g.strip()))
+            terms.append(fields[0])
+            gene_sets.append(genes)
+    return terms, gene_sets
+
+
+class GeneSetLibraries:
+    """Conjunto de bibliotecas representado como uma matriz esparsa termo x gene.
+
+    Atributos:
+        dbs: nomes das bibliotecas, na ordem em que foram carregadas.
+        genes: símbolos gênicos (maiúsculos) correspondentes às colunas da matriz.
+        gene_index: dicionário símbolo oficial -> coluna.
+        aliases: dicionário sinônimo -> símbolo oficial usado para converter as consultas.
+        terms: nomes dos termos correspondentes às linhas da matriz.
+        term_library: índice da biblioteca de cada termo.
+        membership: matriz CSR binária termo x gene.
+        library_membership: matriz CSR binária biblioteca x gene (genes anotados em cada banco).
+    """
+
+    def __init__(self, dbs, genes, terms, term_library, membership, aliases=None):
+        self.dbs = list(dbs)
+        self.aliases = aliases or {}
+        self.genes = np.asarray(genes, dtype=object)
+        self.gene_index = {gene: i for i, gene in enumerate(self.genes)}
+        self.terms = np.asarray(terms, dtype=object)
+        self.term_library = np.asarray(term_library, dtype=np.int32)
+        # Matriz binária, sem entradas duplicadas (pode ser um mapeamento somente leitura)
+        self.membership = membership.tocsr()
+
+        # Indicadora biblioteca x termo, usada para agregar genes e contagens por banco
+        library_terms = sparse.csr_matrix(
+            (np.ones(len(self.terms), dtype=np.int32),
+             (self.term_library, np.arange(len(self.terms)))),
+            shape=(len(self.dbs), len(self.terms)))
+        self.library_membership = (library_terms @ self.membership).tocsr()
+        self.library_membership.data[:] = 1
+
+        self.term_sizes = np.diff(self.membership.indptr)
+        self.library_sizes = np.asarray(self.library_membership.sum(axis=1)).ravel()
+
+    def library_slice(self, db):
+        """Retorna o intervalo de linhas (termos) ocupado por uma biblioteca."""
+        index = self.dbs.index(db)
+        rows = np.flatnonzero(self.term_library == index)
+        return slice(int(rows[0]), int(rows[-1]) + 1) if len(rows) else slice(0, 0)
+
+    def gene_column(self, gene):
+        """Coluna de um gene (maiúsculas/minúsculas e sinônimos resolvidos), ou None."""
+        return self.gene_index.get(canonical_symbol(gene, self.aliases))
+
+    def gene_ids(self, genes):
+        """Colunas (IDs inteiros) dos genes anotados em alguma biblioteca, sem repetições."""
+        columns = (self.gene_column(gene) for gene in genes)
+        return np.unique(np.fromiter((column for column in columns if column is not None), dtype=np.int64))
+
+    def query_vector(self, genes):
+        """Converte uma lista de genes em um vetor indicador sobre as colunas da matriz."""
+        vector = np.zeros(len(self.genes), dtype=np.float64)
+        vector[self.gene_ids(genes)] = 1
+        return vector
+
+
+def parse_gene_set_libraries(dbs, datadir, aliases=None):
+    """Lê as bibliotecas em texto e monta a matriz esparsa termo x gene, com os genes no símbolo oficial."""
+    aliases = load_aliases(datadir) if aliases is None else aliases
+    gene_index = {}
+    terms = []
+    term_library = []
+    indptr = [0]
+    indices = []
+    for library_number, db in enumerate(dbs):
+        library_terms, gene_sets = read_gene_set_library(library_path(db, datadir))
+        # Termos em ordem alfabética, como na implementação do gseapy
+        for term, genes in sorted(zip(library_terms, gene_sets), key=lambda item: item[0]):
+            if aliases:
+                genes = dict.fromkeys(aliases.get(gene, gene) for gene in genes)
+            terms.append(term)
+            term_library.append(library_number)
+            indices.extend(gene_index.setdefault(gene, len(gene_index)) for gene in genes)
+            indptr.append(len(indices))
+
+    membership = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32),
+         np.asarray(indices, dtype=np.int32),
+         np.asarray(indptr, dtype=np.int32)),
+        shape=(len(terms), len(gene_index)))
+    return GeneSetLibraries(dbs, list(gene_index), terms, term_library, membership, aliases)
+
+
+def _sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_stamp(filepath, digest=None):
+    """Identificação de uma biblioteca: tamanho, mtime e hash do conteúdo."""
+    stat = os.stat(filepath)
+    return {"size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest if digest is not None else _sha256(filepath)}
+
+
+def _index_key(dbs):
+    return hashlib.sha1("|".join(dbs).encode("utf-8")).hexdigest()[:16]
+
+
+def _write_names(filepath, names):
+    with open(filepath, "w", encoding="utf-8") as table:
+        table.write("\n".join(names))
+
+
+def _read_names(filepath):
+    with open(filepath, encoding="utf-8") as table:
+        content = table.read()
+    return content.split("\n") if content else []
+
+
+def _stamps_match(manifest, dbs, datadir):
+    """Confere se o índice compilado corresponde às bibliotecas atuais.
+
+    Tamanho e mtime iguais bastam; se apenas o mtime mudou, o hash decide e o
+    manifesto é atualizado para evitar recalculá-lo na próxima execução.
+
+    Returns:
+        tupla (válido, manifesto_atualizado).
+    """
+    if manifest.get("version") != INDEX_VERSION or manifest.get("dbs") != list(dbs):
+        return False, False
+    if manifest.get("aliases") != aliases_stamp(datadir):
+        return False, False
+    refreshed = False
+    for db in dbs:
+        filepath = library_path(db, datadir)
+        stamp = manifest["sources"].get(db)
+        if stamp is None or not os.path.exists(filepath):
+            return False, False
+        stat = os.stat(filepath)
+        if stat.st_size != stamp["size"]:
+            return False, False
+        if stat.st_mtime_ns != stamp["mtime_ns"]:
+            digest = _sha256(filepath)
+            if digest != stamp["sha256"]:
+                return False, False
+            manifest["sources"][db] = _file_stamp(filepath, digest)
+            refreshed = True
+    return True, refreshed
+
+
+def _write_manifest(manifest_path, manifest):
+    directory = os.path.dirname(manifest_path)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".json")
+    with os.fdopen(descriptor, "w") as target:
+        json.dump(manifest, target)
+    os.replace(temporary, manifest_path)
+
+
+def compile_gene_set_libraries(dbs, datadir, cachedir=None):
+    """Compila as bibliotecas para o índice binário e retorna o caminho do manifesto.
+
+    O índice é gravado em um diretório temporário e publicado com renomeações
+    atômicas, então execuções concorrentes nunca leem um índice incompleto.
+    """
+    dbs = sorted(set(dbs))
+    cachedir = cachedir or os.path.join(datadir, COMPILED_DIR_NAME)
+    os.makedirs(cachedir, exist_ok=True)
+    key = _index_key(dbs)
+
+    sources = {db: _file_stamp(library_path(db, datadir)) for db in dbs}
+    aliases = aliases_stamp(datadir)
+    libraries = parse_gene_set_libraries(dbs, datadir)
+
+    content = "".join(sources[db]["sha256"] for db in dbs) + str(aliases)
+    content = hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+    index_name = f"{key}-{content}"
+    index_path = os.path.join(cachedir, index_name)
+    if not os.path.exists(index_path):
+        building = tempfile.mkdtemp(dir=cachedir, prefix=f".{key}-")
+        np.save(os.path.join(building, "indptr.npy"), libraries.membership.indptr)
+        np.save(os.path.join(building, "indices.npy"), libraries.membership.indices)
+        np.save(os.path.join(building, "term_library.npy"), libraries.term_library)
+        _write_names(os.path.join(building, "genes.txt"), libraries.genes)
+        _write_names(os.path.join(building, "terms.txt"), libraries.terms)
+        try:
+            os.rename(building, index_path)
+        except OSError:
+            # Outro processo publicou o mesmo índice primeiro
+            shutil.rmtree(building, ignore_errors=True)
+
+    manifest_path = os.path.join(cachedir, f"{key}.json")
+    _write_manifest(manifest_path, {"version": INDEX_VERSION, "dbs": dbs, "sources": sources,
+                                    "aliases": aliases, "index": index_name})
+
+    # Remove versões antigas do índice deste conjunto de bibliotecas
+    for entry in os.listdir(cachedir):
+        if entry.startswith(f"{key}-") and entry != index_name:
+            shutil.rmtree(os.path.join(cachedir, entry), ignore_errors=True)
+    logging.info(f"Índice das bibliotecas compilado em {index_path}")
+    return manifest_path
+
+
+def open_compiled_libraries(dbs, datadir, cachedir=None):
+    """Abre o índice compilado em modo mapeado, ou retorna None se estiver ausente ou desatualizado."""
+    dbs = sorted(set(dbs))
+    cachedir = cachedir or os.path.join(datadir, COMPILED_DIR_NAME)
+    manifest_path = os.path.join(cachedir, f"{_index_key(dbs)}.json")
+    try:
+        with open(manifest_path) as source:
+            manifest = json.load(source)
+    except (OSError, ValueError):
+        return None
+
+    valid, refreshed = _stamps_match(manifest, dbs, datadir)
+    if not valid:
+        return None
+    with _opened_lock:
+        opened = _opened.get(manifest_path)
+        if opened is not None and opened[0] == manifest["index"] and not refreshed:
+            _opened.move_to_end(manifest_path)
+            return opened[1]
+    index_path = os.path.join(cachedir, manifest["index"])
+    try:
+        indptr = np.load(os.path.join(index_path, "indptr.npy"), mmap_mode="r")
+        indices = np.load(os.path.join(index_path, "indices.npy"), mmap_mode="r")
+        term_library = np.load(os.path.join(index_path, "term_library.npy"), mmap_mode="r")
+        genes = _read_names(os.path.join(index_path, "genes.txt"))
+        terms = _read_names(os.path.join(index_path, "terms.txt"))
+    except (OSError, ValueError):
+        return None
+    if refreshed:
+        try:
+            _write_manifest(manifest_path, manifest)
+        except OSError:
+            pass
+
+    membership = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32), indices, indptr),
+        shape=(len(terms), len(genes)), copy=False)
+    libraries = GeneSetLibraries(dbs, genes, terms, term_library, membership, load_aliases(datadir, cachedir))
+    with _opened_lock:
+        _opened[manifest_path] = (manifest["index"], libraries)
+        while len(_opened) > max(OPENED_LIBRARIES, 0):
+            _opened.popitem(last=False)
+    return libraries
+
+
+def load_gene_set_libraries(dbs, datadir, cachedir=None, use_cache=True):
+    """Carrega as bibliotecas indicadas em uma única matriz esparsa termo x gene.
+
+    Usa o índice compilado quando ele é válido e o (re)compila caso contrário.
+    Se a pasta do cache não puder ser gravada, as bibliotecas são lidas do texto.
+    Os bancos são mantidos em ordem alfabética em GeneSetLibraries.dbs.
+    """
+    dbs = sorted(set(dbs))
+    if not use_cache:
+        return parse_gene_set_libraries(dbs, datadir)
+
+    libraries = open_compiled_libraries(dbs, datadir, cachedir)
+    if libraries is not None:
+        return libraries
+    try:
+        compile_gene_set_libraries(dbs, datadir, cachedir)
+    except OSError as compile_error:
+        logging.warning(f"Não foi possível compilar o índice das bibliotecas: {compile_error}")
+        return parse_gene_set_libraries(dbs, datadir)
+    libraries = open_compiled_libraries(dbs, datadir, cachedir)
+    return libraries if libraries is not None else parse_gene_set_libraries(dbs, datadir)
+
+
+if __name__ == "__main__":
+    data_directory = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), "data")
+    available = sorted(entry[:-len(LIBRARY_EXTENSION)] for entry in os.listdir(data_directory)
+                       if entry.endswith(LIBRARY_EXTENSION))
+    print(f"Compilando {len(available)} bibliotecas de {data_directory}...")
+    print(f"Índice gravado em: {compile_gene_set_libraries(available, data_directory)}")
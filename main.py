@@ -1,21 +1,33 @@
 # Created by João Gabriel Barbosa de Luna - iLIKA/UFPE
+import time
+_IMPORT_STARTED = time.perf_counter()
+import argparse
 import json
-import omicscope as omics
-import pandas as pd
-import seaborn as sns
-import numpy as np
 import os
 from datetime import datetime
 import math
 import logging
 import shutil
-from matplotlib import pyplot as plt
-from contextlib import contextmanager
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+# OmicScope, pandas, numpy, matplotlib e os módulos de análise que dependem deles são importados
+# nas funções que os usam, para que o programa inicie sem pagar essas importações (ver analyses.py)
+from analyses import (ANALYSES, FIGURE_DPI, STAGE_GROUPS, StageSelection, analyses, flush_import_records,
+                      import_module, record_import, register)
+from checkpoints import Checkpoints, fingerprint
+from instrumentation import (instrumented, start_metrics, stop_metrics, metrics_config,
+                             start_worker_metrics, drain_records, add_records)
 
 
 # ---------------------------------------------------------------------------------#
-def create_dir(targetdirectory, projectname):
-    """Cria a estrutura de diretórios do projeto."""
+def create_dir(targetdirectory, projectname, username="", overwrite=None, resume=False):
+    """Cria a estrutura de diretórios do projeto.
+
+    Se o diretório do projeto já existir, overwrite=True o recria e overwrite=False
+    levanta FileExistsError; com overwrite=None o usuário é consultado. Com
+    resume=True o diretório existente é mantido e o app.log é continuado, para que
+    run_analysis retome a análise pulando as etapas já concluídas.
+    """
     if not os.path.exists(targetdirectory):
         logging.error(f"O diretório de destino não existe: {targetdirectory}")
         logging.shutdown()
@@ -24,9 +36,20 @@ def create_dir(targetdirectory, projectname):
     project_path = os.path.join(targetdirectory, projectname)
 
     # Verifica se o diretório do projeto já existe
-    if os.path.exists(project_path):
-        response = input(f"O diretório '{projectname}' já existe no caminho selecionado. Deseja sobrescrever? (y/n): ").lower().strip()
-        if response == 'n':
+    if os.path.exists(project_path) and resume:
+        print(f"Retomando a análise do projeto {projectname} em {targetdirectory}")
+    elif os.path.exists(project_path) and overwrite is not None:
+        if not overwrite:
+            raise FileExistsError(f"O diretório '{projectname}' já existe em {targetdirectory}")
+        shutil.rmtree(project_path)
+        os.mkdir(project_path)
+        print(f"O diretório {projectname} foi recriado em {targetdirectory}")
+    elif os.path.exists(project_path):
+        response = input(f"O diretório '{projectname}' já existe no caminho selecionado. Deseja sobrescrever? (y/n, ou r para retomar a análise anterior): ").lower().strip()
+        if response == 'r':
+            resume = True
+            print(f"Retomando a análise do projeto {projectname} em {targetdirectory}")
+        elif response == 'n':
             while True:
                 another_dir = input("Deseja selecionar outro diretório? (y/n): ").lower().strip()
                 if another_dir == "y":
@@ -36,6 +59,7 @@ def create_dir(targetdirectory, projectname):
                         print(f"O diretório {projectname} também existe no caminho selecionado.")
                         continue
                     else:
+                        os.mkdir(project_path)
                         print(f"O diretório {projectname} foi criado em {another_directory}")
                         break
                 elif another_dir == "n":
@@ -55,9 +79,9 @@ def create_dir(targetdirectory, projectname):
     # Cria subdiretórios
     try:
         tables_path = os.path.join(project_path, "tables")
-        os.mkdir(tables_path)
+        os.makedirs(tables_path, exist_ok=resume)
         plots_path = os.path.join(project_path, "plots")
-        os.mkdir(plots_path)
+        os.makedirs(plots_path, exist_ok=resume)
     except PermissionError:
         print(f"O usuário não possui permissão para criar os subdiretórios. Consulte o usuário administrador para mais informações")
         exit(0)
@@ -67,23 +91,58 @@ def create_dir(targetdirectory, projectname):
     # Criando sistema de log
     try:
         log_file_path = os.path.join(project_path, "app.log")
+        # force=True substitui o log do projeto anterior quando várias análises rodam no mesmo processo
         logging.basicConfig(level=logging.INFO,
                             format='%(asctime)s - %(levelname)s - %(message)s',
                             filename=log_file_path,
-                            filemode='w')
+                            filemode='a' if resume else 'w',
+                            force=True)
     except Exception as log_error:
         print(f"Erro ao criar o sistema de log: {log_error}")
 
 
-    logging.info(f"Project name: {project_name}")
-    logging.info(f"Owned by: {user_name}")
+    logging.info(f"Project name: {projectname}")
+    logging.info(f"Owned by: {username}")
     logging.info(f"Created on: {datetime.now()}")
     logging.info(f"O diretório {project_path} foi criado.")
 
     return project_path
 
-def read_proteomics_file(rawfilepath, method, control):
-    """Lê o arquivo de dados de proteômica e retorna um objeto OmicScope."""
+def _dataset_sizes(rawfiledata):
+    return {"proteins": len(rawfiledata.quant_data), "samples": len(rawfiledata.pdata),
+            "deps": len(rawfiledata.deps)}
+
+
+def load_omicscope(rawfilepath, method, control, options):
+    """Constrói o objeto OmicScope a partir do arquivo de proteômica.
+
+    Relatórios do DIA-NN a partir de DIANN_STREAMING_MB são primeiro agregados a
+    proteína x corrida por compact_diann_report, com memória limitada pelo
+    orçamento DIANN_MEMORY_MB, e o OmicScope lê o relatório compacto.
+    """
+    omics = import_module("omicscope")
+    from diann import DIANN_STREAMING_MB, compact_diann_report
+
+    if method == "DIA-NN" and os.path.getsize(rawfilepath) >= DIANN_STREAMING_MB * 1024 * 1024:
+        with tempfile.TemporaryDirectory(prefix="proteoanalyzer-diann-") as workdir:
+            compact = compact_diann_report(rawfilepath, os.path.join(workdir, os.path.basename(rawfilepath)))
+            if compact is not None:
+                return omics.OmicScope(compact, Method=method, ControlGroup=control, **options)
+    return omics.OmicScope(rawfilepath, Method=method, ControlGroup=control, **options)
+
+
+@instrumented("read_proteomics_file", sizes=lambda data, *args, **kwargs: _dataset_sizes(data))
+def read_proteomics_file(rawfilepath, method, control, use_cache=None, pdata=None):
+    """Lê o arquivo de dados de proteômica e retorna um objeto OmicScope.
+
+    pdata é o arquivo de fenótipo (amostra, condição, réplica biológica) exigido
+    pelo OmicScope na leitura de exportações do MaxQuant e do DIA-NN.
+
+    Com o cache habilitado (padrão: DATASET_CACHE), um arquivo já analisado com o
+    mesmo método e grupo controle é reconstruído do cache de dados, sem refazer
+    a importação e a estatística. Relatórios do DIA-NN grandes são agregados em
+    blocos antes da leitura (ver load_omicscope).
+    """
     # Remove espaços e aspas do caminho
     rawfilepath = rawfilepath.strip().strip('"')
 
@@ -96,8 +155,19 @@ def read_proteomics_file(rawfilepath, method, control):
         logging.shutdown()
         raise Exception(f"O arquivo com os dados da proteômica fornecido está vazio: {rawfilepath}. Verifique o conteúdo do mesmo e tente novamente.")
 
+    from dataset_cache import read_cached_dataset
+
+    options = {"pdata": pdata} if pdata else {}
     try:
-        data = omics.OmicScope(rawfilepath, Method=method, ControlGroup=control)
+        if not (DATASET_CACHE if use_cache is None else use_cache):
+            return load_omicscope(rawfilepath, method, control, options)
+        data, cached = read_cached_dataset(
+            rawfilepath, method, control,
+            lambda: load_omicscope(rawfilepath, method, control, options),
+            pdata=pdata)
+        if cached:
+            print("Conjunto de dados carregado do cache.")
+            logging.info(f"Conjunto de dados carregado do cache ({rawfilepath}, {method}, controle {control}).")
         return data
     except Exception as e:
         logging.error(f"Erro ao ler o arquivo de proteômica: {str(e)}")
@@ -105,199 +175,204 @@ def read_proteomics_file(rawfilepath, method, control):
         raise Exception(f"Erro ao ler o arquivo de proteômica: {str(e)}")
 
 
-def plot_data(rawfiledata, analysis_type, titlename, plotsdir, analysis):
-    if analysis_type == "conditions_barplot" or analysis_type == "conditions_boxplot":
-        while True:
-            try:
-                proteins_string = input("Insira as proteínas que deseja apontar no gráfico, separadas por vírgula. Certifique-se de que as proteínas indicadas estão na tabela, e que estão escritas exatamente como estão na tabela: ").upper()
-                # Remove aspas simples e duplas se o usuário as inserir
-                proteins_list = [p.strip().strip("'").strip('"') for p in proteins_string.split(',') if p.strip()]
-
-                palette = input("Insira a paleta desejada (pressione enter para utilizar a paleta de cores padrão): ")
-                if len(palette) == 0:
-                    palette = 'viridis'
-
-                print(f"Gerando {analysis}...")
-                logging.info(f"Gerando {analysis}...")
-                if analysis_type == "conditions_barplot":
-                    rawfiledata.bar_protein(*proteins_list,
-                                            palette=palette,
-                                            dpi=300,
-                                            save=os.path.join(plotsdir, f"{titlename}_"))
-
-                else:  # conditions_boxplot
-                    rawfiledata.boxplot_protein(*proteins_list,
-                                                palette=palette,
-                                                dpi=300,
-                                                save=os.path.join(plotsdir, f"{titlename}_"))
-                break
-            except IndexError:
-                print(f"Proteína(s) inserida(s) não localizada(s): {proteins_string}")
-                logging.error(f"Proteína(s) inserida(s) não localizada(s): {proteins_string}")
-            except ValueError:
-                print(f"Valor inserido inválido: {proteins_string}")
-                logging.error(f"Valor inserido inválido: {proteins_string}")
+@instrumented("plot_data", label=lambda rawfiledata, analysis_type, *args, **kwargs: analysis_type,
+              sizes=lambda result, rawfiledata, *args, **kwargs: _dataset_sizes(rawfiledata))
+def plot_data(rawfiledata, analysis_type, titlename, plotsdir, analysis, proteins=None, palette=None,
+              figures=None):
+    """Gera um gráfico do OmicScope em plotsdir, pela análise registrada em ANALYSES.
 
+    proteins e palette são solicitados ao usuário quando não informados. Se as
+    proteínas forem informadas e não forem localizadas, o erro é propagado em vez
+    de uma nova tentativa ser solicitada.
 
-    elif analysis_type == "dynamic_range":
-        while True:
-            try:
-                proteins_string = input(
-                    "Insira as proteínas que deseja apontar no gráfico, separadas por vírgula. Certifique-se de que as proteínas indicadas estão na tabela, e que estão escritas exatamente como estão na tabela: ").upper()
-                # Remove aspas simples e duplas se o usuário as inserir
-                proteins_list = [p.strip().strip("'").strip('"') for p in proteins_string.split(',') if p.strip()]
-
-                print(f"Gerando {analysis}...")
-                logging.info(f"Gerando {analysis}...")
-                rawfiledata.DynamicRange(*proteins_list,
-                                         dpi=300,
-                                         save=os.path.join(plotsdir, f"{titlename}_"))
-                break
-            except IndexError:
-                print(f"Proteína(s) inserida(s) não localizada(s): {proteins_string}")
-                logging.error(f"Proteína(s) inserida(s) não localizada(s): {proteins_string}")
-            except ValueError:
-                print(f"Valor inserido inválido: {proteins_string}")
-                logging.error(f"Valor inserido inválido: {proteins_string}")
+    figures (FigureCache do conjunto de dados) reaproveita um gráfico já
+    renderizado com as mesmas proteínas, paleta e configurações do gráfico
+    (Analysis.settings, ex: backend de coorte).
 
+    Retorna os caminhos dos arquivos gerados.
+    """
+    plot = ANALYSES.get(analysis_type)
+    if plot is None or plot.kind != "plot" or plot.run is None:
+        raise ValueError(f"Gráfico inválido: {analysis_type}")
+    draw = plot.load()
+    settings = {"settings": plot.settings()} if plot.settings else {}
 
-    elif analysis_type == "ma_plot":
-        while True:
-            try:
-                proteins_string = input(
-                    "Insira as proteínas que deseja apontar no gráfico, separadas por vírgula. Certifique-se de que as proteínas indicadas estão na tabela, e que estão escritas exatamente como estão na tabela: ").upper()
-                # Remove aspas simples e duplas se o usuário as inserir
-                proteins_list = [p.strip().strip("'").strip('"') for p in proteins_string.split(',') if p.strip()]
-                print(f"Gerando {analysis}...")
-                logging.info(f"Gerando {analysis}...")
-                rawfiledata.MAplot(*proteins_list,
-                                   dpi=300,
-                                   save=os.path.join(plotsdir, f"{titlename}_"))
-                break
-            except IndexError:
-                print(f"Proteína(s) inserida(s) não localizada(s): {proteins_string}")
-                logging.error(f"Proteína(s) inserida(s) não localizada(s): {proteins_string}")
-            except ValueError:
-                print(f"Valor inserido inválido: {proteins_string}")
-                logging.error(f"Valor inserido inválido: {proteins_string}")
-
-    elif analysis_type == "correlation_heatmap":
-        print(f"Gerando {analysis}...")
-        logging.info(f"Gerando {analysis}...")
-        rawfiledata.correlation(dpi=300,
-                                linewidth=0,
-                                save=os.path.join(plotsdir, f"{titlename}_"))
-
-    elif analysis_type == "expression_heatmap":
-        print(f"Gerando {analysis}...")
-        logging.info(f"Gerando {analysis}...")
-        rawfiledata.heatmap(dpi=300,
-                            linewidth=0,
-                            save=os.path.join(plotsdir, f"{titlename}_"))
-
-    elif analysis_type == "id_barplot":
-        print(f"Gerando {analysis}...")
-        logging.info(f"Gerando {analysis}...")
-        rawfiledata.bar_ident(dpi=300,
-                           save=os.path.join(plotsdir, f"{titlename}_"))
-
-    elif analysis_type == "pca":
-        print(f"Gerando {analysis}...")
-        logging.info(f"Gerando {analysis}...")
-        rawfiledata.pca(dpi=300,
-                        save=os.path.join(plotsdir, f"{titlename}_"))
-
-    elif analysis_type == "kmeans":
+    if not plot.proteins:
         print(f"Gerando {analysis}...")
         logging.info(f"Gerando {analysis}...")
-        rawfiledata.k_trend(dpi=300,
-                           save=os.path.join(plotsdir, f"{titlename}_"))
+        return render_figure(figures, analysis_type, plotsdir, f"{titlename}_",
+                             lambda save: draw(rawfiledata, save), **settings)
 
-    elif analysis_type == "normalization_plot":
-        print(f"Gerando {analysis}...")
-        logging.info(f"Gerando {analysis}...")
-        rawfiledata.normalization_boxplot(dpi=300,
-                                       save=os.path.join(plotsdir, f"{titlename}_"))
-
-def create_volcano_plot(df, cutoff, pvalue_cutoff, plotsdir, titlename):
     while True:
         try:
-            proteins_string = input("Insira as proteínas que deseja apontar no gráfico, separadas por vírgula. Certifique-se de que as proteínas indicadas estão na tabela, e que estão escritas exatamente como estão na tabela: ").upper()
-            # Remove aspas simples e duplas se o usuário as inserir
-            proteins_list = [p.strip().strip("'").strip('"') for p in proteins_string.split(',') if p.strip()]
-
-            full_path = os.path.join(plotsdir, f"{titlename}.svg")
-            df['regulation'] = 'Not Significant'
-            condition_up = (df['log2(fc)'] >= cutoff) & (df['pAdjusted'] < pvalue_cutoff)
-            condition_down = (df['log2(fc)'] <= -cutoff) & (df['pAdjusted'] < pvalue_cutoff)
-            df.loc[condition_up, 'regulation'] = 'Up-regulated'
-            df.loc[condition_down, 'regulation'] = 'Down-regulated'
-
-            # --- Plot Styling ---
-            plt.style.use('seaborn-v0_8-white')
-            plt.figure(figsize=(8, 8))
-
-            palette = {
-                'Up-regulated': '#ff4d4d',
-                'Down-regulated': '#4d4dff',
-                'Not Significant': 'darkgrey'
-            }
-
-            sns.scatterplot(
-                data=df, x='log2(fc)', y='-log10(pAdjusted)', hue='regulation',
-                palette=palette, s=40, alpha=0.7, edgecolor='none'
-            )
-
-            # --- Axis and threshold lines ---
-            plt.axvline(x=0, color='black', linestyle='-', linewidth=0.75)
-            plt.axhline(y=-np.log10(pvalue_cutoff), color='dimgrey', linestyle='--', linewidth=1)
-            plt.axvline(x=cutoff, color='dimgrey', linestyle='--', linewidth=1)
-            plt.axvline(x=-cutoff, color='dimgrey', linestyle='--', linewidth=1)
-
-            # --- Protein Labeling ---
-            df_labels = df[df['gene_name'].isin(proteins_list)]
-            for index, row in df_labels.iterrows():
-                plt.text(row['log2(fc)'], row['-log10(pAdjusted)'], row['gene_name'],
-                         ha='center', va='bottom', fontsize=9, fontweight='bold', alpha=0.9)
-
-            # --- Final Plot Customization ---
-            plt.title('Volcano Plot', fontsize=16, fontweight='bold')
-            plt.ylabel(r'$-log_{10}(Adjusted\ p-value)$', fontsize=12)
-            plt.xlabel(r'$log_2(Fold\ Change)$', fontsize=12)
-            plt.xlim(-3, 3)
-
-            handles, labels = plt.gca().get_legend_handles_labels()
-            # Define a ordem ideal
-            order_preference = ['Up-regulated', 'Down-regulated', 'Not Significant']
-            # Filtra a ordem para incluir apenas os labels que existem no gráfico
-            final_order = [label for label in order_preference if label in labels]
-            # Cria um dicionário para mapear labels aos seus handles
-            legend_dict = dict(zip(labels, handles))
-            # Recria os handles na ordem correta
-            final_handles = [legend_dict[label] for label in final_order]
-
-            plt.legend(final_handles, final_order, title='Regulation', frameon=False)
-
-            print("Gerando volcano plot...")
-            plt.savefig(full_path, format='svg', dpi=300, bbox_inches='tight')
-            print(f"\nVolcano plot salvo com sucesso em: '{full_path}'")
-            logging.info(f"Volcano plot salvo com sucesso em: '{full_path}'")
-            break
-
-        except Exception as e:
-            print(f"Um erro ocorreu durante a geração do volcano plot: {e}")
-            logging.error(f"Um erro ocorreu durante a geração do volcano plot: {e}")
-
-
-def perform_ora_enrichment(rawfiledata, db, analysis, datadir):
-    print(f"Iniciando análise de: {analysis}...")
-    logging.info(f"Iniciando análise: {analysis}...")
-    with change_dir(datadir):
-        data_object = omics.EnrichmentScope(rawfiledata, Analysis='ORA', dbs=[db])
-    data_dataframe = data_object.results
-    print(f"Análise de {analysis} concluída.")
-    logging.info(f"Análise de {analysis} concluída.")
-    return data_object, data_dataframe
+            proteins_string, proteins_list = read_proteins_list(proteins)
+            options = {}
+            if plot.palette:
+                if proteins is not None and not proteins_list:
+                    # Sem interação não há como solicitar as proteínas; o gráfico é omitido
+                    print(f"Nenhuma proteína informada para o {analysis}. Gráfico não gerado.")
+                    logging.warning(f"Nenhuma proteína informada para o {analysis}. Gráfico não gerado.")
+                    return []
+
+                selected_palette = palette
+                if selected_palette is None:
+                    selected_palette = input("Insira a paleta desejada (pressione enter para utilizar a paleta de cores padrão): ")
+                options["palette"] = selected_palette if len(selected_palette) else 'viridis'
+
+            print(f"Gerando {analysis}...")
+            logging.info(f"Gerando {analysis}...")
+            return render_figure(figures, analysis_type, plotsdir, f"{titlename}_",
+                                 lambda save: draw(rawfiledata, save, proteins_list, **options),
+                                 proteins=proteins_list, **options, **settings)
+        except IndexError:
+            print(f"Proteína(s) inserida(s) não localizada(s): {proteins_string}")
+            logging.error(f"Proteína(s) inserida(s) não localizada(s): {proteins_string}")
+            if proteins is not None:
+                raise
+        except ValueError:
+            print(f"Valor inserido inválido: {proteins_string}")
+            logging.error(f"Valor inserido inválido: {proteins_string}")
+            if proteins is not None:
+                raise
+
+
+@instrumented("create_volcano_plot", sizes=lambda result, df, *args, **kwargs: {"proteins": len(df)})
+def create_volcano_plot(df, cutoff, pvalue_cutoff, plotsdir, titlename, proteins=None, formats=None,
+                        figures=None):
+    """Gera o volcano plot em plotsdir, em cada formato de VOLCANO_FORMATS (svg, png, pdf).
+
+    A figura é construída uma única vez; se a leitura das proteínas falhar no
+    modo interativo, apenas os rótulos são refeitos. Com figures (FigureCache),
+    um volcano plot já renderizado com os mesmos cutoffs, proteínas e formatos é
+    copiado do cache, sem construir a figura.
+    """
+    from volcano import VolcanoPlot
+
+    formats = [image_format.strip().lower() for image_format in formats or VOLCANO_FORMATS]
+    figure = {}
+
+    def draw(save, proteins_list):
+        if "volcano" not in figure:
+            figure["volcano"] = VolcanoPlot(df, cutoff, pvalue_cutoff)
+        volcano = figure["volcano"]
+
+        # --- Protein Labeling ---
+        missing = volcano.set_labels(proteins_list)
+        if missing:
+            print(f"Proteínas não encontradas nas DEPs: {', '.join(missing)}")
+            logging.warning(f"Proteínas não encontradas no volcano plot: {', '.join(missing)}")
+
+        print("Gerando volcano plot...")
+        volcano.save(save, formats, FIGURE_DPI)
+
+    try:
+        while True:
+            try:
+                proteins_string, proteins_list = read_proteins_list(proteins)
+                render_figure(figures, "volcano", plotsdir, titlename, lambda save: draw(save, proteins_list),
+                              proteins=proteins_list, cutoff=cutoff, pvalue_cutoff=pvalue_cutoff,
+                              formats=formats)
+                paths = [os.path.join(plotsdir, f"{titlename}.{image_format}") for image_format in formats]
+                for full_path in paths:
+                    print(f"\nVolcano plot salvo com sucesso em: '{full_path}'")
+                    logging.info(f"Volcano plot salvo com sucesso em: '{full_path}'")
+                break
+
+            except Exception as e:
+                print(f"Um erro ocorreu durante a geração do volcano plot: {e}")
+                logging.error(f"Um erro ocorreu durante a geração do volcano plot: {e}")
+                if proteins is not None:
+                    raise
+    finally:
+        if "volcano" in figure:
+            figure["volcano"].close()
+
+
+def render_figure(figures, plot, plotsdir, name, draw, **parameters):
+    """Gera um gráfico com draw(save), onde save é o prefixo dos arquivos em plotsdir.
+
+    Com figures (FigureCache) o gráfico é copiado do cache quando já foi
+    renderizado para o mesmo conjunto de dados e parâmetros.
+
+    Retorna os caminhos dos arquivos gerados em plotsdir.
+    """
+    from figure_cache import render_files
+
+    if figures is None:
+        return render_files(plotsdir, name, draw)
+    return figures.render(plot, plotsdir, name, draw, dpi=FIGURE_DPI, **parameters)[0]
+
+
+@register("ora", "enrichment", "ORA", requires=("pandas", "scipy.sparse", "scipy.stats"))
+@instrumented("perform_ora_enrichment",
+              sizes=lambda results, rawfiledata, databases, *args, **kwargs: {
+                  "deps": len(rawfiledata.deps), "databases": len(databases),
+                  "terms": sum(len(df) for _, df in results.values())})
+def perform_ora_enrichment(rawfiledata, databases, datadir, padjust_cutoff=0.05):
+    """Executa o ORA de todos os bancos em uma única passada sobre as bibliotecas de datadir.
+
+    Retorna um dicionário banco -> (objeto de enriquecimento, tabela de resultados).
+    """
+    from enrichment import EnrichmentResult, ora_enrichment, query_from_omicscope
+    from libraries import load_gene_set_libraries
+
+    for db, analysis in databases:
+        print(f"Iniciando análise de: {analysis}...")
+        logging.info(f"Iniciando análise: {analysis}...")
+    dbs = [db for db, _ in databases]
+    libraries = load_gene_set_libraries(dbs, datadir)
+    genes, foldchange = query_from_omicscope(rawfiledata)
+    tables = ora_enrichment(libraries, genes, foldchange, padjust_cutoff)
+
+    results = {}
+    for db, analysis in databases:
+        data_dataframe = tables[db]
+        data_object = EnrichmentResult(data_dataframe, [db], 'ORA', rawfiledata, padjust_cutoff)
+        results[db] = (data_object, data_dataframe)
+        print(f"Análise de {analysis} concluída.")
+        logging.info(f"Análise de {analysis} concluída.")
+    return results
+
+
+@register("gsea", "enrichment", "GSEA preranked", requires=("pandas", "scipy.sparse", "scipy.stats"))
+@instrumented("perform_gsea_enrichment",
+              sizes=lambda results, rawfiledata, databases, *args, **kwargs: {
+                  "proteins": len(rawfiledata.quant_data), "databases": len(databases),
+                  "terms": sum(len(df) for _, df in results.values())})
+def perform_gsea_enrichment(rawfiledata, databases, datadir, padjust_cutoff=0.05, permutations=1000, seed=42,
+                            workers=1):
+    """Executa o GSEA preranked (ranking por log2(fc)) de todos os bancos em uma única passada.
+
+    As permutações da distribuição nula são distribuídas entre workers processos.
+    As tabelas têm as colunas do ORA, de modo que a plotagem e a escrita são as mesmas.
+
+    Retorna um dicionário banco -> (objeto de enriquecimento, tabela de resultados).
+    """
+    from enrichment import EnrichmentResult
+    from gsea import gsea_enrichment, ranking_from_omicscope
+    from libraries import load_gene_set_libraries
+
+    for db, analysis in databases:
+        print(f"Iniciando análise de: {analysis} (GSEA)...")
+        logging.info(f"Iniciando análise: {analysis} (GSEA, {permutations} permutações, semente {seed})...")
+    dbs = [db for db, _ in databases]
+    libraries = load_gene_set_libraries(dbs, datadir)
+    genes, metric, foldchange = ranking_from_omicscope(rawfiledata)
+    tables = gsea_enrichment(libraries, genes, metric, foldchange, padjust_cutoff, permutations, seed, workers)
+
+    results = {}
+    for db, analysis in databases:
+        data_dataframe = tables[db]
+        data_object = EnrichmentResult(data_dataframe, [db], 'ORA', rawfiledata, padjust_cutoff)
+        results[db] = (data_object, data_dataframe)
+        print(f"Análise de {analysis} (GSEA) concluída.")
+        logging.info(f"Análise de {analysis} (GSEA) concluída.")
+    return results
+
+
+def enrichment_table_name(projectname, db, method="ora"):
+    """Nome da tabela de enriquecimento de um banco (as tabelas do GSEA têm o sufixo _GSEA)."""
+    return f"{projectname}_{db}_GSEA" if method == "gsea" else f"{projectname}_{db}"
 
 
 def plot_enrichment_data(enriched_object, plot, plotsdir, titlename, db):
@@ -310,9 +385,345 @@ def plot_enrichment_data(enriched_object, plot, plotsdir, titlename, db):
         logging.error(f"Gráfico para plotagem de enriquecimento inválido: {plot}")
 
 
-def create_xlsx_file(dataframe, name, tablesdir):
-    filename = os.path.join(tablesdir, f"{name}.xlsx")
-    dataframe.to_excel(filename)
+@instrumented("enrich_database", label=lambda genes, foldchange, db, *args, **kwargs: db,
+              sizes=lambda result, genes, *args, **kwargs: {"genes": len(genes), "terms": len(result[1])})
+def enrich_database(genes, foldchange, db, title, datadir, plotsdir, tablesdir, projectname,
+                    padjust_cutoff=0.05, plot=True, table_formats=None):
+    """Enriquecimento, dotplot e tabela de um único banco, usando o caminho explícito da biblioteca.
+
+    Não altera o diretório de trabalho, podendo ser executada em threads ou processos paralelos.
+    """
+    from enrichment import EnrichmentResult, ora_enrichment
+    from libraries import load_gene_set_libraries
+
+    libraries = load_gene_set_libraries([db], datadir)
+    data_dataframe = ora_enrichment(libraries, genes, foldchange, padjust_cutoff)[db]
+    data_object = EnrichmentResult(data_dataframe, [db], 'ORA', None, padjust_cutoff)
+    if plot:
+        plot_enrichment_data(data_object, "dotplot", plotsdir, projectname, title)
+    create_table_file(data_dataframe, f"{projectname}_{db}", tablesdir, table_formats)
+    return data_object, data_dataframe
+
+
+def _init_enrichment_worker(metrics=None):
+    # Processos de enriquecimento plotam sem interface gráfica
+    from matplotlib import pyplot as plt
+    plt.switch_backend("Agg")
+    start_worker_metrics(metrics)
+
+
+def _enrich_in_worker(*args):
+    # Devolve também as métricas registradas no worker
+    return enrich_database(*args), drain_records()
+
+
+def run_enrichment(rawfiledata, databases, datadir, plotsdir, tablesdir, projectname,
+                   workers=1, executor="process", padjust_cutoff=0.05, writer=None, done=None, method="ora",
+                   permutations=1000, seed=42):
+    """Executa enriquecimento, dotplot e tabela de todos os bancos.
+
+    Com workers <= 1 os bancos são testados em uma única passada serial. Caso
+    contrário, cada banco é processado em um pool de processos ("process") ou
+    de threads ("thread"); no pool de threads os dotplots são gerados na
+    thread principal, pois o pyplot não é thread-safe. Tabelas e gráficos são
+    idênticos aos do caminho serial.
+
+    Args:
+        databases: lista de tuplas (banco, descrição da análise, título do gráfico).
+        writer: TableWriter usado nas tabelas do caminho serial; nos pools, cada
+            banco escreve sua tabela no próprio worker, nos mesmos formatos.
+        done: função done(banco, arquivos) chamada quando o gráfico e a tabela de
+            um banco foram escritos (usada nos checkpoints).
+        method: método de enriquecimento registrado em ANALYSES: "ora" ou "gsea" (preranked
+            por log2(fc)). No GSEA todos os bancos são testados em uma única passada e os
+            workers dividem as permutações.
+        permutations, seed: permutações da distribuição nula do GSEA e sua semente.
+
+    Returns:
+        dicionário banco -> (objeto de enriquecimento, tabela de resultados).
+    """
+    from enrichment import query_from_omicscope
+    from tables import TableWriter, table_paths
+
+    if writer is None:
+        writer = TableWriter(tablesdir, TABLE_FORMATS, background=False)
+    enrichment = ANALYSES.get(method)
+    if enrichment is None or enrichment.kind != "enrichment":
+        raise ValueError(f"Método de enriquecimento inválido: {method}. "
+                         f"Use {' ou '.join(repr(name) for name in enrichment_methods())}.")
+    perform = enrichment.load()
+    if workers <= 1 or method == "gsea":
+        tested = [(db, analysis) for db, analysis, _ in databases]
+        options = {"permutations": permutations, "seed": seed, "workers": workers} if method == "gsea" else {}
+        results = perform(rawfiledata, tested, datadir, padjust_cutoff, **options)
+        for db, _, title in databases:
+            enriched_object, enriched_df = results[db]
+            plot_enrichment_data(enriched_object, "dotplot", plotsdir, projectname, title)
+            writer.write(enriched_df, enrichment_table_name(projectname, db, method),
+                         done=None if done is None else lambda written, db=db: done(db, written))
+        return results
+
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_enrichment_worker,
+                                   initargs=(metrics_config(),))
+    elif executor == "thread":
+        pool = ThreadPoolExecutor(max_workers=workers)
+    else:
+        raise ValueError(f"Tipo de pool de enriquecimento inválido: {executor}. Use 'process' ou 'thread'.")
+
+    genes, foldchange = query_from_omicscope(rawfiledata)
+    results = {}
+    with pool:
+        futures = {}
+        for db, analysis, title in databases:
+            print(f"Iniciando análise de: {analysis}...")
+            logging.info(f"Iniciando análise: {analysis}...")
+            task = _enrich_in_worker if executor == "process" else enrich_database
+            futures[db] = pool.submit(task, genes, foldchange, db, title, datadir, plotsdir,
+                                      tablesdir, projectname, padjust_cutoff, executor == "process",
+                                      writer.formats)
+        for db, analysis, title in databases:
+            if executor == "process":
+                (data_object, data_dataframe), records = futures[db].result()
+                add_records(records)
+            else:
+                data_object, data_dataframe = futures[db].result()
+            data_object.OmicScope = rawfiledata
+            if executor == "thread":
+                plot_enrichment_data(data_object, "dotplot", plotsdir, projectname, title)
+            if done is not None:
+                done(db, table_paths(f"{projectname}_{db}", tablesdir, writer.formats))
+            results[db] = (data_object, data_dataframe)
+            print(f"Análise de {analysis} concluída.")
+            logging.info(f"Análise de {analysis} concluída.")
+    return results
+
+
+def run_fc_sweep(rawfiledata, deps_dataframe, fcs, databases, datadir, tablesdir, projectname,
+                 padjust_cutoff=0.05, writer=None, done=None):
+    """Calcula as DEPs filtradas e o enriquecimento de vários valores de FC em uma única passada.
+
+    O |log2(fc)| das DEPs é ordenado uma única vez e o conjunto de cada cutoff é
+    obtido por busca binária; no enriquecimento, as sobreposições das consultas
+    aninhadas são acumuladas de um cutoff para o seguinte (ver ora_sweep).
+
+    Escreve uma tabela de DEPs filtradas por valor de FC ("DEPs filtradas (FC 1.5)")
+    e uma tabela por banco com os resultados de todos os valores ("<projeto>_<banco>_FC_sweep"),
+    identificados pelas colunas FC, log2(fc) cutoff e FC criterion. Nas duas tabelas o
+    critério é estrito: |log2(fc)| > cutoff (SWEEP_CRITERION).
+
+    Args:
+        fcs: valores de FC (ex: [1, 1.25, 1.5, 1.75, 2]).
+        databases: lista de tuplas (banco, descrição da análise, título do gráfico).
+        done: função chamada com a lista de arquivos de cada tabela escrita.
+
+    Returns:
+        dicionário banco -> tabela combinada de enriquecimento.
+    """
+    np = import_module("numpy")
+    pd = import_module("pandas")
+    from enrichment import ora_sweep, query_sweep_from_omicscope
+    from libraries import load_gene_set_libraries
+    from tables import TableWriter
+
+    cutoffs = [parse_fc_cutoff(fc) for fc in fcs]
+    fcs, cutoffs = zip(*sorted(set(zip((float(fc) for fc in fcs), cutoffs))))
+    if writer is None:
+        writer = TableWriter(tablesdir, TABLE_FORMATS, background=False)
+    logging.info(f"Varredura de FC: {', '.join(f'{fc:g}' for fc in fcs)}")
+
+    # Critério estrito de filter_deps_dataframe, também usado nas consultas do enriquecimento
+    # (query_sweep_from_omicscope); valores ausentes nunca passam no filtro
+    strength = deps_dataframe['log2(fc)'].abs().to_numpy(dtype=np.float64, na_value=np.nan)
+    strength = np.where(np.isnan(strength), -np.inf, strength)
+    order = np.argsort(strength, kind='mergesort')
+    for fc, cutoff in zip(fcs, cutoffs):
+        start = np.searchsorted(strength[order], cutoff, side='right')
+        filtered = deps_dataframe.iloc[np.sort(order[start:])].copy()
+        writer.write(filtered, f"DEPs filtradas (FC {fc:g})", done=done)
+        logging.info(f"FC {fc:g}: {len(filtered)} DEPs com log2(fc) > {cutoff:.2f}")
+
+    dbs = [db for db, _, _ in databases]
+    libraries = load_gene_set_libraries(dbs, datadir)
+    genes, counts, foldchange = query_sweep_from_omicscope(rawfiledata, cutoffs)
+    sweep = ora_sweep(libraries, genes, counts, foldchange, padjust_cutoff)
+
+    combined = {}
+    for db, analysis, _ in databases:
+        tables = []
+        for fc, cutoff, tables_by_db in zip(fcs, cutoffs, sweep):
+            table = tables_by_db[db].copy()
+            table.insert(0, 'FC', fc)
+            table.insert(1, 'log2(fc) cutoff', cutoff)
+            table.insert(2, 'FC criterion', SWEEP_CRITERION)
+            tables.append(table)
+        combined[db] = pd.concat(tables, ignore_index=True)
+        writer.write(combined[db], f"{projectname}_{db}_FC_sweep", done=done)
+        print(f"Varredura de FC de {analysis} concluída.")
+        logging.info(f"Varredura de FC de {analysis} concluída: {len(combined[db])} termos enriquecidos "
+                     f"(genes com {SWEEP_CRITERION}).")
+    return combined
+
+
+def analyze_contrast(context, case, reference, deps_dataframe):
+    """Tabelas, volcano plot e enriquecimento de um contraste (executada pelo pool de contrastes).
+
+    As saídas ficam em tables/<contraste> e plots/<contraste>: a tabela de todas as
+    proteínas testadas, as DEPs (p-valor ajustado <= pvalue_cutoff) e as DEPs
+    filtradas pelo cutoff de FC. Retorna os caminhos das tabelas escritas.
+    """
+    (tablesdir, plotsdir, projectname, log2fc_cutoff, proteins, formats, databases, datadir,
+     fc_cutoff, pvalue_cutoff) = context
+    from contrasts import contrast_name
+    from enrichment import EnrichmentResult, ora_enrichment
+    from libraries import load_gene_set_libraries
+    from tables import write_table
+
+    name = contrast_name(case, reference)
+    tables_dir = os.path.join(tablesdir, name)
+    plots_dir = os.path.join(plotsdir, name)
+    os.makedirs(tables_dir, exist_ok=True)
+    os.makedirs(plots_dir, exist_ok=True)
+    title = f"{projectname}_{name}"
+
+    # Todas as proteínas testadas; as DEPs são as significativas, como as do OmicScope na análise principal
+    significant = deps_dataframe[deps_dataframe['pAdjusted'] <= pvalue_cutoff]
+    written = write_table(deps_dataframe, "Proteínas testadas", tables_dir, formats)
+    written += write_table(significant, "DEPs", tables_dir, formats)
+    written += write_table(filter_deps_dataframe(log2fc_cutoff, significant), "DEPs filtradas", tables_dir, formats)
+    create_volcano_plot(deps_dataframe, log2fc_cutoff, pvalue_cutoff, plots_dir, f"{title}_Volcano_plot",
+                        proteins=proteins)
+
+    # Mesmos critérios de query_from_omicscope, aplicados às DEPs do contraste
+    regulated = deps_dataframe[(deps_dataframe['log2(fc)'].abs() >= fc_cutoff) &
+                               (deps_dataframe['pAdjusted'] <= pvalue_cutoff)]
+    genes = list(regulated['gene_name'].dropna())
+    foldchange = dict(zip(deps_dataframe.gene_name.str.upper(), deps_dataframe['log2(fc)']))
+    libraries = load_gene_set_libraries([db for db, _, _ in databases], datadir)
+    tables = ora_enrichment(libraries, genes, foldchange)
+    for db, _, plot_title in databases:
+        plot_enrichment_data(EnrichmentResult(tables[db], [db], 'ORA'), "dotplot", plots_dir, title, plot_title)
+        written += write_table(tables[db], f"{title}_{db}", tables_dir, formats)
+    logging.info(f"Contraste {name}: {len(deps_dataframe)} proteínas, {len(genes)} genes regulados.")
+    return written
+
+
+def enrichment_tables(rawfiledata, databases, enrichment_results, method):
+    """Tabelas de enriquecimento dos bancos, a partir dos resultados de run_enrichment desta execução.
+
+    Os bancos pulados por checkpoints são testados novamente em memória, sem
+    reescrever tabelas nem gráficos.
+    """
+    tables = {db: table for db, (_, table) in enrichment_results.items()}
+    missing = [(db, analysis) for db, analysis, _ in databases if db not in tables]
+    if missing:
+        options = {"permutations": GSEA_PERMUTATIONS, "seed": GSEA_SEED} if method == "gsea" else {}
+        results = ANALYSES[method].load()(rawfiledata, missing, DATA_DIR, **options)
+        tables.update({db: table for db, (_, table) in results.items()})
+        enrichment_results.update(results)
+    return {db: tables[db] for db, _, _ in databases}
+
+
+@instrumented("reduce_enrichment_redundancy",
+              sizes=lambda reduced, rawfiledata, databases, tables, *args, **kwargs: {
+                  "databases": len(databases), "terms": sum(len(df) for df in tables.values()),
+                  "representatives": sum(len(df) for df in reduced.values())})
+def reduce_enrichment_redundancy(rawfiledata, databases, tables, datadir, plotsdir, projectname, writer,
+                                 method="ora", threshold=None, done=None):
+    """Agrupa os termos redundantes de cada banco e gera a tabela de termos representativos e o dotplot reduzido.
+
+    A similaridade entre os termos é a de Jaccard entre seus conjuntos gênicos em
+    data/ (ver redundancy.py). A tabela tem o sufixo _representativos e o dotplot o
+    prefixo <projeto>_representativos, ao lado das saídas do enriquecimento.
+
+    Args:
+        databases: lista de tuplas (banco, descrição da análise, título do gráfico).
+        tables: dicionário banco -> tabela de enriquecimento (ver enrichment_tables).
+        threshold: similaridade mínima para agrupar dois termos (padrão: TERM_SIMILARITY).
+        done: função done(banco, arquivos) chamada quando a tabela de um banco foi escrita.
+
+    Returns:
+        dicionário banco -> tabela de termos representativos.
+    """
+    from enrichment import EnrichmentResult
+    from libraries import load_gene_set_libraries
+    from redundancy import reduce_redundancy
+
+    libraries = load_gene_set_libraries([db for db, _, _ in databases], datadir)
+    reduced = reduce_redundancy(libraries, {db: tables[db] for db, _, _ in databases}, datadir,
+                                TERM_SIMILARITY if threshold is None else threshold)
+    for db, analysis, title in databases:
+        print(f"Termos de {analysis}: {len(tables[db])} agrupados em {len(reduced[db])} representativos.")
+        if len(reduced[db]):
+            plot_enrichment_data(EnrichmentResult(reduced[db], [db], 'ORA', rawfiledata), "dotplot", plotsdir,
+                                 f"{projectname}_representativos", f"{title} (representativos)")
+        writer.write(reduced[db], f"{enrichment_table_name(projectname, db, method)}_representativos",
+                     done=None if done is None else lambda written, db=db: done(db, written))
+    return reduced
+
+
+@instrumented("store_results")
+def store_results(directory, project_name, rawfilepath, method, control, rawfiledata, deps_dataframe,
+                  log2fc_cutoff, databases, enrichment_results, enrichment_method, data_fingerprint=None):
+    """Acrescenta as DEPs e o enriquecimento do projeto ao banco de resultados (ver results_store.py).
+
+    Os bancos cujo enriquecimento foi pulado por checkpoints nesta execução são
+    testados novamente em memória, sem reescrever tabelas nem gráficos. Sem o
+    cutoff de FC do usuário, a regulação usa o cutoff do próprio OmicScope.
+    Falhas do banco não interrompem a análise: apenas um aviso é registrado.
+
+    Returns:
+        True se os resultados foram gravados.
+    """
+    from results_store import RESULTS_STORE_PATH, publish_run
+    from symbols import load_aliases
+
+    tables = enrichment_tables(rawfiledata, databases, enrichment_results, enrichment_method)
+
+    run = {"project": project_name, "directory": directory, "dataset": data_fingerprint,
+           "source": os.path.abspath(rawfilepath.strip().strip('"')), "method": method, "control": control,
+           "conditions": list(rawfiledata.Conditions),
+           "log2fc_cutoff": log2fc_cutoff if log2fc_cutoff is not None else rawfiledata.FoldChange_cutoff,
+           "pvalue_column": rawfiledata.pvalue, "pvalue_cutoff": rawfiledata.PValue_cutoff,
+           "enrichment_method": enrichment_method}
+    print("Gravando os resultados no banco de resultados...")
+    try:
+        publish_run(run, deps_dataframe, tables, load_aliases(DATA_DIR))
+    except Exception as error:
+        print(f"Não foi possível gravar os resultados no banco {RESULTS_STORE_PATH}: {error}")
+        logging.warning(f"Não foi possível gravar os resultados no banco {RESULTS_STORE_PATH}: {error}")
+        return False
+    return True
+
+
+def dataset_fingerprint(rawfilepath, method, control, pdata=None):
+    """Impressão digital dos dados de entrada (conteúdo do arquivo e da pdata, método e grupo controle).
+
+    Retorna None se algum arquivo não puder ser lido; nesse caso nenhuma etapa é pulada.
+    """
+    from dataset_cache import dataset_key, file_digest
+
+    try:
+        return dataset_key(file_digest(rawfilepath.strip().strip('"')), method, control,
+                           file_digest(pdata.strip().strip('"')) if pdata else None)
+    except OSError:
+        return None
+
+
+def stage_done(checkpoints, stage, digest):
+    """Indica se a etapa já foi concluída com as mesmas entradas e pode ser pulada."""
+    if checkpoints.done(stage, digest):
+        print(f"Etapa {stage} já concluída, pulada.")
+        logging.info(f"Etapa {stage} já concluída com as mesmas entradas (checkpoints.json), pulada.")
+        return True
+    return False
+
+
+def create_table_file(dataframe, name, tablesdir, formats=None):
+    """Escreve a tabela em tablesdir nos formatos pedidos (padrão: TABLE_FORMATS)."""
+    from tables import write_table
+
+    write_table(dataframe, name, tablesdir, formats or TABLE_FORMATS)
 
 
 def filter_deps_dataframe(cutoff, dataframe):
@@ -325,21 +736,557 @@ def create_json_file(dictionary, name, tablesdir):
     filename = os.path.join(tablesdir, f"{name}.json")
     with open(filename, "w+") as js:
         json.dump(dictionary, js)
+    return filename
+
+def read_proteins_list(proteins=None):
+    """Retorna as proteínas a serem apontadas em um gráfico, solicitando-as ao usuário se não forem informadas."""
+    if proteins is None:
+        proteins_string = input("Insira as proteínas que deseja apontar no gráfico, separadas por vírgula. Certifique-se de que as proteínas indicadas estão na tabela, e que estão escritas exatamente como estão na tabela: ").upper()
+    else:
+        # Listas informadas já vêm na grafia da tabela (ver resolve_proteins)
+        proteins_string = ",".join(str(p) for p in proteins)
+    # Remove aspas simples e duplas se o usuário as inserir
+    proteins_list = [p.strip().strip("'").strip('"') for p in proteins_string.split(',') if p.strip()]
+    return proteins_string, proteins_list
 
-@contextmanager
-def change_dir(datadir):
+
+def protein_symbols(rawfiledata):
+    """Índice dos símbolos gênicos quantificados, usado para validar as proteínas dos gráficos."""
+    from symbols import SymbolIndex, load_aliases
+
+    return SymbolIndex(rawfiledata.quant_data['gene_name'], load_aliases(DATA_DIR))
+
+
+def resolve_proteins(proteins_list, symbols, analysis):
+    """Converte as proteínas para a grafia da tabela, descartando (com um aviso) as não localizadas."""
+    found, missing = symbols.resolve(proteins_list)
+    if missing:
+        print(f"Proteína(s) não localizada(s), ignorada(s) no {analysis}: {', '.join(missing)}")
+        logging.warning(f"Proteína(s) não localizada(s), ignorada(s) no {analysis}: {', '.join(missing)}")
+    return found
+
+
+def ask_plot_proteins(symbols=None, required=False):
+    """Solicita as proteínas de um gráfico até que todas sejam localizadas em symbols (SymbolIndex)."""
+    while True:
+        _, proteins_list = read_proteins_list()
+        missing = []
+        if symbols is not None:
+            proteins_list, missing = symbols.resolve(proteins_list)
+        if missing:
+            print(f"Proteína(s) inserida(s) não localizada(s): {', '.join(missing)}")
+            logging.error(f"Proteína(s) inserida(s) não localizada(s): {', '.join(missing)}")
+        elif proteins_list or not required:
+            return proteins_list
+        else:
+            print("Insira ao menos uma proteína para este gráfico.")
+
+
+def plot_proteins(proteins, plot):
+    """Seleciona as proteínas de um gráfico a partir de uma lista única ou de um dicionário por gráfico."""
+    if isinstance(proteins, dict):
+        return proteins.get(plot, [])
+    return proteins
+
+
+def ask_fc_input():
+    """Solicita ao usuário o valor de FC até que algum valor seja inserido."""
+    while True:
+        fc_input = input(
+            "Insira o valor de FC que você deseja para calcular o cutoff dos DEPs (1, 1.25, 1.5, 1.75, 2): ")
+        if not fc_input:
+            print("Insira um valor de FC para continuar.")
+            logging.warning("Nenhum valor de FC inserido. Por favor, insira um valor para continuar.")
+            continue
+        return fc_input
+
+
+def parse_fc_cutoff(fc_input):
+    """Converte o valor de FC no cutoff de log2(fc). Levanta ValueError para valores inválidos."""
     try:
-        cwd = os.getcwd()
-        os.chdir(datadir)
-        yield
-    finally:
-        os.chdir(cwd)
+        fc = float(fc_input)
+    except ValueError:
+        logging.error(f"Valor de FC inválido: {fc_input}")
+        raise ValueError(f"Valor de FC inválido: {fc_input}")
+    if fc <= 0:
+        logging.error(f"Valor de FC selecionado < 0: {fc_input}. O valor deve ser maior que 0.")
+        raise ValueError("FC deve ser maior que zero.")
+    return math.log2(fc)
+
+
+def collect_plot_requests(proteins=None, palette=None, symbols=None, plots=None):
+    """Monta a lista de gráficos do projeto, na ordem de PLOTS.
+
+    plots restringe os gráficos gerados (tipos de PLOTS; padrão: todos).
+
+    As proteínas e paletas não informadas são solicitadas ao usuário antes da
+    renderização, para que os gráficos possam ser gerados em paralelo.
+
+    Se symbols (SymbolIndex, ou função que o retorna, chamada apenas quando há
+    proteínas a validar) for informado, as proteínas são validadas antes da
+    renderização e convertidas para a grafia da tabela, resolvendo maiúsculas e
+    símbolos antigos. No modo interativo as proteínas não localizadas são
+    solicitadas novamente; com proteínas informadas, elas são descartadas.
+    """
+    index = {}
+
+    def symbol_index():
+        if symbols is not None and "symbols" not in index:
+            index["symbols"] = symbols() if callable(symbols) else symbols
+        return index.get("symbols")
+
+    requests = []
+    for analysis_type, analysis, message, weight in PLOTS:
+        if plots is not None and analysis_type not in plots:
+            continue
+        request = {"analysis_type": analysis_type, "analysis": analysis, "weight": weight}
+        if analysis_type in PROTEIN_PLOTS:
+            if proteins is None:
+                print(message)
+                proteins_list = ask_plot_proteins(symbol_index(), required=analysis_type in PALETTE_PLOTS)
+            else:
+                _, proteins_list = read_proteins_list(plot_proteins(proteins, analysis_type))
+                if proteins_list and symbols is not None:
+                    proteins_list = resolve_proteins(proteins_list, symbol_index(), analysis)
+            request["proteins"] = proteins_list
+        if analysis_type in PALETTE_PLOTS:
+            selected_palette = palette
+            if selected_palette is None:
+                selected_palette = input("Insira a paleta desejada (pressione enter para utilizar a paleta de cores padrão): ")
+            request["palette"] = selected_palette
+        requests.append(request)
+    return requests
+
+
+def render_plot_request(context, request):
+    """Gera um gráfico a partir de uma requisição de collect_plot_requests (executada pelo pool de renderização).
+
+    Retorna os arquivos gerados (None para o volcano plot, cujos arquivos já estão na requisição).
+    """
+    rawfiledata, deps_dataframe, titlename, plotsdir, log2fc_cutoff, figures = context
+    print(f"Iniciando plotagem de {request['analysis']}...")
+    if request["analysis_type"] == "volcano":
+        create_volcano_plot(deps_dataframe, log2fc_cutoff, 0.05, plotsdir, f"{titlename}_Volcano_plot",
+                            proteins=request["proteins"], figures=figures)
+        return None
+    return plot_data(rawfiledata, request["analysis_type"], titlename, plotsdir, request["analysis"],
+                     proteins=request.get("proteins"), palette=request.get("palette"), figures=figures)
+
+
+def report_plot_results(results, context, interactive=False, symbols=None):
+    """Registra o resultado de cada gráfico.
+
+    No modo interativo, os gráficos com proteínas que falharam são refeitos
+    solicitando novamente as proteínas ao usuário (validadas em symbols, se informado).
+    """
+    failures = 0
+    for request, error, duration in results:
+        if error is None:
+            logging.info(f"{request['analysis']} gerado em {duration:.1f} s")
+            continue
+        print(f"Falha ao gerar {request['analysis']}: {error}")
+        logging.error(f"Falha ao gerar {request['analysis']}: {error}")
+        if interactive and request["analysis_type"] in PROTEIN_PLOTS:
+            rawfiledata, deps_dataframe, titlename, plotsdir, log2fc_cutoff, figures = context
+            proteins_list = ask_plot_proteins(symbols, required=request["analysis_type"] in PALETTE_PLOTS)
+            if request["analysis_type"] == "volcano":
+                create_volcano_plot(deps_dataframe, log2fc_cutoff, 0.05, plotsdir, f"{titlename}_Volcano_plot",
+                                    proteins=proteins_list, figures=figures)
+            else:
+                plot_data(rawfiledata, request["analysis_type"], titlename, plotsdir, request["analysis"],
+                          proteins=proteins_list, palette=request.get("palette"), figures=figures)
+            continue
+        failures += 1
+    print(f"{len(results) - failures} de {len(results)} gráficos gerados.")
+    logging.info(f"{len(results) - failures} de {len(results)} gráficos gerados.")
+
+
+def run_analysis(directory, project_name, raw_file_path, proteomics_method, control_group,
+                 fc=None, proteins=None, palette=None, enrichment_workers=None, enrichment_executor=None,
+                 plot_workers=None, table_formats=None, profile=None, fc_sweep=None, enrichment_method=None,
+                 contrasts=None, contrast_workers=None, only=None, skip=None, pdata=None):
+    """Executa a análise completa de um conjunto de dados em um diretório de projeto já criado.
+
+    Parâmetros deixados como None são solicitados ao usuário durante a análise,
+    como no modo interativo. Para execução sem interação (modo batch), informe
+    todos eles.
+
+    Args:
+        directory: diretório do projeto, criado por create_dir.
+        pdata: arquivo de fenótipo exigido na leitura de exportações do MaxQuant e do
+            DIA-NN (ver read_proteomics_file).
+        fc: valor de FC usado no cutoff das DEPs.
+        proteins: lista de proteínas apontadas em todos os gráficos, ou dicionário
+            gráfico -> lista com as chaves "dynamic_range", "volcano", "ma_plot",
+            "conditions_barplot" e "conditions_boxplot".
+        palette: paleta dos gráficos de comparação de proteínas entre condições.
+        enrichment_workers, enrichment_executor: configuração do enriquecimento paralelo.
+        enrichment_method: "ora" (padrão: PROTEOANALYZER_ENRICHMENT_METHOD) ou "gsea",
+            o enriquecimento preranked por log2(fc), com GSEA_PERMUTATIONS permutações.
+        contrasts: "control" (cada condição contra o controle) ou "pairwise" (todos os pares).
+            As DEPs, o volcano plot e o enriquecimento de cada contraste são gerados em
+            tables/<contraste> e plots/<contraste> (ver contrasts.py).
+        contrast_workers: número de processos da análise de contrastes (padrão: CONTRAST_WORKERS).
+        plot_workers: número de processos usados na renderização dos gráficos.
+        table_formats: formatos das tabelas ("csv", "tsv", "parquet", "feather", "xlsx").
+            As tabelas são escritas em segundo plano enquanto as etapas seguintes executam.
+        profile: etapas perfiladas com cProfile (ex: ["plot_data[heatmap]"]). Padrão:
+            PROTEOANALYZER_PROFILE. Tempos, memória e tamanhos de todas as etapas são
+            gravados em metrics.json, ao lado do app.log.
+        fc_sweep: valores de FC (ex: [1, 1.25, 1.5, 1.75, 2]) analisados em uma única
+            passada ao final, com tabelas de DEPs e de enriquecimento por valor (ver run_fc_sweep).
+        only, skip: etapas executadas/puladas, por grupo ("tables", "plots", "enrichment",
+            "redundancy", "contrasts", "fc_sweep", "store") ou por nome (tabela, tipo de gráfico ou banco), ver
+            stage_names. As etapas puladas não alteram os checkpoints.
+
+    Os termos redundantes do enriquecimento (REDUNDANCY_DATABASES) são agrupados
+    em uma tabela de termos representativos e um dotplot reduzido (ver redundancy.py).
+    Ao final, as DEPs e o enriquecimento são acrescentados ao banco de resultados
+    compartilhado entre projetos (etapa "store", ver results_store.py).
+
+    Cada etapa concluída é registrada em checkpoints.json (ver checkpoints.py). Em um
+    projeto retomado (create_dir com resume=True), as etapas cujas entradas não mudaram
+    são puladas, e os dados só são lidos se alguma etapa precisar ser refeita.
+    """
+    selected = StageSelection(only, skip, stage_names())
+    tables_dir = os.path.join(directory, "tables")
+    plots_dir = os.path.join(directory, "plots")
+    checkpoints = Checkpoints(directory)
+    start_metrics(directory, profile)
+    # Importações feitas antes da análise (início do programa) e a do pandas, usado por todas as tabelas
+    flush_import_records()
+    pd = import_module("pandas")
+    from tables import TableWriter
+
+    writer = TableWriter(tables_dir, table_formats or TABLE_FORMATS)
+
+    # Impressão digital dos dados, da qual dependem todas as etapas seguintes
+    data_fingerprint = dataset_fingerprint(raw_file_path, proteomics_method, control_group, pdata)
+    loaded = {}
+
+    def dataset():
+        # Os dados só são lidos quando alguma etapa precisa ser refeita
+        if not loaded:
+            print("Lendo o arquivo de dados...")
+            logging.info("Lendo o arquivo de dados...")
+            loaded["data"] = read_proteomics_file(raw_file_path, proteomics_method, control_group, pdata=pdata)
+            loaded["deps"] = pd.DataFrame(loaded["data"].deps)
+            logging.info("Arquivo de dados lido com sucesso.")
+        return loaded["data"]
+
+    def deps_table():
+        dataset()
+        return loaded["deps"]
+
+    def symbols():
+        if "symbols" not in loaded:
+            loaded["symbols"] = protein_symbols(dataset())
+        return loaded["symbols"]
+
+    def write_stage_table(stage, build, name, message):
+        if not selected("tables", stage):
+            return
+        print(message)
+        logging.info(message)
+        digest = fingerprint(stage, data_fingerprint, writer.formats)
+        if not stage_done(checkpoints, stage, digest):
+            writer.write(build(), name, done=lambda written: checkpoints.complete(stage, digest, written))
+
+    # Lendo os parÂmetros e salvando-os em um arquivo
+    write_stage_table("params", lambda: pd.DataFrame(dataset().Params), "Parâmetros",
+                      "Criando tabela de parâmetros...")
+
+    # Criando arquivo json com as condições do estudo
+    conditions_digest = fingerprint("conditions", data_fingerprint)
+    if selected("tables", "conditions"):
+        print("Criando arquivo de condições do estudo...")
+        logging.info("Criando arquivo de condições do estudo...")
+    if selected("tables", "conditions") and not stage_done(checkpoints, "conditions", conditions_digest):
+        raw_file_data = dataset()
+        conditions_dictionary = {"Grupos": f"{raw_file_data.Conditions}",
+                                 "Controle": f"{raw_file_data.ControlGroup}"}
+        conditions_path = create_json_file(conditions_dictionary, "Condições do estudo", tables_dir)
+        checkpoints.complete("conditions", conditions_digest, [conditions_path])
+        logging.info(f"Grupos identificados no estudo: {raw_file_data.Conditions}")
+        logging.info(f"Grupo controle selecionado: {raw_file_data.ControlGroup}")
+
+    # Criando tabela com os dados brutos
+    write_stage_table("raw_data", lambda: pd.DataFrame(dataset().quant_data), "Dados brutos",
+                      "Criando tabela de dados brutos...")
+
+    # Criando tabela com as DEPs
+    write_stage_table("deps", deps_table, "DEPs", "Criando tabela de DEPs...")
+
+    # Obtendo as DEPs com significância para o estudo (o cutoff só é solicitado se alguma etapa o usa)
+    log2fc_cutoff = None
+    if selected("tables", "fc_filter") or selected("plots", "volcano") or (contrasts and selected("contrasts")):
+        if fc is None:
+            fc = ask_fc_input()
+        log2fc_cutoff = parse_fc_cutoff(fc)
+    filter_digest = fingerprint("fc_filter", data_fingerprint, log2fc_cutoff, writer.formats)
+    if selected("tables", "fc_filter") and not stage_done(checkpoints, "fc_filter", filter_digest):
+        significant_deps_dataframe = filter_deps_dataframe(log2fc_cutoff, deps_table())
+        writer.write(significant_deps_dataframe, "DEPs filtradas",
+                     done=lambda written: checkpoints.complete("fc_filter", filter_digest, written))
+        logging.info(f"DEPs filtradas com log2(fc) > {log2fc_cutoff:.2f}")
+
+    # Plotando os gráficos
+    print("Gerando gráficos...")
+    logging.info("Gerando gráficos...")
+    plot_requests = []
+    for request in collect_plot_requests(proteins, palette, symbols,
+                                         [plot for plot, _, _, _ in PLOTS if selected("plots", plot)]):
+        stage = f"plot[{request['analysis_type']}]"
+        if request["analysis_type"] == "volcano":
+            # Apenas o volcano plot depende do cutoff de FC
+            request["digest"] = fingerprint(stage, data_fingerprint, request, log2fc_cutoff, VOLCANO_FORMATS)
+            request["outputs"] = [os.path.join(plots_dir, f"{project_name}_Volcano_plot.{image_format.strip().lower()}")
+                                  for image_format in VOLCANO_FORMATS]
+        else:
+            # Os arquivos são registrados após a renderização (ver render_plot_request)
+            plot = ANALYSES[request["analysis_type"]]
+            request["digest"] = fingerprint(stage, data_fingerprint, request, FIGURE_DPI,
+                                            plot.settings() if plot.settings else {})
+            request["outputs"] = []
+        if not stage_done(checkpoints, stage, request["digest"]):
+            plot_requests.append(request)
+    if plot_requests:
+        from figure_cache import FigureCache
+        from rendering import render_plots
+
+        # Gráficos já renderizados para este conjunto de dados são copiados do cache de figuras
+        figures = FigureCache(data_fingerprint) if FIGURE_CACHE and data_fingerprint else None
+        render_context = (dataset(), deps_table(), project_name, plots_dir, log2fc_cutoff, figures)
+        results = render_plots(render_plot_request, render_context, plot_requests, plot_workers or PLOT_WORKERS)
+        for request, error, _ in results:
+            if error is None:
+                checkpoints.complete(f"plot[{request['analysis_type']}]", request["digest"], request["outputs"])
+        report_plot_results(results, render_context, interactive=proteins is None, symbols=symbols())
+
+    print("Plotagem dos dados concluída.")
+    logging.info("Plotagem dos dados concluída.")
+
+    # Enriquecimento dos dados
+    # KEGG, GO (BP, CC, MF), Reactome, OMIM e DisGeNET
+    # O ORA usa o cutoff de FC do próprio OmicScope e o GSEA o ranking completo, de modo
+    # que o enriquecimento não depende do filtro acima
+    enrichment_databases = [database for database in ENRICHMENT_DATABASES if selected("enrichment", database[0])]
+    enrichment_method = enrichment_method or ENRICHMENT_METHOD
+    enrichment_results = {}
+    if enrichment_databases:
+        from libraries import library_stamp
+        from symbols import aliases_stamp
+
+        print("Iniciando enriquecimento dos dados...")
+        logging.info("Iniciando enriquecimento dos dados...")
+        method_inputs = [enrichment_method, GSEA_PERMUTATIONS, GSEA_SEED] if enrichment_method == "gsea" else []
+        enrichment_digests = {db: fingerprint(f"enrichment[{db}]", data_fingerprint, library_stamp(db, DATA_DIR),
+                                              [aliases_stamp(DATA_DIR)], writer.formats, *method_inputs)
+                              for db, _, _ in enrichment_databases}
+        databases = [database for database in enrichment_databases
+                     if not stage_done(checkpoints, f"enrichment[{database[0]}]", enrichment_digests[database[0]])]
+        if databases:
+            enrichment_results = run_enrichment(dataset(), databases, DATA_DIR, plots_dir, tables_dir, project_name,
+                           enrichment_workers or ENRICHMENT_WORKERS, enrichment_executor or ENRICHMENT_EXECUTOR,
+                           writer=writer,
+                           done=lambda db, written: checkpoints.complete(f"enrichment[{db}]",
+                                                                         enrichment_digests[db], written),
+                           method=enrichment_method, permutations=GSEA_PERMUTATIONS, seed=GSEA_SEED)
+
+        print("Enriquecimento dos dados concluído.")
+        logging.info("Enriquecimento dos dados concluído.")
+
+    # Redução de redundância dos termos enriquecidos (por padrão, os bancos do GO)
+    redundancy_databases = [database for database in ENRICHMENT_DATABASES
+                            if database[0] in REDUNDANCY_DATABASES and selected("redundancy", database[0])]
+    if redundancy_databases:
+        from libraries import library_stamp
+        from symbols import aliases_stamp
+
+        method_inputs = [enrichment_method, GSEA_PERMUTATIONS, GSEA_SEED] if enrichment_method == "gsea" else []
+        redundancy_digests = {db: fingerprint(f"redundancy[{db}]", data_fingerprint, library_stamp(db, DATA_DIR),
+                                              [aliases_stamp(DATA_DIR)], TERM_SIMILARITY, writer.formats,
+                                              *method_inputs)
+                              for db, _, _ in redundancy_databases}
+        databases = [database for database in redundancy_databases
+                     if not stage_done(checkpoints, f"redundancy[{database[0]}]", redundancy_digests[database[0]])]
+        if databases:
+            print("Agrupando termos redundantes do enriquecimento...")
+            logging.info("Agrupando termos redundantes do enriquecimento...")
+            reduce_enrichment_redundancy(dataset(), databases,
+                                         enrichment_tables(dataset(), databases, enrichment_results,
+                                                           enrichment_method),
+                                         DATA_DIR, plots_dir, project_name, writer, enrichment_method,
+                                         done=lambda db, written: checkpoints.complete(f"redundancy[{db}]",
+                                                                                       redundancy_digests[db],
+                                                                                       written))
+
+    # Contrastes entre as condições do estudo (as condições só são conhecidas após a leitura dos dados)
+    if contrasts and selected("contrasts"):
+        from contrasts import contrast_name, contrast_pairs, run_contrasts
+        from libraries import library_stamp
+        from symbols import aliases_stamp
+
+        raw_file_data = dataset()
+        pairs = contrast_pairs(raw_file_data.Conditions, raw_file_data.ControlGroup, contrasts)
+        volcano_proteins = resolve_proteins(plot_proteins(proteins or [], "volcano"), symbols(), "volcano plot")
+        contrast_digests = {pair: fingerprint(f"contrast[{contrast_name(*pair)}]", data_fingerprint, log2fc_cutoff,
+                                              volcano_proteins, writer.formats, VOLCANO_FORMATS,
+                                              [library_stamp(db, DATA_DIR) for db, _, _ in ENRICHMENT_DATABASES],
+                                              [aliases_stamp(DATA_DIR)])
+                            for pair in pairs}
+        pending = [pair for pair in pairs
+                   if not stage_done(checkpoints, f"contrast[{contrast_name(*pair)}]", contrast_digests[pair])]
+        if pending:
+            print(f"Analisando {len(pending)} contraste(s)...")
+            logging.info(f"Analisando os contrastes: {', '.join(contrast_name(*pair) for pair in pending)}")
+            contrast_context = (tables_dir, plots_dir, project_name, log2fc_cutoff, volcano_proteins,
+                                writer.formats, ENRICHMENT_DATABASES, DATA_DIR,
+                                raw_file_data.FoldChange_cutoff, raw_file_data.PValue_cutoff)
+            results = run_contrasts(analyze_contrast, contrast_context, raw_file_data, pending,
+                                    contrast_workers or CONTRAST_WORKERS)
+            for pair, written, error, duration in results:
+                name = contrast_name(*pair)
+                if error is None:
+                    checkpoints.complete(f"contrast[{name}]", contrast_digests[pair], written)
+                    logging.info(f"Contraste {name} concluído em {duration:.1f} s")
+                else:
+                    print(f"Falha no contraste {name}: {error}")
+                    logging.error(f"Falha no contraste {name}: {error}")
+
+    # Varredura de vários valores de FC
+    if fc_sweep and selected("fc_sweep"):
+        from libraries import library_stamp
+        from symbols import aliases_stamp
+
+        sweep_digest = fingerprint("fc_sweep", data_fingerprint, sorted(float(value) for value in fc_sweep),
+                                   [library_stamp(db, DATA_DIR) for db, _, _ in ENRICHMENT_DATABASES],
+                                   [aliases_stamp(DATA_DIR)], writer.formats, SWEEP_CRITERION)
+        if not stage_done(checkpoints, "fc_sweep", sweep_digest):
+            print("Iniciando varredura de FC...")
+            logging.info("Iniciando varredura de FC...")
+            sweep_outputs = []
+            run_fc_sweep(dataset(), deps_table(), fc_sweep, ENRICHMENT_DATABASES, DATA_DIR, tables_dir,
+                         project_name, writer=TableWriter(tables_dir, writer.formats, background=False),
+                         done=sweep_outputs.extend)
+            checkpoints.complete("fc_sweep", sweep_digest, sweep_outputs)
+
+    # DEPs e enriquecimento acrescentados ao banco de resultados compartilhado entre projetos
+    if RESULTS_STORE and selected("store"):
+        from libraries import library_stamp
+        from symbols import aliases_stamp
+
+        store_digest = fingerprint("store", data_fingerprint, log2fc_cutoff, enrichment_method,
+                                   [db for db, _, _ in enrichment_databases],
+                                   [library_stamp(db, DATA_DIR) for db, _, _ in enrichment_databases],
+                                   [aliases_stamp(DATA_DIR)])
+        if not stage_done(checkpoints, "store", store_digest):
+            if store_results(directory, project_name, raw_file_path, proteomics_method, control_group, dataset(),
+                             deps_table(), log2fc_cutoff, enrichment_databases, enrichment_results,
+                             enrichment_method, data_fingerprint):
+                checkpoints.complete("store", store_digest)
+
+    # Aguardando a escrita das tabelas em segundo plano
+    writer.close()
+    logging.info(f"Tabelas escritas em {tables_dir} ({', '.join(writer.formats)}).")
+    stop_metrics()
+    print("Análise dos dados concluída com sucesso!")
+    logging.info("Análise dos dados concluída com sucesso!")
+
 
 # ---------------------------------------------------------------------------------#
 WORKING_DIR = os.getcwd()
-DATA_DIR = os.path.join(WORKING_DIR, "data")
+# As bibliotecas são localizadas pelo caminho absoluto, independente do diretório de trabalho
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+VALID_METHODS = ['MaxQuant', 'Progenesis', 'General', 'DIA-NN', 'PatternLab']
+
+# Renderização dos gráficos: número de processos (1 = serial, no processo principal)
+PLOT_WORKERS = int(os.environ.get("PROTEOANALYZER_PLOT_WORKERS", "1"))
+
+# Gráficos do projeto, registrados em analyses.py: (tipo, descrição, mensagem, custo relativo de renderização)
+PLOTS = [(plot.name, plot.description, plot.message, plot.weight) for plot in analyses("plot")]
+PROTEIN_PLOTS = {plot.name for plot in analyses("plot") if plot.proteins}
+PALETTE_PLOTS = {plot.name for plot in analyses("plot") if plot.palette}
+
+# Cache dos conjuntos de dados analisados pelo OmicScope (PROTEOANALYZER_DATASET_CACHE=0 desabilita)
+DATASET_CACHE = os.environ.get("PROTEOANALYZER_DATASET_CACHE", "1") != "0"
+
+# Cache dos gráficos já renderizados (PROTEOANALYZER_FIGURE_CACHE=0 desabilita), ver figure_cache.py
+FIGURE_CACHE = os.environ.get("PROTEOANALYZER_FIGURE_CACHE", "1") != "0"
+
+# Banco de resultados compartilhado entre projetos (PROTEOANALYZER_RESULTS_STORE=0 desabilita), ver results_store.py
+RESULTS_STORE = os.environ.get("PROTEOANALYZER_RESULTS_STORE", "1") != "0"
+
+# Formatos do volcano plot, separados por vírgula: svg, png, pdf
+VOLCANO_FORMATS = os.environ.get("PROTEOANALYZER_VOLCANO_FORMATS", "svg").split(",")
+
+# Critério da varredura de FC, nas DEPs filtradas e nas consultas do enriquecimento de cada valor
+SWEEP_CRITERION = "|log2(fc)| > log2(fc) cutoff"
+
+# Formatos das tabelas, separados por vírgula: csv, tsv, parquet, feather, xlsx (ex: "csv,xlsx")
+TABLE_FORMATS = os.environ.get("PROTEOANALYZER_TABLE_FORMATS", "csv")
+
+# Enriquecimento paralelo: número de workers (1 = serial) e tipo de pool ("process" ou "thread")
+ENRICHMENT_WORKERS = int(os.environ.get("PROTEOANALYZER_ENRICHMENT_WORKERS", "1"))
+ENRICHMENT_EXECUTOR = os.environ.get("PROTEOANALYZER_ENRICHMENT_EXECUTOR", "process")
+
+# Análise de contrastes: número de processos (1 = serial, no processo principal)
+CONTRAST_WORKERS = int(os.environ.get("PROTEOANALYZER_CONTRAST_WORKERS", "1"))
+
+# Método de enriquecimento ("ora" ou "gsea") e permutações/semente da distribuição nula do GSEA
+ENRICHMENT_METHOD = os.environ.get("PROTEOANALYZER_ENRICHMENT_METHOD", "ora")
+GSEA_PERMUTATIONS = int(os.environ.get("PROTEOANALYZER_GSEA_PERMUTATIONS", "1000"))
+GSEA_SEED = int(os.environ.get("PROTEOANALYZER_GSEA_SEED", "42"))
+
+# Bancos de enriquecimento: (biblioteca em data/, descrição da análise, título do gráfico)
+ENRICHMENT_DATABASES = [
+    ('KEGG_2021_Human', "vias KEGG", "Kegg Pathways"),
+    ('GO_Biological_Process_2025', "processo biológico", "GO: Processo Biológico"),
+    ('GO_Cellular_Component_2025', "componente celular", "GO: Componente celular"),
+    ('GO_Molecular_Function_2025', "função molecular", "GO: Função molecular"),
+    ('Reactome_Pathways_2024', "vias reactome", "Reactome"),
+    ('OMIM_Expanded', "vias OMIM", "OMIM"),
+    ('DisGeNET', "vias DisGeNET", "DisGeNET"),
+]
+
+# Redução de redundância: bancos agrupados e similaridade de Jaccard mínima entre dois termos do mesmo grupo
+REDUNDANCY_DATABASES = os.environ.get("PROTEOANALYZER_REDUNDANCY_DATABASES",
+                                      "GO_Biological_Process_2025,GO_Cellular_Component_2025,"
+                                      "GO_Molecular_Function_2025").split(",")
+TERM_SIMILARITY = float(os.environ.get("PROTEOANALYZER_TERM_SIMILARITY", "0.5"))
+
+# Tabelas do projeto, selecionáveis em --only/--skip como os gráficos e os bancos
+TABLE_STAGES = ["params", "conditions", "raw_data", "deps", "fc_filter"]
+
+
+def stage_names():
+    """Nomes aceitos em --only/--skip: grupos de etapas, tabelas, tipos de gráfico e bancos."""
+    return (STAGE_GROUPS + TABLE_STAGES + [plot for plot, _, _, _ in PLOTS]
+            + [db for db, _, _ in ENRICHMENT_DATABASES])
+
+
+def enrichment_methods():
+    """Métodos de enriquecimento registrados (ver analyses.py)."""
+    return [method.name for method in analyses("enrichment")]
+
+
+# Tempo de importação deste módulo (início do programa até o primeiro prompt), gravado no metrics.json
+record_import("main", time.perf_counter() - _IMPORT_STARTED)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Proteoanalyzer: análise interativa de dados de proteômica.")
+    parser.add_argument("--only", default=None,
+                        help=f"Executa apenas estas etapas, separadas por vírgula: grupos ({', '.join(STAGE_GROUPS)}) "
+                             "ou nomes de tabelas, gráficos e bancos (ex: pca,KEGG_2021_Human).")
+    parser.add_argument("--skip", default=None,
+                        help="Pula estas etapas, separadas por vírgula (mesmos nomes de --only).")
+    arguments = parser.parse_args()
+    try:
+        StageSelection(arguments.only, arguments.skip, stage_names())
+    except ValueError as error:
+        parser.error(str(error))
+
     while True:
         try:
             print("Proteoanalyzer 1.0")
@@ -347,12 +1294,7 @@ if __name__ == "__main__":
             user_name = input("Insira o nome do usuário: ")
             project_name = input("Insira um nome para o projeto a ser analisado: ")
             target_directory = input("Insira o caminho onde os arquivos da análise serão criados (ex: C:/Users/user/Documents): ").strip().strip('"')
-            directory = create_dir(target_directory, project_name)
-            tables_dir = os.path.join(directory, "tables")
-            plots_dir = os.path.join(directory, "plots")
-
-            # Configurando o logger
-
+            directory = create_dir(target_directory, project_name, user_name)
 
             print("Diretórios do projeto criados com sucesso.")
             logging.info("Diretórios do projeto criados com sucesso.")
@@ -361,11 +1303,10 @@ if __name__ == "__main__":
             raw_file_path = input("Insira o caminho da planilha com os dados da proteômica (não esqueça de incluir a extensão do arquivo): ").strip()
 
             # Validação do metodo de proteomica
-            valid_methods = ['MaxQuant', 'Progenesis', 'General', 'DIA-NN', 'PatternLab']
             while True:
                 proteomics_method = input("Insira o software de análise dos dados brutos (MaxQuant, Progenesis, General, DIA-NN, PatternLab): ").strip()
-                if proteomics_method not in valid_methods:
-                    print(f"Aviso: Método '{proteomics_method}' pode não ser reconhecido. Métodos válidos: {', '.join(valid_methods)}. Tente novamente.")
+                if proteomics_method not in VALID_METHODS:
+                    print(f"Aviso: Método '{proteomics_method}' pode não ser reconhecido. Métodos válidos: {', '.join(VALID_METHODS)}. Tente novamente.")
                     logging.warning(f"Método de proteômica possivelmente inválido: {proteomics_method}")
                     continue
                 else:
@@ -373,159 +1314,8 @@ if __name__ == "__main__":
 
             control_group = input("Insira o nome do grupo controle, exatamente como está na planilha: ").strip()
 
-            # Lendo os dados e criando os arquivos com as planilhas
-            # Obtendo os dados da proteômica a partir da planilha original
-            print("Lendo o arquivo de dados...")
-            logging.info("Lendo o arquivo de dados...")
-            raw_file_data = read_proteomics_file(raw_file_path, proteomics_method, control_group)
-            logging.info("Arquivo de dados lido com sucesso.")
-
-            # Lendo os parÂmetros e salvando-os em um arquivo
-            print("Criando tabela de parâmetros...")
-            logging.info("Criando tabela de parâmetros...")
-            params_dataframe = pd.DataFrame(raw_file_data.Params)
-            create_xlsx_file(params_dataframe, "Parâmetros", tables_dir)
-
-            # Criando arquivo json com as condições do estudo
-            print("Criando arquivo de condições do estudo...")
-            logging.info("Criando arquivo de condições do estudo...")
-            conditions_dictionary = {"Grupos": f"{raw_file_data.Conditions}",
-                                     "Controle": f"{raw_file_data.ControlGroup}"}
-            create_json_file(conditions_dictionary, "Condições do estudo", tables_dir)
-            logging.info(f"Grupos identificados no estudo: {raw_file_data.Conditions}")
-            logging.info(f"Grupo controle selecionado: {raw_file_data.ControlGroup}")
-
-            # Criando tabela com os dados brutos
-            print("Criando tabela de dados brutos...")
-            logging.info("Criando tabela de dados brutos...")
-            all_data_dataframe = pd.DataFrame(raw_file_data.quant_data)
-            create_xlsx_file(all_data_dataframe, "Dados brutos", tables_dir)
-
-            # Criando tabela com as DEPs
-            print("Criando tabela de DEPs...")
-            logging.info("Criando tabela de DEPs...")
-            deps_dataframe = pd.DataFrame(raw_file_data.deps)
-            create_xlsx_file(deps_dataframe, "DEPs", tables_dir)
-
-            # Obtendo as DEPs com significância para o estudo
-            while True:
-                fc_input = input(
-                    "Insira o valor de FC que você deseja para calcular o cutoff dos DEPs (1, 1.25, 1.5, 1.75, 2): ")
-                if not fc_input:
-                    print("Insira um valor de FC para continuar.")
-                    logging.warning("Nenhum valor de FC inserido. Por favor, insira um valor para continuar.")
-                    continue
-                else:
-                    break
-            try:
-                fc = float(fc_input)
-                if fc <= 0:
-                    logging.error(f"Valor de FC selecionado < 0: {fc_input}. O valor deve ser maior que 0.")
-                    logging.shutdown()
-                    raise ValueError("FC deve ser maior que zero.")
-                log2fc_cutoff = math.log2(fc)
-            except ValueError as e:
-                print(f"Erro: Valor de FC inválido. {str(e)}")
-                logging.error(f"Valor de FC inválido: {fc_input}")
-                continue
-            significant_deps_dataframe = filter_deps_dataframe(log2fc_cutoff, deps_dataframe)
-            create_xlsx_file(significant_deps_dataframe, "DEPs filtradas", tables_dir)
-            logging.info(f"DEPs filtradas com log2(fc) > {log2fc_cutoff:.2f}")
-
-            # Plotando os gráficos
-            print("Gerando gráficos...")
-            logging.info("Gerando gráficos...")
-
-            # Barplot de identificação
-            print("Iniciando plotagem de barplot de identificação das condições...")
-            plot_data(raw_file_data, "id_barplot", project_name, plots_dir,"barplot de identificação")
-
-            # Dynamic range
-            print("Iniciando plotagem de Dynamic Range...")
-            plot_data(raw_file_data, "dynamic_range", project_name, plots_dir,"gráfico de dynamic range")
-
-            # Volcano plot
-            print("Iniciando plotagem de Volcano Plot...")
-            create_volcano_plot(deps_dataframe, log2fc_cutoff, 0.05, plots_dir, f"{project_name}_Volcano_plot")
-
-            # MA plot
-            print("Iniciando plotagem de MA plot...")
-            plot_data(raw_file_data, "ma_plot", project_name, plots_dir, "gráfico de MA")
-
-            # Gráfico de normalização
-            print("Iniciando plotagem de gráfico de normalização...")
-            plot_data(raw_file_data, "normalization_plot", project_name, plots_dir,"gráfico de normalização")
-
-            # Barplot de proteínas entre as condições
-            print("Iniciando plotagem de barplot comparando proteínas entre condições...")
-            plot_data(raw_file_data, "conditions_barplot", project_name, plots_dir, "gráfico barplot de comparação de proteínas entre condições")
-
-            # Boxplot de proteínas entre as condições
-            print("Iniciando plotagem de boxplot comparando proteínas entre condições...")
-            plot_data(raw_file_data, "conditions_boxplot", project_name, plots_dir, "gráfico boxplot de comparação de proteínas entre condições")
-
-            # Heatmap de expressão
-            print("Iniciando plotagem de heatmap de expressão...")
-            plot_data(raw_file_data, "expression_heatmap", project_name, plots_dir,"gráfico heatmap de expressão")
-
-            # Heatmap de correlação
-            print("Iniciando plotagem de heatmap de correlação...")
-            plot_data(raw_file_data, "correlation_heatmap", project_name, plots_dir,"gráfico heatmap de correlação")
-
-            # PCA
-            print("Iniciando plotagem de gráfico de PCA...")
-            plot_data(raw_file_data, "pca", project_name, plots_dir, "gráfico de PCA")
-
-            # K-means
-            print("Iniciando plotagem de gráfico de PCA...")
-            plot_data(raw_file_data, "kmeans", project_name, plots_dir, "gráfico de K-means")
-
-            print("Plotagem dos dados concluída.")
-            logging.info("Plotagem dos dados concluída.")
-
-            # Enriquecimento dos dados
-            print("Iniciando enriquecimento dos dados...")
-            logging.info("Iniciando enriquecimento dos dados...")
-
-            # KEGG
-            kegg_object, kegg_df = perform_ora_enrichment(raw_file_data, 'KEGG_2021_Human', "vias KEGG", DATA_DIR)
-            plot_enrichment_data(kegg_object, "dotplot", plots_dir, project_name, "Kegg Pathways")
-            create_xlsx_file(kegg_df, f"{project_name}_KEGG_2021_Human", tables_dir)
-
-            # GO: processo biológico
-            BP_object, BP_df = perform_ora_enrichment(raw_file_data, 'GO_Biological_Process_2025', "processo biológico", DATA_DIR)
-            plot_enrichment_data(BP_object, "dotplot", plots_dir, project_name, "GO: Processo Biológico")
-            create_xlsx_file(BP_df, f"{project_name}_GO_Biological_Process_2025", tables_dir)
-
-            # CC: componente celular
-            CC_object, CC_df = perform_ora_enrichment(raw_file_data, 'GO_Cellular_Component_2025', "componente celular", DATA_DIR)
-            plot_enrichment_data(BP_object, "dotplot", plots_dir, project_name, "GO: Componente celular")
-            create_xlsx_file(CC_df, f"{project_name}_GO_Cellular_Component_2025", tables_dir)
-
-            # MF: função molecular
-            MF_object, MF_df = perform_ora_enrichment(raw_file_data, 'GO_Molecular_Function_2025', "função molecular", DATA_DIR)
-            plot_enrichment_data(MF_object, "dotplot", plots_dir, project_name, "GO: Função molecular")
-            create_xlsx_file(MF_df, f"{project_name}_GO_Molecular_Function_2025", tables_dir)
-
-            # Reactome
-            reactome_object, reactome_df = perform_ora_enrichment(raw_file_data, 'Reactome_Pathways_2024', "vias reactome", DATA_DIR)
-            plot_enrichment_data(reactome_object, "dotplot", plots_dir, project_name, "Reactome")
-            create_xlsx_file(reactome_df, f"{project_name}_Reactome_Pathways_2024", tables_dir)
-
-            # OMIM
-            OMIM_object, OMIM_df = perform_ora_enrichment(raw_file_data, 'OMIM_Expanded',"vias OMIM", DATA_DIR)
-            plot_enrichment_data(OMIM_object, "dotplot", plots_dir, project_name, "OMIM")
-            create_xlsx_file(OMIM_df, f"{project_name}_OMIM_Expanded", tables_dir)
-
-            # DisGeNET
-            DisGeNET_object, DisGeNET_df = perform_ora_enrichment(raw_file_data, 'DisGeNET', "vias DisGeNET", DATA_DIR)
-            plot_enrichment_data(DisGeNET_object, "dotplot", plots_dir, project_name, "DisGeNET")
-            create_xlsx_file(DisGeNET_df, f"{project_name}_DisGeNET", tables_dir)
-
-            print("Enriquecimento dos dados concluído.")
-            logging.info("Enriquecimento dos dados concluído.")
-            print("Análise dos dados concluída com sucesso!")
-            logging.info("Análise dos dados concluída com sucesso!")
+            run_analysis(directory, project_name, raw_file_path, proteomics_method, control_group,
+                         only=arguments.only, skip=arguments.skip)
 
             while True:
                 repeat = input("Deseja realizar uma nova análise? (y/n): ").lower().strip()
@@ -549,12 +1339,3 @@ if __name__ == "__main__":
             print(f"Erro inesperado: {error}")
             logging.error(f"Erro inesperado: {error}", exc_info=True)
             logging.shutdown()
-
-
-
-
-
-
-
-
-
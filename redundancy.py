@@ -0,0 +1,185 @@
+"""Redução de redundância dos termos enriquecidos por similaridade entre conjuntos gênicos.
+
+Os resultados do GO (processo biológico, componente celular e função
+molecular) repetem termos pai/filho quase idênticos. A similaridade de Jaccard
+entre todos os pares de termos de uma biblioteca é calculada de uma vez com o
+produto esparso M @ M.T (M: matriz termo x gene de libraries.py), em blocos de
+linhas para limitar a memória. Apenas os pares com similaridade a partir de
+SIMILARITY_FLOOR são guardados, e a matriz de cada biblioteca é gravada em
+data/.compiled/similarity, sendo recalculada somente quando a biblioteca ou a
+tabela de sinônimos mudam.
+
+Os termos significativos são agrupados de forma gulosa, como no REVIGO: em
+ordem de p-valor ajustado, cada termo ainda não agrupado se torna o
+representante de um grupo e absorve os termos ainda livres com similaridade
+a partir do limiar (PROTEOANALYZER_TERM_SIMILARITY).
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+from scipy import sparse
+
+from libraries import COMPILED_DIR_NAME, library_stamp
+from symbols import aliases_stamp
+
+
+SIMILARITY_VERSION = 1
+SIMILARITY_DIR_NAME = "similarity"
+
+# Menor similaridade guardada na matriz da biblioteca (os limiares de agrupamento devem ser >= a ela)
+SIMILARITY_FLOOR = 0.2
+
+# Termos por bloco do produto M @ M.T
+SIMILARITY_BLOCK = 1024
+
+
+def _similarity_path(db, datadir, cachedir=None):
+    identity = json.dumps([SIMILARITY_VERSION, db, library_stamp(db, datadir), aliases_stamp(datadir),
+                           SIMILARITY_FLOOR])
+    key = hashlib.sha1(identity.encode("utf-8")).hexdigest()[:16]
+    cachedir = cachedir or os.path.join(datadir, COMPILED_DIR_NAME)
+    return os.path.join(cachedir, SIMILARITY_DIR_NAME, f"{db}-{key}.npz")
+
+
+def jaccard_similarity(membership, floor=SIMILARITY_FLOOR, block=SIMILARITY_BLOCK):
+    """Similaridade de Jaccard entre todas as linhas de uma matriz binária termo x gene.
+
+    Returns:
+        matriz CSR simétrica (float32) apenas com os pares distintos de similaridade >= floor.
+    """
+    membership = sparse.csr_matrix(membership, dtype=np.float32)
+    membership.data[:] = 1
+    n_terms = membership.shape[0]
+    sizes = np.diff(membership.indptr).astype(np.float32)
+    transposed = membership.T.tocsc()
+
+    rows, columns, values = [], [], []
+    for start in range(0, n_terms, block):
+        # Tamanho das interseções do bloco com todos os termos
+        intersection = (membership[start:start + block] @ transposed).tocoo()
+        row = intersection.row + start
+        similarity = intersection.data / (sizes[row] + sizes[intersection.col] - intersection.data)
+        keep = (similarity >= floor) & (row != intersection.col)
+        rows.append(row[keep])
+        columns.append(intersection.col[keep])
+        values.append(similarity[keep].astype(np.float32))
+    return sparse.csr_matrix((np.concatenate(values) if values else np.zeros(0, dtype=np.float32),
+                              (np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64),
+                               np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64))),
+                             shape=(n_terms, n_terms))
+
+
+def library_similarity(libraries, db, datadir, cachedir=None):
+    """Similaridade entre os termos de uma biblioteca (linhas na ordem de libraries.library_slice(db)).
+
+    A matriz é lida de data/.compiled/similarity ou calculada e gravada lá.
+    """
+    path = _similarity_path(db, datadir, cachedir)
+    rows = libraries.library_slice(db)
+    n_terms = rows.stop - rows.start
+    try:
+        similarity = sparse.load_npz(path).tocsr()
+        if similarity.shape == (n_terms, n_terms):
+            return similarity
+    except (OSError, ValueError):
+        pass
+
+    similarity = jaccard_similarity(libraries.membership[rows])
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, partial = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".npz")
+        with os.fdopen(descriptor, "wb") as target:
+            sparse.save_npz(target, similarity)
+        os.replace(partial, path)
+        # Remove as matrizes de versões anteriores da biblioteca
+        for entry in os.listdir(os.path.dirname(path)):
+            if entry.startswith(f"{db}-") and entry != os.path.basename(path):
+                os.remove(os.path.join(os.path.dirname(path), entry))
+    except OSError as error:
+        logging.warning(f"Não foi possível gravar a similaridade dos termos de {db}: {error}")
+    logging.info(f"Similaridade dos termos de {db} calculada: {n_terms} termos, {similarity.nnz // 2} pares "
+                 f"com Jaccard >= {SIMILARITY_FLOOR}")
+    return similarity
+
+
+def cluster_terms(positions, similarity, threshold):
+    """Agrupa termos de forma gulosa, na ordem em que são informados (ex: p-valor ajustado crescente).
+
+    Args:
+        positions: linha de cada termo na matriz de similaridade (-1 se ausente da biblioteca).
+        similarity: matriz CSR de similaridade da biblioteca (library_similarity).
+        threshold: similaridade mínima para um termo ser absorvido por um representante.
+
+    Returns:
+        array com o índice do representante de cada termo.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    n_terms = len(positions)
+    present = np.flatnonzero(positions >= 0)
+    # Submatriz dos termos informados, na ordem da tabela
+    pairs = similarity[positions[present]][:, positions[present]].tocoo()
+    local = sparse.csr_matrix((pairs.data, (present[pairs.row], present[pairs.col])), shape=(n_terms, n_terms))
+
+    members = np.full(n_terms, -1, dtype=np.int64)
+    for term in range(n_terms):
+        if members[term] >= 0:
+            continue
+        members[term] = term
+        start, stop = local.indptr[term], local.indptr[term + 1]
+        neighbors = local.indices[start:stop][local.data[start:stop] >= threshold]
+        members[neighbors[members[neighbors] < 0]] = term
+    return members
+
+
+def representative_terms(table, libraries, db, similarity, threshold):
+    """Tabela dos termos representativos de um resultado de enriquecimento.
+
+    A tabela deve estar ordenada por prioridade (como as tabelas do ORA e do GSEA,
+    por p-valor ajustado). Cada representante recebe o número do grupo, seu
+    tamanho e os termos que absorveu.
+    """
+    rows = libraries.library_slice(db)
+    term_rows = {}
+    for position, term in enumerate(libraries.terms[rows]):
+        term_rows.setdefault(term, position)
+    positions = [term_rows.get(term, -1) for term in table['Term']]
+    members = cluster_terms(positions, similarity, threshold)
+
+    representatives = np.flatnonzero(members == np.arange(len(members)))
+    terms = table['Term'].tolist()
+    grouped = {representative: [] for representative in representatives}
+    for term, representative in enumerate(members):
+        if term != representative:
+            grouped[representative].append(terms[term])
+
+    reduced = table.iloc[representatives].copy()
+    reduced['Cluster'] = np.arange(1, len(representatives) + 1)
+    reduced['Cluster_size'] = [len(grouped[representative]) + 1 for representative in representatives]
+    reduced['Cluster_terms'] = [grouped[representative] for representative in representatives]
+    return reduced.reset_index(drop=True)
+
+
+def reduce_redundancy(libraries, tables, datadir, threshold, cachedir=None):
+    """Termos representativos de cada banco.
+
+    Args:
+        tables: dicionário banco -> tabela de enriquecimento (ordenada por p-valor ajustado).
+        threshold: similaridade de Jaccard mínima para agrupar dois termos.
+
+    Returns:
+        dicionário banco -> tabela dos termos representativos.
+    """
+    if threshold < SIMILARITY_FLOOR:
+        raise ValueError(f"Limiar de similaridade inválido: {threshold}. Use um valor entre "
+                         f"{SIMILARITY_FLOOR} e 1.")
+    reduced = {}
+    for db, table in tables.items():
+        reduced[db] = representative_terms(table, libraries, db,
+                                           library_similarity(libraries, db, datadir, cachedir), threshold)
+        logging.info(f"Redução de redundância de {db}: {len(table)} termos em {len(reduced[db])} grupos "
+                     f"(Jaccard >= {threshold}).")
+    return reduced
@@ -0,0 +1,80 @@
+"""Renderização dos gráficos do projeto em um pool de processos.
+
+As requisições de gráficos são coletadas antes da renderização e distribuídas
+entre processos com backend não interativo (Agg). Os dados compartilhados
+(objeto OmicScope, tabela de DEPs etc.) são enviados uma única vez a cada
+processo, no inicializador, e cada requisição retorna seu próprio resultado,
+de modo que a falha de um gráfico não interrompe os demais.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib import pyplot as plt
+
+from instrumentation import add_records, drain_records, metrics_config, start_worker_metrics
+
+
+_worker_state = {}
+
+
+def _init_render_worker(render, context, metrics=None):
+    plt.switch_backend("Agg")
+    start_worker_metrics(metrics)
+    _worker_state["render"] = render
+    _worker_state["context"] = context
+
+
+def _render_request(render, context, request):
+    """Renderiza uma requisição e retorna (requisição, erro ou None, duração em segundos).
+
+    Os arquivos retornados por render são registrados em request["outputs"].
+    """
+    started = time.perf_counter()
+    try:
+        outputs = render(context, request)
+        if outputs is not None:
+            request["outputs"] = list(outputs)
+        error = None
+    except Exception as render_error:
+        error = f"{type(render_error).__name__}: {render_error}"
+    finally:
+        # Libera as figuras abertas pelo OmicScope/seaborn antes do próximo gráfico
+        plt.close("all")
+    return request, error, time.perf_counter() - started
+
+
+def _render_in_worker(request):
+    # Devolve também as métricas registradas no worker
+    return _render_request(_worker_state["render"], _worker_state["context"], request), drain_records()
+
+
+def _collect(future):
+    result, records = future.result()
+    add_records(records)
+    return result
+
+
+def render_plots(render, context, requests, workers=1):
+    """Renderiza todas as requisições de gráficos.
+
+    Args:
+        render: função de nível de módulo render(context, request) que gera um gráfico e
+            retorna os arquivos gerados (ou None).
+        context: dados compartilhados por todas as requisições.
+        requests: lista de requisições (dicionários). A chave opcional "weight" indica o
+            custo relativo; no pool, os gráficos mais custosos são iniciados primeiro.
+        workers: número de processos. Com workers <= 1 os gráficos são gerados no
+            processo atual, um após o outro.
+
+    Returns:
+        lista de tuplas (requisição, erro ou None, duração), na ordem das requisições.
+    """
+    if workers <= 1 or len(requests) <= 1:
+        return [_render_request(render, context, request) for request in requests]
+
+    order = sorted(range(len(requests)), key=lambda i: -requests[i].get("weight", 0))
+    with ProcessPoolExecutor(max_workers=min(workers, len(requests)),
+                             initializer=_init_render_worker,
+                             initargs=(render, context, metrics_config())) as pool:
+        futures = {i: pool.submit(_render_in_worker, requests[i]) for i in order}
+        return [_collect(futures[i]) for i in range(len(requests))]
@@ -0,0 +1,372 @@
+"""Banco de resultados compartilhado entre projetos (DEPs e enriquecimento).
+
+Ao final de cada análise, as DEPs e as tabelas de enriquecimento do projeto são
+acrescentadas a um banco SQLite local (PROTEOANALYZER_RESULTS_STORE_PATH), em
+vez de ficarem apenas nas tabelas de cada pasta tables/. O banco só recebe
+inserções: cada execução é uma nova entrada em runs, e as consultas usam por
+padrão a execução mais recente de cada projeto.
+
+Os genes são gravados pelo símbolo oficial (symbols.canonical_symbol) e há
+índices por gene, termo e projeto, de modo que perguntas como "em quais
+projetos ALB estava regulada positivamente, e em quais vias" são respondidas
+sem abrir as tabelas de cada projeto:
+
+    python results_store.py gene ALB --regulation up
+    python results_store.py term "apoptosis" --database GO_Biological_Process_2025
+    python results_store.py projects
+
+Tabelas:
+    runs: uma linha por execução (projeto, pasta, conjunto de dados, método, controle, cutoffs).
+    genes, terms: dicionários símbolo -> gene_id e (banco, termo) -> term_id.
+    deps: log2(fc), p-valores e regulação (1, -1 ou 0) de cada proteína em cada execução.
+    enrichment: termos enriquecidos de cada execução, com p-valores e escore.
+    enrichment_genes: genes de cada termo enriquecido em cada execução.
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from datetime import datetime
+
+from symbols import canonical_symbol
+
+
+RESULTS_STORE_PATH = os.environ.get("PROTEOANALYZER_RESULTS_STORE_PATH",
+                                    os.path.join(os.path.expanduser("~"), ".local", "share", "proteoanalyzer",
+                                                 "results.sqlite"))
+
+# Tempo máximo de espera (s) quando outro processo (batch) está gravando no banco
+BUSY_TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    project TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    dataset TEXT,
+    source TEXT,
+    method TEXT,
+    control TEXT,
+    conditions TEXT,
+    log2fc_cutoff REAL,
+    pvalue_cutoff REAL,
+    enrichment_method TEXT,
+    finished_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_project ON runs (project COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS runs_directory ON runs (directory);
+
+CREATE TABLE IF NOT EXISTS genes (
+    gene_id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS terms (
+    term_id INTEGER PRIMARY KEY,
+    database TEXT NOT NULL,
+    term TEXT NOT NULL,
+    UNIQUE (database, term)
+);
+CREATE INDEX IF NOT EXISTS terms_term ON terms (term COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS deps (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    gene_id INTEGER REFERENCES genes (gene_id),
+    gene_name TEXT,
+    accession TEXT,
+    log2fc REAL,
+    pvalue REAL,
+    padjusted REAL,
+    regulation INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deps_gene ON deps (gene_id, regulation);
+CREATE INDEX IF NOT EXISTS deps_run ON deps (run_id);
+
+CREATE TABLE IF NOT EXISTS enrichment (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    term_id INTEGER NOT NULL REFERENCES terms (term_id),
+    method TEXT NOT NULL,
+    overlap TEXT,
+    pvalue REAL,
+    padjusted REAL,
+    score REAL,
+    n_genes INTEGER,
+    PRIMARY KEY (run_id, term_id)
+);
+CREATE INDEX IF NOT EXISTS enrichment_term ON enrichment (term_id);
+
+CREATE TABLE IF NOT EXISTS enrichment_genes (
+    run_id INTEGER NOT NULL,
+    term_id INTEGER NOT NULL,
+    gene_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS enrichment_genes_gene ON enrichment_genes (gene_id, run_id);
+CREATE INDEX IF NOT EXISTS enrichment_genes_term ON enrichment_genes (run_id, term_id);
+"""
+
+# Execução mais recente de cada projeto (pasta), usada por padrão nas consultas
+LATEST_RUNS = "SELECT MAX(run_id) FROM runs GROUP BY directory"
+
+REGULATION = {"up": 1, "down": -1, "ns": 0}
+
+
+def connect(path=None):
+    """Abre (criando, se preciso) o banco de resultados."""
+    path = path or RESULTS_STORE_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    connection.row_factory = sqlite3.Row
+    # WAL: consultas não bloqueiam (nem são bloqueadas por) as gravações do batch
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _gene_ids(connection, symbols):
+    """Registra os símbolos novos e retorna o dicionário símbolo -> gene_id."""
+    connection.executemany("INSERT OR IGNORE INTO genes (symbol) VALUES (?)", ((symbol,) for symbol in symbols))
+    return {symbol: gene_id for symbol, gene_id in connection.execute("SELECT symbol, gene_id FROM genes")
+            if symbol in symbols}
+
+
+def _term_ids(connection, terms):
+    """Registra os termos (banco, termo) novos e retorna o dicionário (banco, termo) -> term_id."""
+    if not terms:
+        return {}
+    connection.executemany("INSERT OR IGNORE INTO terms (database, term) VALUES (?, ?)", terms)
+    databases = sorted({database for database, _ in terms})
+    rows = connection.execute(f"SELECT database, term, term_id FROM terms "
+                              f"WHERE database IN ({','.join('?' * len(databases))})", databases)
+    return {(database, term): term_id for database, term, term_id in rows}
+
+
+def _column(dataframe, name):
+    return dataframe[name].tolist() if name in dataframe.columns else [None] * len(dataframe)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def publish_run(run, deps, enrichment, aliases=None, path=None):
+    """Acrescenta ao banco as DEPs e o enriquecimento de uma execução.
+
+    Args:
+        run: dicionário com project, directory, dataset, source, method, control,
+            conditions, log2fc_cutoff, pvalue_cutoff, pvalue_column e enrichment_method.
+            A regulação das DEPs usa |log2(fc)| >= log2fc_cutoff e pvalue_column <= pvalue_cutoff.
+        deps: tabela de DEPs do OmicScope (colunas gene_name, log2(fc), pvalue, pAdjusted).
+        enrichment: dicionário banco -> tabela de enriquecimento (formato do EnrichmentScope).
+        aliases: tabela de sinônimos (symbols.load_aliases) usada para os símbolos oficiais.
+
+    Returns:
+        run_id da execução.
+    """
+    started = time.perf_counter()
+    log2fc = [_number(value) for value in _column(deps, "log2(fc)")]
+    tested = [_number(value) for value in _column(deps, run.get("pvalue_column") or "pAdjusted")]
+    cutoff, pvalue_cutoff = run.get("log2fc_cutoff"), run.get("pvalue_cutoff")
+    regulation = []
+    for fc, pvalue in zip(log2fc, tested):
+        significant = (fc is not None and pvalue is not None and cutoff is not None and pvalue_cutoff is not None
+                       and abs(fc) >= cutoff and pvalue <= pvalue_cutoff)
+        regulation.append((1 if fc > 0 else -1) if significant else 0)
+    names = _column(deps, "gene_name")
+    accessions = _column(deps, "Accession") if "Accession" in deps.columns else [str(i) for i in deps.index]
+    symbols = [None if not isinstance(name, str) or not name.strip() else canonical_symbol(name, aliases)
+               for name in names]
+
+    term_genes = {}
+    for db, table in enrichment.items():
+        for term, genes in zip(table["Term"], table["Genes"]):
+            term_genes[(db, term)] = [canonical_symbol(gene, aliases) for gene in genes]
+
+    with closing(connect(path)) as connection, connection:
+        gene_ids = _gene_ids(connection, {symbol for symbol in symbols if symbol}
+                             | {gene for genes in term_genes.values() for gene in genes})
+        term_ids = _term_ids(connection, list(term_genes))
+        run_id = connection.execute(
+            "INSERT INTO runs (project, directory, dataset, source, method, control, conditions, log2fc_cutoff, "
+            "pvalue_cutoff, enrichment_method, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (run["project"], os.path.abspath(run["directory"]), run.get("dataset"), run.get("source"),
+             run.get("method"), run.get("control"), json.dumps(run.get("conditions") or [], default=str),
+             cutoff, pvalue_cutoff, run.get("enrichment_method"),
+             datetime.now().isoformat(timespec="seconds"))).lastrowid
+
+        connection.executemany(
+            "INSERT INTO deps VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((run_id, gene_ids.get(symbol), name if isinstance(name, str) else None,
+              None if accession is None else str(accession), fc, _number(pvalue), _number(padjusted), regulated)
+             for symbol, name, accession, fc, pvalue, padjusted, regulated
+             in zip(symbols, names, accessions, log2fc, _column(deps, "pvalue"), _column(deps, "pAdjusted"),
+                    regulation)))
+        for db, table in enrichment.items():
+            connection.executemany(
+                "INSERT OR IGNORE INTO enrichment VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((run_id, term_ids[(db, term)], run.get("enrichment_method") or "ora", overlap, _number(pvalue),
+                  _number(padjusted), _number(score), len(term_genes[(db, term)]))
+                 for term, overlap, pvalue, padjusted, score
+                 in zip(table["Term"], _column(table, "Overlap"), _column(table, "P-value"),
+                        _column(table, "Adjusted P-value"), _column(table, "Combined Score"))))
+        connection.executemany(
+            "INSERT INTO enrichment_genes VALUES (?, ?, ?)",
+            ((run_id, term_ids[key], gene_ids[gene]) for key, genes in term_genes.items() for gene in set(genes)))
+
+    logging.info(f"Resultados gravados no banco {path or RESULTS_STORE_PATH} (execução {run_id}: "
+                 f"{len(deps)} proteínas, {len(term_genes)} termos) em {time.perf_counter() - started:.2f} s")
+    return run_id
+
+
+def _runs_filter(latest, project=None):
+    clauses, parameters = [], []
+    if latest:
+        clauses.append(f"runs.run_id IN ({LATEST_RUNS})")
+    if project:
+        clauses.append("runs.project = ? COLLATE NOCASE")
+        parameters.append(project)
+    return clauses, parameters
+
+
+def query_gene(symbol, regulation=None, terms=True, latest=True, project=None, aliases=None, path=None):
+    """Execuções em que um gene foi quantificado (ou regulado), com os termos enriquecidos que o contêm.
+
+    Args:
+        symbol: símbolo do gene (sinônimos resolvidos por aliases).
+        regulation: "up", "down" ou "ns" (padrão: qualquer).
+        terms: inclui os termos enriquecidos de cada execução que contêm o gene.
+        latest: considera apenas a execução mais recente de cada projeto.
+
+    Returns:
+        lista de dicionários, um por proteína do gene em cada execução.
+    """
+    symbol = canonical_symbol(symbol, aliases)
+    clauses, parameters = _runs_filter(latest, project)
+    clauses.insert(0, "deps.gene_id = (SELECT gene_id FROM genes WHERE symbol = ?)")
+    parameters.insert(0, symbol)
+    if regulation is not None:
+        clauses.append("deps.regulation = ?")
+        parameters.append(REGULATION[regulation])
+    with closing(connect(path)) as connection:
+        rows = [dict(row) for row in connection.execute(
+            "SELECT runs.run_id, runs.project, runs.directory, runs.finished_at, deps.gene_name, deps.accession, "
+            "deps.log2fc, deps.pvalue, deps.padjusted, deps.regulation FROM deps "
+            "JOIN runs ON runs.run_id = deps.run_id "
+            f"WHERE {' AND '.join(clauses)} ORDER BY runs.run_id DESC", parameters)]
+        if terms and rows:
+            run_ids = sorted({row["run_id"] for row in rows})
+            found = {}
+            for term in connection.execute(
+                    "SELECT enrichment_genes.run_id, terms.database, terms.term, enrichment.padjusted, "
+                    "enrichment.score FROM enrichment_genes "
+                    "JOIN terms ON terms.term_id = enrichment_genes.term_id "
+                    "JOIN enrichment ON enrichment.run_id = enrichment_genes.run_id "
+                    "AND enrichment.term_id = enrichment_genes.term_id "
+                    "WHERE enrichment_genes.gene_id = (SELECT gene_id FROM genes WHERE symbol = ?) "
+                    f"AND enrichment_genes.run_id IN ({','.join('?' * len(run_ids))}) "
+                    "ORDER BY enrichment.padjusted", [symbol] + run_ids):
+                found.setdefault(term["run_id"], []).append(
+                    {"database": term["database"], "term": term["term"], "padjusted": term["padjusted"],
+                     "score": term["score"]})
+            for row in rows:
+                row["terms"] = found.get(row["run_id"], [])
+    return rows
+
+
+def query_term(term, database=None, exact=False, latest=True, project=None, path=None):
+    """Execuções em que um termo foi enriquecido (busca por trecho do nome, sem diferenciar maiúsculas)."""
+    clauses, parameters = _runs_filter(latest, project)
+    clauses.insert(0, "terms.term = ? COLLATE NOCASE" if exact else "terms.term LIKE ?")
+    parameters.insert(0, term if exact else f"%{term}%")
+    if database:
+        clauses.append("terms.database = ?")
+        parameters.append(database)
+    with closing(connect(path)) as connection:
+        return [dict(row) for row in connection.execute(
+            "SELECT runs.run_id, runs.project, runs.directory, runs.finished_at, terms.database, terms.term, "
+            "enrichment.method, enrichment.overlap, enrichment.pvalue, enrichment.padjusted, enrichment.score, "
+            "enrichment.n_genes FROM enrichment "
+            "JOIN terms ON terms.term_id = enrichment.term_id "
+            "JOIN runs ON runs.run_id = enrichment.run_id "
+            f"WHERE {' AND '.join(clauses)} ORDER BY enrichment.padjusted", parameters)]
+
+
+def query_projects(latest=True, project=None, path=None):
+    """Execuções gravadas, com o número de DEPs reguladas e de termos enriquecidos."""
+    clauses, parameters = _runs_filter(latest, project)
+    with closing(connect(path)) as connection:
+        return [dict(row) for row in connection.execute(
+            "SELECT runs.*, "
+            "(SELECT COUNT(*) FROM deps WHERE deps.run_id = runs.run_id AND deps.regulation = 1) AS up, "
+            "(SELECT COUNT(*) FROM deps WHERE deps.run_id = runs.run_id AND deps.regulation = -1) AS down, "
+            "(SELECT COUNT(*) FROM enrichment WHERE enrichment.run_id = runs.run_id) AS terms FROM runs "
+            f"{'WHERE ' + ' AND '.join(clauses) if clauses else ''} ORDER BY runs.run_id DESC", parameters)]
+
+
+def _number_text(value):
+    return "-" if value is None else f"{value:.3g}"
+
+
+def run_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Consultas ao banco de resultados do Proteoanalyzer.")
+    parser.add_argument("--store", default=None, help=f"Banco de resultados (padrão: {RESULTS_STORE_PATH}).")
+    parser.add_argument("--all-runs", action="store_true",
+                        help="Considera todas as execuções, não apenas a mais recente de cada projeto.")
+    parser.add_argument("--project", default=None, help="Restringe a consulta a um projeto.")
+    parser.add_argument("--json", action="store_true", help="Escreve o resultado em JSON.")
+    queries = parser.add_subparsers(dest="query", required=True)
+    gene_parser = queries.add_parser("gene", help="Projetos em que um gene foi quantificado ou regulado.")
+    gene_parser.add_argument("symbol")
+    gene_parser.add_argument("--regulation", choices=sorted(REGULATION), default=None)
+    term_parser = queries.add_parser("term", help="Projetos em que um termo foi enriquecido.")
+    term_parser.add_argument("term")
+    term_parser.add_argument("--database", default=None)
+    term_parser.add_argument("--exact", action="store_true", help="Nome exato do termo, em vez de trecho.")
+    queries.add_parser("projects", help="Execuções gravadas no banco.")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    latest = not args.all_runs
+    if args.query == "gene":
+        from symbols import load_aliases
+        from main import DATA_DIR
+
+        rows = query_gene(args.symbol, args.regulation, latest=latest, project=args.project,
+                          aliases=load_aliases(DATA_DIR), path=args.store)
+    elif args.query == "term":
+        rows = query_term(args.term, args.database, args.exact, latest=latest, project=args.project,
+                          path=args.store)
+    else:
+        rows = query_projects(latest=latest, project=args.project, path=args.store)
+    elapsed = time.perf_counter() - started
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return 0
+    labels = {1: "up", -1: "down", 0: "ns"}
+    for row in rows:
+        if args.query == "gene":
+            print(f"{row['project']}  {row['finished_at']}  {row['gene_name']} ({row['accession']})  "
+                  f"log2(fc)={_number_text(row['log2fc'])}  pAdj={_number_text(row['padjusted'])}  "
+                  f"{labels[row['regulation']]}")
+            for term in row.get("terms", []):
+                print(f"    {term['database']}: {term['term']}  (pAdj={_number_text(term['padjusted'])})")
+        elif args.query == "term":
+            print(f"{row['project']}  {row['finished_at']}  {row['database']}: {row['term']}  "
+                  f"{row['overlap']}  pAdj={_number_text(row['padjusted'])}")
+        else:
+            print(f"{row['run_id']:>5}  {row['project']}  {row['finished_at']}  {row['method']}  "
+                  f"up={row['up']} down={row['down']} termos={row['terms']}  {row['directory']}")
+    print(f"{len(rows)} resultado(s) em {elapsed * 1000:.0f} ms ({args.store or RESULTS_STORE_PATH})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
@@ -0,0 +1,509 @@
+"""Serviço local do Proteoanalyzer: mantém projetos carregados em memória entre requisições.
+
+O serviço (HTTP, apenas em 127.0.0.1) lê cada conjunto de dados uma única vez
+e mantém em memória o objeto OmicScope, a tabela de DEPs e o índice de
+símbolos; as bibliotecas de conjuntos gênicos ficam abertas pelo próprio
+libraries.py. Pedidos seguintes (gráficos com outras proteínas, tabelas,
+novo filtro de FC, enriquecimento) são atendidos sem reiniciar o Python nem
+reler os dados.
+
+As requisições entram em uma fila e são executadas uma de cada vez por uma
+única thread (o pyplot não é thread-safe). Por padrão a resposta aguarda o
+fim da execução; com ?wait=0 ela retorna imediatamente o identificador do
+pedido, consultado depois em GET /jobs/<id>.
+
+Memória: cada projeto guarda os resultados derivados (DEPs filtradas,
+tabelas de enriquecimento) em um cache LRU limitado a SERVICE_PROJECT_MB, e
+quando o total passa de SERVICE_MEMORY_MB os projetos usados há mais tempo
+são descarregados (e recarregados, do cache de dados, no próximo pedido).
+
+Rotas (corpo e resposta em JSON):
+    POST   /projects                    {"name", "directory", "input", "method", "control"}
+    POST   /projects/<nome>/plot        {"type", "proteins", "palette", "fc" (volcano)}
+    POST   /projects/<nome>/tables      {"tables": ["params", "conditions", "raw_data", "deps"]}
+    POST   /projects/<nome>/filter      {"fc"}
+    POST   /projects/<nome>/enrichment  {"databases", "method"}
+    DELETE /projects/<nome>
+    GET    /status
+    GET    /jobs/<id>
+
+Uso:
+    python service.py serve [--port 8765] [--memory-mb 4096] [--project-mb 2048]
+    python service.py send /projects/Coorte_A/plot '{"type": "conditions_barplot", "proteins": ["ALB"]}'
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import main
+from analyses import ANALYSES, import_module
+
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = int(os.environ.get("PROTEOANALYZER_SERVICE_PORT", "8765"))
+
+# Limites de memória: total dos projetos carregados e de cada projeto (dados + resultados em cache)
+SERVICE_MEMORY_MB = float(os.environ.get("PROTEOANALYZER_SERVICE_MEMORY_MB", "4096"))
+SERVICE_PROJECT_MB = float(os.environ.get("PROTEOANALYZER_SERVICE_PROJECT_MB", "2048"))
+
+# Pedidos concluídos mantidos para consulta em /jobs/<id>
+FINISHED_JOBS = 1000
+
+
+def memory_size(value):
+    """Estimativa, em bytes, da memória ocupada por tabelas, arrays e objetos que os contêm."""
+    pd = import_module("pandas")
+    np = import_module("numpy")
+
+    def size(item, depth):
+        if isinstance(item, (pd.DataFrame, pd.Series)):
+            return int(np.sum(item.memory_usage(deep=True)))
+        if isinstance(item, np.ndarray):
+            return item.nbytes
+        if depth and isinstance(item, dict):
+            return sum(size(element, depth - 1) for element in item.values())
+        if depth and isinstance(item, (list, tuple)):
+            return sum(size(element, depth - 1) for element in item)
+        if depth and hasattr(item, "__dict__"):
+            return sum(size(element, depth - 1) for element in vars(item).values())
+        return sys.getsizeof(item)
+
+    return size(value, 2)
+
+
+class Project:
+    """Um projeto carregado: dados do OmicScope, DEPs, índice de símbolos e resultados em cache.
+
+    Os resultados são alterados pela thread da fila e lidos pelas threads do
+    servidor HTTP (GET /status), por isso todo acesso a results usa o lock do projeto.
+    """
+
+    def __init__(self, name, directory, rawfilepath, method, control, table_formats=None):
+        pd = import_module("pandas")
+
+        self.name = name
+        self.directory = directory
+        self.rawfilepath = rawfilepath
+        self.method = method
+        self.control = control
+        self.table_formats = table_formats or main.TABLE_FORMATS
+        self.tables_dir = os.path.join(directory, "tables")
+        self.plots_dir = os.path.join(directory, "plots")
+        os.makedirs(self.tables_dir, exist_ok=True)
+        os.makedirs(self.plots_dir, exist_ok=True)
+
+        started = time.perf_counter()
+        self.data = main.read_proteomics_file(rawfilepath, method, control)
+        self.deps = pd.DataFrame(self.data.deps)
+        self.symbols = main.protein_symbols(self.data)
+        self.figures = None
+        if main.FIGURE_CACHE:
+            from figure_cache import FigureCache
+            self.figures = FigureCache(main.dataset_fingerprint(rawfilepath, method, control))
+        self.data_bytes = memory_size(self.data) + memory_size(self.deps) + memory_size(self.symbols)
+        self.results = OrderedDict()
+        self._lock = threading.RLock()
+        self.load_seconds = time.perf_counter() - started
+        self.last_used = time.time()
+
+    @property
+    def memory_bytes(self):
+        with self._lock:
+            return self.data_bytes + sum(size for _, size in self.results.values())
+
+    def cached(self, key):
+        """Resultado guardado por remember, ou None."""
+        with self._lock:
+            entry = self.results.get(key)
+            if entry is None:
+                return None
+            self.results.move_to_end(key)
+            return entry[0]
+
+    def remember(self, key, value, limit_bytes):
+        """Guarda um resultado, descartando os usados há mais tempo acima do limite do projeto."""
+        size = memory_size(value)
+        with self._lock:
+            self.results[key] = (value, size)
+            self.results.move_to_end(key)
+            while self.results and self.memory_bytes > limit_bytes:
+                evicted, _ = self.results.popitem(last=False)
+                logging.info(f"Projeto {self.name}: resultado {evicted} descartado do cache (limite de memória).")
+
+    def describe(self):
+        with self._lock:
+            memory_bytes, cached_results = self.memory_bytes, list(self.results)
+        return {"name": self.name, "directory": self.directory, "input": self.rawfilepath,
+                "method": self.method, "control": self.control,
+                "memory_mb": round(memory_bytes / 1024 / 1024, 1),
+                "cached_results": cached_results, "load_s": round(self.load_seconds, 2),
+                "idle_s": round(time.time() - self.last_used, 1)}
+
+
+class AnalysisService:
+    """Projetos carregados e fila de pedidos executados por uma única thread."""
+
+    def __init__(self, memory_mb=None, project_mb=None):
+        self.memory_bytes = (memory_mb or SERVICE_MEMORY_MB) * 1024 * 1024
+        self.project_bytes = (project_mb or SERVICE_PROJECT_MB) * 1024 * 1024
+        self.projects = OrderedDict()
+        self.definitions = {}
+        self._lock = threading.Lock()
+        self._queue = ThreadPoolExecutor(max_workers=1, thread_name_prefix="proteoanalyzer-service")
+        self._jobs = OrderedDict()
+        self._job_ids = itertools.count(1)
+
+    # --- Fila de pedidos ---------------------------------------------------------
+
+    def submit(self, operation, *args):
+        """Enfileira um pedido e retorna seu identificador."""
+        job_id = str(next(self._job_ids))
+        future = self._queue.submit(self._timed, getattr(self, operation), *args)
+        with self._lock:
+            self._jobs[job_id] = (operation, future)
+            finished = [key for key, (_, job) in self._jobs.items() if job.done()]
+            for key in finished[:max(0, len(finished) - FINISHED_JOBS)]:
+                del self._jobs[key]
+        return job_id
+
+    def job(self, job_id):
+        """Situação de um pedido: queued/running/done/error, com o resultado ou o erro."""
+        with self._lock:
+            entry = self._jobs.get(job_id)
+        if entry is None:
+            raise KeyError(f"Pedido não encontrado: {job_id}")
+        operation, future = entry
+        if not future.done():
+            return {"job": job_id, "operation": operation, "status": "running" if future.running() else "queued"}
+        error = future.exception()
+        if error is not None:
+            return {"job": job_id, "operation": operation, "status": "error",
+                    "error": f"{type(error).__name__}: {error}"}
+        return {"job": job_id, "operation": operation, "status": "done", "result": future.result()}
+
+    def wait(self, job_id):
+        """Aguarda um pedido e retorna seu resultado (ou levanta o erro da execução)."""
+        with self._lock:
+            _, future = self._jobs[job_id]
+        return future.result()
+
+    @staticmethod
+    def _timed(function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+    def close(self):
+        self._queue.shutdown(wait=True)
+
+    # --- Projetos ----------------------------------------------------------------
+
+    def status(self):
+        with self._lock:
+            projects = [project.describe() for project in self.projects.values()]
+            pending = sum(1 for _, job in self._jobs.values() if not job.done())
+        return {"projects": projects, "pending_jobs": pending,
+                "memory_mb": round(sum(project["memory_mb"] for project in projects), 1),
+                "memory_limit_mb": round(self.memory_bytes / 1024 / 1024, 1),
+                "project_limit_mb": round(self.project_bytes / 1024 / 1024, 1)}
+
+    def project(self, name):
+        """Projeto carregado, recarregando-o se tiver sido descarregado por falta de memória."""
+        with self._lock:
+            project = self.projects.get(name)
+            definition = self.definitions.get(name)
+        if project is None:
+            if definition is None:
+                raise KeyError(f"Projeto não carregado: {name}")
+            logging.info(f"Recarregando o projeto {name}...")
+            project = self._load(**definition)
+        project.last_used = time.time()
+        with self._lock:
+            self.projects.move_to_end(name)
+        return project
+
+    def _load(self, name, directory, input, method, control, table_formats=None):
+        project = Project(name, directory, input, method, control, table_formats)
+        with self._lock:
+            self.projects[name] = project
+            self.definitions[name] = {"name": name, "directory": directory, "input": input, "method": method,
+                                      "control": control, "table_formats": table_formats}
+        self._evict(keep=name)
+        logging.info(f"Projeto {name} carregado em {project.load_seconds:.1f} s "
+                     f"({project.memory_bytes / 1024 / 1024:.0f} MB).")
+        return project
+
+    def _evict(self, keep=None):
+        """Descarrega os projetos usados há mais tempo enquanto o total passar do limite."""
+        with self._lock:
+            while sum(project.memory_bytes for project in self.projects.values()) > self.memory_bytes:
+                candidates = [name for name in self.projects if name != keep]
+                if not candidates:
+                    break
+                del self.projects[candidates[0]]
+                logging.info(f"Projeto {candidates[0]} descarregado (limite de memória do serviço).")
+
+    # --- Operações (executadas pela thread da fila) ------------------------------
+
+    def load(self, payload):
+        missing = [key for key in ("name", "directory", "input", "method", "control") if not payload.get(key)]
+        if missing:
+            raise ValueError(f"Campos obrigatórios ausentes: {missing}")
+        if payload["method"] not in main.VALID_METHODS:
+            raise ValueError(f"Método '{payload['method']}' inválido. Métodos válidos: {', '.join(main.VALID_METHODS)}")
+        definition = {key: payload.get(key) for key in ("name", "directory", "input", "method", "control",
+                                                         "table_formats")}
+        return {"project": self._load(**definition).describe()}
+
+    def unload(self, name):
+        with self._lock:
+            known = self.projects.pop(name, None) is not None
+            known = self.definitions.pop(name, None) is not None or known
+        if not known:
+            raise KeyError(f"Projeto não carregado: {name}")
+        return {"project": name, "unloaded": True}
+
+    def plot(self, name, payload):
+        project = self.project(name)
+        analysis_type = payload.get("type")
+        plot = ANALYSES.get(analysis_type)
+        if plot is None or plot.kind != "plot":
+            raise ValueError(f"Gráfico inválido: {analysis_type}. "
+                             f"Gráficos válidos: {', '.join(name for name, _, _, _ in main.PLOTS)}")
+        proteins = payload.get("proteins") or []
+        if isinstance(proteins, str):
+            proteins = proteins.split(",")
+        found, missing = project.symbols.resolve(main.read_proteins_list(proteins)[1])
+        if analysis_type == "volcano":
+            if payload.get("fc") is None:
+                raise ValueError("O volcano plot requer o valor de FC (campo 'fc').")
+            main.create_volcano_plot(project.deps, main.parse_fc_cutoff(payload["fc"]), 0.05, project.plots_dir,
+                                     f"{project.name}_Volcano_plot", proteins=found, figures=project.figures)
+        else:
+            main.plot_data(project.data, analysis_type, project.name, project.plots_dir, plot.description,
+                           proteins=found if plot.proteins else None, palette=payload.get("palette") or "",
+                           figures=project.figures)
+        import_module("matplotlib.pyplot").close("all")
+        return {"project": name, "plot": analysis_type, "proteins": found, "missing": missing}
+
+    def tables(self, name, payload):
+        project = self.project(name)
+        pd = import_module("pandas")
+        from tables import write_table
+
+        builders = {"params": lambda: pd.DataFrame(project.data.Params),
+                    "raw_data": lambda: pd.DataFrame(project.data.quant_data),
+                    "deps": lambda: project.deps}
+        names = {"params": "Parâmetros", "raw_data": "Dados brutos", "deps": "DEPs"}
+        requested = payload.get("tables") or ["params", "conditions", "raw_data", "deps"]
+        written = []
+        for table in requested:
+            if table == "conditions":
+                written.append(main.create_json_file({"Grupos": f"{project.data.Conditions}",
+                                                      "Controle": f"{project.data.ControlGroup}"},
+                                                     "Condições do estudo", project.tables_dir))
+            elif table in builders:
+                written += write_table(builders[table](), names[table], project.tables_dir,
+                                       payload.get("table_formats") or project.table_formats)
+            else:
+                raise ValueError(f"Tabela inválida: {table}. Tabelas válidas: params, conditions, raw_data, deps")
+        return {"project": name, "written": written}
+
+    def filter(self, name, payload):
+        project = self.project(name)
+        from tables import write_table
+
+        if payload.get("fc") is None:
+            raise ValueError("Informe o valor de FC (campo 'fc').")
+        cutoff = main.parse_fc_cutoff(payload["fc"])
+        key = f"filter[{cutoff:.6g}]"
+        filtered = project.cached(key)
+        if filtered is None:
+            filtered = main.filter_deps_dataframe(cutoff, project.deps)
+            project.remember(key, filtered, self.project_bytes)
+        written = write_table(filtered, "DEPs filtradas", project.tables_dir,
+                              payload.get("table_formats") or project.table_formats)
+        self._evict(keep=name)
+        return {"project": name, "fc": payload["fc"], "log2fc_cutoff": cutoff, "deps": len(filtered),
+                "written": written}
+
+    def enrichment(self, name, payload):
+        project = self.project(name)
+        from tables import TableWriter
+
+        method = payload.get("method") or main.ENRICHMENT_METHOD
+        if method not in main.enrichment_methods():
+            raise ValueError(f"Método de enriquecimento inválido: {method}. "
+                             f"Use {' ou '.join(repr(name) for name in main.enrichment_methods())}.")
+        available = {database[0]: database for database in main.ENRICHMENT_DATABASES}
+        requested = payload.get("databases") or list(available)
+        unknown = [db for db in requested if db not in available]
+        if unknown:
+            raise ValueError(f"Bancos desconhecidos: {unknown}. Bancos válidos: {', '.join(available)}")
+
+        terms = {}
+        pending = []
+        for db in requested:
+            table = project.cached(f"enrichment[{method}][{db}]")
+            if table is None:
+                pending.append(available[db])
+            else:
+                terms[db] = len(table)
+        if pending:
+            writer = TableWriter(project.tables_dir, payload.get("table_formats") or project.table_formats,
+                                 background=False)
+            results = main.run_enrichment(project.data, pending, main.DATA_DIR, project.plots_dir,
+                                          project.tables_dir, project.name, writer=writer, method=method,
+                                          permutations=main.GSEA_PERMUTATIONS, seed=main.GSEA_SEED)
+            import_module("matplotlib.pyplot").close("all")
+            for db, (_, table) in results.items():
+                project.remember(f"enrichment[{method}][{db}]", table, self.project_bytes)
+                terms[db] = len(table)
+        self._evict(keep=name)
+        return {"project": name, "method": method, "terms": terms,
+                "cached": [db for db in requested if db not in {database[0] for database in pending}]}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Rotas HTTP do serviço (ver a documentação do módulo)."""
+
+    service = None
+
+    def _reply(self, status, content):
+        body = json.dumps(content, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _payload(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        payload = json.loads(self.rfile.read(length).decode("utf-8"))
+        if not isinstance(payload, dict):
+            raise ValueError("O corpo da requisição deve ser um objeto JSON.")
+        return payload
+
+    def _dispatch(self, operation, *args):
+        query = parse_qs(urlparse(self.path).query)
+        job_id = self.service.submit(operation, *args)
+        if query.get("wait", ["1"])[0] == "0":
+            self._reply(202, {"job": job_id, "status": "queued"})
+        else:
+            self._reply(200, dict(self.service.wait(job_id), job=job_id))
+
+    def _handle(self, route):
+        try:
+            route(urlparse(self.path).path.strip("/").split("/"))
+        except KeyError as error:
+            self._reply(404, {"error": str(error.args[0] if error.args else error)})
+        except ValueError as error:
+            self._reply(400, {"error": str(error)})
+        except Exception as error:
+            logging.error(f"Erro no pedido {self.command} {self.path}: {error}", exc_info=True)
+            self._reply(500, {"error": f"{type(error).__name__}: {error}"})
+
+    def do_GET(self):
+        def route(parts):
+            if parts == ["status"]:
+                self._reply(200, self.service.status())
+            elif len(parts) == 2 and parts[0] == "jobs":
+                self._reply(200, self.service.job(parts[1]))
+            else:
+                raise KeyError(f"Rota não encontrada: {self.path}")
+        self._handle(route)
+
+    def do_POST(self):
+        def route(parts):
+            if parts == ["projects"]:
+                self._dispatch("load", self._payload())
+            elif len(parts) == 3 and parts[0] == "projects" and parts[2] in ("plot", "tables", "filter", "enrichment"):
+                self._dispatch(parts[2], parts[1], self._payload())
+            else:
+                raise KeyError(f"Rota não encontrada: {self.path}")
+        self._handle(route)
+
+    def do_DELETE(self):
+        def route(parts):
+            if len(parts) == 2 and parts[0] == "projects":
+                self._dispatch("unload", parts[1])
+            else:
+                raise KeyError(f"Rota não encontrada: {self.path}")
+        self._handle(route)
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} - {format % args}")
+
+
+def serve(port=None, memory_mb=None, project_mb=None):
+    """Inicia o serviço em 127.0.0.1 e atende pedidos até ser interrompido (Ctrl+C)."""
+    import_module("matplotlib").use("Agg")
+    service = AnalysisService(memory_mb, project_mb)
+    handler = type("Handler", (ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer((SERVICE_HOST, port or SERVICE_PORT), handler)
+    print(f"Proteoanalyzer 1.0 - serviço local em http://{SERVICE_HOST}:{server.server_port}")
+    logging.info(f"Serviço iniciado em http://{SERVICE_HOST}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Encerrando o serviço...")
+    finally:
+        server.server_close()
+        service.close()
+        logging.info("Serviço encerrado.")
+
+
+def send(path, payload=None, method=None, port=None):
+    """Envia um pedido ao serviço e retorna a resposta (dicionário)."""
+    data = None if payload is None else json.dumps(payload).encode("utf-8")
+    request = urllib.request.Request(f"http://{SERVICE_HOST}:{port or SERVICE_PORT}/{path.lstrip('/')}",
+                                     data=data, method=method or ("GET" if data is None else "POST"),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as error:
+        return json.loads(error.read().decode("utf-8") or "{}") | {"http_status": error.code}
+
+
+def run_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço local do Proteoanalyzer.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Inicia o serviço.")
+    serve_parser.add_argument("--port", type=int, default=None)
+    serve_parser.add_argument("--memory-mb", type=float, default=None,
+                              help="Memória máxima do conjunto dos projetos carregados.")
+    serve_parser.add_argument("--project-mb", type=float, default=None,
+                              help="Memória máxima de cada projeto (dados e resultados em cache).")
+    send_parser = commands.add_parser("send", help="Envia um pedido ao serviço em execução.")
+    send_parser.add_argument("path", help="Rota, ex: /projects/Coorte_A/plot ou /status.")
+    send_parser.add_argument("payload", nargs="?", default=None, help="Corpo JSON do pedido.")
+    send_parser.add_argument("--method", default=None, choices=["GET", "POST", "DELETE"])
+    send_parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        serve(args.port, args.memory_mb, args.project_mb)
+        return 0
+    response = send(args.path, json.loads(args.payload) if args.payload else None, args.method, args.port)
+    print(json.dumps(response, ensure_ascii=False, indent=2))
+    return 1 if "error" in response else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
@@ -0,0 +1,236 @@
+"""Índice de símbolos gênicos com resolução de sinônimos.
+
+Os símbolos são normalizados (sem espaços nas pontas, em maiúsculas) e
+resolvidos para o símbolo oficial: as bibliotecas da pasta data/ misturam
+símbolos atuais e antigos (OMIM_Expanded ainda usa IL8RB e CDC2 para CXCR2 e
+CDK1). Os sinônimos vêm de data/gene_aliases.tsv, no formato da exportação
+do HGNC (colunas "Approved symbol", "Previous symbols" e "Alias symbols", as
+duas últimas separadas por vírgula). Sem esse arquivo, apenas a normalização é
+aplicada (com um aviso no log).
+
+O arquivo é baixado do HGNC e compilado com:
+
+    python symbols.py [--datadir data]
+
+A tabela de sinônimos é compilada uma vez para data/.compiled/aliases.pkl e
+reconstruída quando o tamanho ou o mtime do arquivo mudam. Símbolos antigos
+têm prioridade sobre sinônimos, e nomes ambíguos (sinônimos de mais de um
+gene, ou que também são símbolos oficiais) não são resolvidos.
+
+SymbolIndex atribui um ID inteiro a cada símbolo oficial de uma tabela e
+valida ou converte nomes em O(1) por consulta de dicionário.
+"""
+import argparse
+import logging
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import urllib.request
+
+import numpy as np
+
+
+ALIASES_FILE = "gene_aliases.tsv"
+COMPILED_ALIASES = "aliases.pkl"
+
+APPROVED_COLUMN = "Approved symbol"
+ALIAS_COLUMNS = ["Previous symbols", "Alias symbols"]
+
+# Exportação personalizada do HGNC: símbolos aprovados, símbolos antigos e sinônimos
+HGNC_URL = ("https://www.genenames.org/cgi-bin/download/custom?col=gd_app_sym&col=gd_prev_sym&col=gd_aliases"
+            "&status=Approved&order_by=gd_app_sym_sort&format=text&submit=submit")
+
+# Tempo máximo (segundos) de espera por resposta do HGNC durante o download
+HGNC_TIMEOUT = float(os.environ.get("PROTEOANALYZER_HGNC_TIMEOUT", "60"))
+
+_loaded = {}
+_missing_warned = set()
+
+
+def normalize_symbol(name):
+    """Forma normalizada (internada) de um símbolo: sem espaços nas pontas e em maiúsculas."""
+    return sys.intern(str(name).strip().upper())
+
+
+def parse_aliases(filepath):
+    """Lê a exportação do HGNC e retorna o dicionário sinônimo -> símbolo oficial."""
+    with open(filepath, encoding="utf-8") as source:
+        header = source.readline().rstrip("\r\n").split("\t")
+        approved_at = header.index(APPROVED_COLUMN)
+        columns = [header.index(column) for column in ALIAS_COLUMNS if column in header]
+        approved, candidates = set(), [{} for _ in columns]
+        for line in source:
+            fields = line.rstrip("\r\n").split("\t")
+            if len(fields) <= approved_at or not fields[approved_at].strip():
+                continue
+            symbol = normalize_symbol(fields[approved_at])
+            approved.add(symbol)
+            for names, column in zip(candidates, columns):
+                if column < len(fields):
+                    for alias in fields[column].split(","):
+                        if alias.strip():
+                            names.setdefault(normalize_symbol(alias), set()).add(symbol)
+
+    aliases = {}
+    # Símbolos antigos primeiro: um sinônimo não substitui um símbolo antigo já resolvido
+    for names in candidates:
+        for alias, symbols in names.items():
+            if alias not in approved and alias not in aliases and len(symbols) == 1:
+                aliases[alias] = next(iter(symbols))
+    return aliases
+
+
+def aliases_stamp(datadir):
+    """Tamanho e mtime do arquivo de sinônimos, ou None se ele não existir."""
+    try:
+        stat = os.stat(os.path.join(datadir, ALIASES_FILE))
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_aliases(datadir, cachedir=None):
+    """Tabela de sinônimos de datadir (vazia se não houver gene_aliases.tsv), compilada uma única vez."""
+    stamp = aliases_stamp(datadir)
+    filepath = os.path.join(datadir, ALIASES_FILE)
+    if stamp is None:
+        if filepath not in _missing_warned:
+            _missing_warned.add(filepath)
+            logging.warning(f"Tabela de sinônimos ausente ({filepath}): símbolos antigos não serão resolvidos. "
+                            f"Execute 'python symbols.py' para baixá-la do HGNC.")
+        return {}
+    known = _loaded.get(filepath)
+    if known is not None and known[0] == stamp:
+        return known[1]
+
+    compiled = os.path.join(cachedir or os.path.join(datadir, ".compiled"), COMPILED_ALIASES)
+    aliases = None
+    try:
+        with open(compiled, "rb") as source:
+            content = pickle.load(source)
+        if content.get("stamp") == stamp:
+            aliases = content["aliases"]
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+        pass
+    if aliases is None:
+        aliases = parse_aliases(filepath)
+        try:
+            os.makedirs(os.path.dirname(compiled), exist_ok=True)
+            descriptor, partial = tempfile.mkstemp(dir=os.path.dirname(compiled), suffix=".pkl")
+            with os.fdopen(descriptor, "wb") as target:
+                pickle.dump({"stamp": stamp, "aliases": aliases}, target, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(partial, compiled)
+        except OSError as error:
+            logging.warning(f"Não foi possível gravar a tabela de sinônimos compilada: {error}")
+        logging.info(f"Tabela de sinônimos compilada: {len(aliases)} sinônimos de {filepath}")
+    _loaded[filepath] = (stamp, aliases)
+    return aliases
+
+
+def canonical_symbol(name, aliases=None):
+    """Símbolo oficial de um nome (o próprio nome normalizado se não for um sinônimo conhecido)."""
+    symbol = normalize_symbol(name)
+    return aliases.get(symbol, symbol) if aliases else symbol
+
+
+class SymbolIndex:
+    """Símbolos oficiais de uma tabela de genes, com um ID inteiro por símbolo.
+
+    Atributos:
+        symbols: símbolos oficiais, na ordem em que aparecem (posição = ID).
+        names: grafia original do primeiro nome da tabela associado a cada ID.
+        ids: dicionário símbolo oficial -> ID.
+    """
+
+    def __init__(self, names, aliases=None):
+        self.aliases = aliases or {}
+        self.symbols = []
+        self.names = []
+        self.ids = {}
+        for name in names:
+            if name is None or (isinstance(name, float) and np.isnan(name)):
+                continue
+            symbol = canonical_symbol(name, self.aliases)
+            if symbol not in self.ids:
+                self.ids[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+                self.names.append(name)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def id_of(self, name):
+        """ID do símbolo de um nome (maiúsculas/minúsculas e sinônimos resolvidos), ou -1."""
+        return self.ids.get(canonical_symbol(name, self.aliases), -1)
+
+    def ids_of(self, names):
+        """IDs de uma lista de nomes, com -1 para os desconhecidos."""
+        return np.fromiter((self.id_of(name) for name in names), dtype=np.int64, count=len(names))
+
+    def resolve(self, names):
+        """Converte nomes para a grafia da tabela.
+
+        Returns:
+            tupla (nomes encontrados, na grafia da tabela; nomes não encontrados).
+        """
+        found, missing = [], []
+        for name in names:
+            position = self.id_of(name)
+            if position < 0:
+                missing.append(name)
+            elif self.names[position] not in found:
+                found.append(self.names[position])
+        return found, missing
+
+
+def download_aliases(filepath, url=HGNC_URL, timeout=None):
+    """Baixa a exportação do HGNC para filepath, substituindo o arquivo apenas se o download for válido.
+
+    timeout: espera máxima, em segundos, pela conexão e por cada leitura (padrão: HGNC_TIMEOUT).
+
+    Returns:
+        número de sinônimos resolvidos pela nova tabela.
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, partial = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tsv")
+    try:
+        with os.fdopen(descriptor, "wb") as target, urllib.request.urlopen(
+                url, timeout=HGNC_TIMEOUT if timeout is None else timeout) as response:
+            shutil.copyfileobj(response, target)
+        aliases = parse_aliases(partial)
+        if not aliases:
+            raise ValueError(f"Exportação do HGNC sem sinônimos: {url}")
+        os.replace(partial, filepath)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return len(aliases)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Baixa e compila a tabela de sinônimos gênicos do HGNC.")
+    parser.add_argument("--datadir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"),
+                        help="Pasta das bibliotecas, onde gene_aliases.tsv é gravado (padrão: data/).")
+    parser.add_argument("--url", default=HGNC_URL, help="Endereço da exportação do HGNC.")
+    parser.add_argument("--timeout", type=float, default=HGNC_TIMEOUT,
+                        help="Espera máxima, em segundos, por resposta do HGNC.")
+    args = parser.parse_args()
+
+    output = os.path.join(args.datadir, ALIASES_FILE)
+    try:
+        total = download_aliases(output, args.url, args.timeout)
+        print(f"{total} sinônimos gravados em {output}")
+    except (OSError, ValueError) as error:
+        # Sem download, a tabela já existente (e sua versão compilada) continua em uso
+        logging.warning(f"Não foi possível baixar a tabela de sinônimos do HGNC: {error}")
+        print(f"Não foi possível baixar a tabela de sinônimos do HGNC: {error}")
+        if aliases_stamp(args.datadir) is None:
+            sys.exit(1)
+        print(f"Mantida a tabela existente: {output}")
+    aliases = load_aliases(args.datadir)
+    print(f"{len(aliases)} sinônimos em uso (ex: IL8RB -> {aliases.get('IL8RB', '-')}, "
+          f"CDC2 -> {aliases.get('CDC2', '-')})")
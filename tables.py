@@ -0,0 +1,214 @@
+"""Escrita das tabelas do projeto em formatos selecionáveis.
+
+Formatos suportados: CSV e TSV (escrita em blocos), Parquet e Feather (para
+pipelines; requerem pyarrow) e XLSX. Tabelas XLSX grandes são escritas no modo
+write-only do openpyxl, linha a linha, e divididas em várias planilhas quando
+excedem o limite de linhas do Excel. Cada arquivo é escrito em um arquivo
+temporário e renomeado ao final, de modo que uma escrita interrompida não deixa
+tabelas incompletas na pasta tables/.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+
+
+TABLE_EXTENSIONS = {"csv": ".csv", "tsv": ".tsv", "parquet": ".parquet", "feather": ".feather", "xlsx": ".xlsx"}
+
+# Limite de linhas de uma planilha do Excel (incluindo o cabeçalho)
+EXCEL_MAX_ROWS = 1048576
+
+# Tabelas com mais linhas que isso são escritas em modo streaming (CSV em blocos, XLSX write-only)
+STREAMING_ROWS = 50000
+
+CHUNK_ROWS = 10000
+
+
+def parse_table_formats(formats):
+    """Normaliza os formatos de tabela: aceita "csv,xlsx" ou uma lista e valida cada formato."""
+    if isinstance(formats, str):
+        formats = formats.split(",")
+    parsed = []
+    for table_format in formats:
+        table_format = str(table_format).strip().lower().lstrip(".")
+        if not table_format:
+            continue
+        if table_format not in TABLE_EXTENSIONS:
+            raise ValueError(f"Formato de tabela inválido: {table_format}. "
+                             f"Formatos válidos: {', '.join(TABLE_EXTENSIONS)}")
+        if table_format not in parsed:
+            parsed.append(table_format)
+    if not parsed:
+        raise ValueError("Nenhum formato de tabela informado.")
+    return parsed
+
+
+def _write_delimited(dataframe, filename, separator):
+    dataframe.to_csv(filename, sep=separator, chunksize=CHUNK_ROWS if len(dataframe) > STREAMING_ROWS else None)
+
+
+def _arrow_compatible(dataframe):
+    """Converte nomes de colunas e colunas de tipos mistos para tipos aceitos pelo Arrow."""
+    dataframe = dataframe.copy(deep=False)
+    dataframe.columns = [str(column) for column in dataframe.columns]
+    for column in dataframe.columns[dataframe.dtypes == object]:
+        types = {type(value) for value in dataframe[column].dropna()}
+        if len(types) > 1:
+            dataframe[column] = dataframe[column].map(str, na_action="ignore")
+    return dataframe
+
+
+def _write_parquet(dataframe, filename):
+    _arrow_compatible(dataframe).to_parquet(filename, index=True, row_group_size=CHUNK_ROWS * 10)
+
+
+def _write_feather(dataframe, filename):
+    # Feather não armazena índices: o índice é gravado como coluna
+    _arrow_compatible(dataframe.reset_index()).to_feather(filename)
+
+
+def _excel_value(value):
+    if isinstance(value, (list, tuple, set, dict, np.ndarray)):
+        return str(list(value) if isinstance(value, (set, np.ndarray)) else value)
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _write_xlsx_streaming(dataframe, filename):
+    """Escreve a tabela linha a linha (openpyxl write-only), abrindo uma nova planilha a cada limite do Excel."""
+    from openpyxl import Workbook
+
+    index_names = [name if name is not None else "" for name in dataframe.index.names]
+    header = index_names + [str(column) for column in dataframe.columns]
+    rows_per_sheet = EXCEL_MAX_ROWS - 1
+    workbook = Workbook(write_only=True)
+    sheet = None
+    for start in range(0, max(len(dataframe), 1), CHUNK_ROWS):
+        chunk = dataframe.iloc[start:start + CHUNK_ROWS]
+        for position, row in enumerate(chunk.itertuples(index=True, name=None), start=start):
+            if position % rows_per_sheet == 0:
+                sheet = workbook.create_sheet(f"Sheet{position // rows_per_sheet + 1}")
+                sheet.append(header)
+            index = row[0] if isinstance(row[0], tuple) else (row[0],)
+            sheet.append([_excel_value(value) for value in index + row[1:]])
+    if sheet is None:
+        workbook.create_sheet("Sheet1").append(header)
+    workbook.save(filename)
+
+
+def _write_xlsx(dataframe, filename):
+    if len(dataframe) > STREAMING_ROWS:
+        _write_xlsx_streaming(dataframe, filename)
+    else:
+        dataframe.to_excel(filename, engine="openpyxl")
+
+
+TABLE_WRITERS = {
+    "csv": lambda dataframe, filename: _write_delimited(dataframe, filename, ","),
+    "tsv": lambda dataframe, filename: _write_delimited(dataframe, filename, "\t"),
+    "parquet": _write_parquet,
+    "feather": _write_feather,
+    "xlsx": _write_xlsx,
+}
+
+
+def table_paths(name, tablesdir, formats=("csv",)):
+    """Caminhos dos arquivos que write_table escreve para a tabela, em cada formato."""
+    return [os.path.join(tablesdir, f"{name}{TABLE_EXTENSIONS[table_format]}")
+            for table_format in parse_table_formats(formats)]
+
+
+@instrumented("write_table", label=lambda dataframe, name, *args, **kwargs: name,
+              sizes=lambda written, dataframe, *args, **kwargs: {"rows": len(dataframe),
+                                                                  "columns": dataframe.shape[1],
+                                                                  "files": len(written)})
+def write_table(dataframe, name, tablesdir, formats=("csv",)):
+    """Escreve uma tabela em cada um dos formatos pedidos.
+
+    Args:
+        dataframe: tabela a ser escrita (com o índice).
+        name: nome do arquivo, sem extensão.
+        tablesdir: pasta de destino.
+        formats: lista de formatos ("csv", "tsv", "parquet", "feather", "xlsx") ou string "csv,xlsx".
+
+    Returns:
+        lista com os caminhos dos arquivos escritos.
+    """
+    written = []
+    for table_format in parse_table_formats(formats):
+        filename = table_paths(name, tablesdir, [table_format])[0]
+        # A extensão é mantida no temporário para que o pandas/openpyxl identifiquem o formato
+        partial = os.path.join(tablesdir, f".{name}.part{TABLE_EXTENSIONS[table_format]}")
+        try:
+            TABLE_WRITERS[table_format](dataframe, partial)
+            os.replace(partial, filename)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        written.append(filename)
+    return written
+
+
+class TableWriter:
+    """Escreve tabelas em segundo plano enquanto a próxima etapa da análise é executada.
+
+    As tabelas são escritas em ordem por uma única thread. Erros de escrita são
+    registrados no log e o primeiro deles é levantado em close(). As tabelas
+    enviadas não devem ser alteradas até o fechamento do escritor.
+
+    Com background=False as tabelas são escritas imediatamente, na thread atual.
+    """
+
+    def __init__(self, tablesdir, formats=("csv",), background=True):
+        self.tablesdir = tablesdir
+        self.formats = parse_table_formats(formats)
+        self._pool = ThreadPoolExecutor(max_workers=1) if background else None
+        self._pending = []
+
+    def write(self, dataframe, name, done=None):
+        """Escreve a tabela; done, se informado, é chamada com a lista de arquivos escritos."""
+        if self._pool is None:
+            written = write_table(dataframe, name, self.tablesdir, self.formats)
+            if done is not None:
+                done(written)
+            return
+        future = self._pool.submit(write_table, dataframe, name, self.tablesdir, self.formats)
+        if done is not None:
+            def notify(finished):
+                if finished.exception() is None:
+                    done(finished.result())
+            future.add_done_callback(notify)
+        self._pending.append((name, future))
+
+    def close(self):
+        """Aguarda a escrita de todas as tabelas pendentes."""
+        if self._pool is None:
+            return
+        self._pool.shutdown(wait=True)
+        errors = []
+        for name, future in self._pending:
+            error = future.exception()
+            if error is not None:
+                logging.error(f"Falha ao escrever a tabela {name}: {error}")
+                errors.append(error)
+        self._pending = []
+        if errors:
+            raise errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._pool is not None:
+            self._pool.shutdown(wait=True)
+        return False
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos do Proteoanalyzer ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_libraries():
+    """Monta um GeneSetLibraries a partir de {banco: {termo: genes}}, sem arquivos em data/."""
+    np = pytest.importorskip("numpy")
+    sparse = pytest.importorskip("scipy.sparse")
+    from libraries import GeneSetLibraries
+
+    def build(gene_sets):
+        genes = sorted({gene for sets in gene_sets.values() for members in sets.values() for gene in members})
+        index = {gene: position for position, gene in enumerate(genes)}
+        terms, term_library, rows, columns = [], [], [], []
+        for library_number, sets in enumerate(gene_sets.values()):
+            # Termos em ordem alfabética, como em parse_gene_set_libraries
+            for term, members in sorted(sets.items()):
+                for gene in sorted(set(members)):
+                    rows.append(len(terms))
+                    columns.append(index[gene])
+                terms.append(term)
+                term_library.append(library_number)
+        membership = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)),
+                                       shape=(len(terms), len(genes)))
+        return GeneSetLibraries(list(gene_sets), genes, terms, term_library, membership, aliases={})
+
+    return build
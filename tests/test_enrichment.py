@@ -0,0 +1,116 @@
+"""ORA nativo (enrichment.py) comparado ao scipy e ao enrichr do gseapy."""
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+stats = pytest.importorskip("scipy.stats")
+
+from enrichment import benjamini_hochberg, hypergeometric_sf, ora_enrichment  # noqa: E402
+
+
+BACKGROUND = [f"G{number:03d}" for number in range(200)]
+QUERY = BACKGROUND[:40]
+
+
+@pytest.fixture
+def library(make_libraries):
+    rng = np.random.default_rng(7)
+    sets = {f"RANDOM_{number:02d}": list(rng.choice(BACKGROUND, size=int(rng.integers(5, 60)), replace=False))
+            for number in range(30)}
+    sets.update({
+        # Sobreposição total com a consulta: p-valor muito pequeno
+        "QUERY_EXACT": QUERY,
+        # Termo com todos os genes do background: p-valor 1
+        "BACKGROUND": BACKGROUND,
+        # Sem sobreposição com a consulta: não testado
+        "NO_OVERLAP": BACKGROUND[150:170],
+        "SINGLE_HIT": [QUERY[0]] + BACKGROUND[100:119],
+    })
+    return make_libraries({"LIB": sets})
+
+
+def test_hypergeometric_sf_matches_scipy():
+    rng = np.random.default_rng(0)
+    background = rng.integers(50, 20000, size=500)
+    term_size = np.minimum(rng.integers(1, 2000, size=500), background)
+    query_size = np.minimum(rng.integers(1, 2000, size=500), background)
+    upper = np.minimum(term_size, query_size)
+    overlap = np.array([rng.integers(1, high + 1) for high in upper])
+
+    expected = stats.hypergeom.sf(overlap - 1, background, term_size, query_size)
+    np.testing.assert_allclose(hypergeometric_sf(overlap, background, term_size, query_size), expected,
+                               rtol=1e-9, atol=1e-300)
+
+
+def test_hypergeometric_sf_edge_cases():
+    # Sobreposição zero: P(X >= 0) = 1
+    assert hypergeometric_sf([0], [1000], [50], [20])[0] == 1
+    # Termo do tamanho do background: X = tamanho da consulta com probabilidade 1
+    assert hypergeometric_sf([20], [1000], [1000], [20])[0] == pytest.approx(1)
+    # Sobreposição muito abaixo da média: pmf sofre underflow, mas a cauda é 1
+    assert hypergeometric_sf([1], [20000], [10000], [10000])[0] == pytest.approx(1)
+    # Cauda muito pequena, sem underflow para zero
+    tiny = hypergeometric_sf([40], [20000], [40], [40])[0]
+    assert 0 < tiny < 1e-100
+    assert tiny == pytest.approx(stats.hypergeom.sf(39, 20000, 40, 40), rel=1e-9)
+
+
+def test_benjamini_hochberg_matches_scipy():
+    if not hasattr(stats, "false_discovery_control"):
+        pytest.skip("scipy sem false_discovery_control")
+    pvalues = np.random.default_rng(1).uniform(size=300) ** 3
+    np.testing.assert_allclose(benjamini_hochberg(pvalues), stats.false_discovery_control(pvalues), rtol=1e-12)
+
+
+def _expected_table(library_sets, query, background):
+    """ORA de referência, termo a termo, com as fórmulas do gseapy."""
+    rows = []
+    for term, members in library_sets.items():
+        hits = sorted(set(members) & set(query))
+        x, m, k, bg = len(hits), len(set(members)), len(query), len(background)
+        if x < 1:
+            continue
+        pvalue = stats.hypergeom.sf(x - 1, bg, m, k)
+        odds_ratio = ((x + 0.5) * (bg - m - k + x + 0.5)) / ((m - x + 0.5) * (k - x + 0.5))
+        rows.append({"Term": term, "Overlap": f"{x}/{m}", "P-value": pvalue, "Odds Ratio": odds_ratio,
+                     "Combined Score": -np.log(pvalue) * odds_ratio, "Genes": hits})
+    expected = pd.DataFrame(rows)
+    expected["Adjusted P-value"] = benjamini_hochberg(expected["P-value"].to_numpy())
+    return expected.set_index("Term")
+
+
+def test_ora_matches_reference(library):
+    foldchange = {gene: 1.0 for gene in BACKGROUND}
+    table = ora_enrichment(library, QUERY, foldchange, padjust_cutoff=1)["LIB"]
+    sets = {term: list(library.genes[library.membership[row].indices])
+            for row, term in enumerate(library.terms)}
+    expected = _expected_table(sets, QUERY, BACKGROUND)
+
+    assert list(table.index) == list(range(len(table)))
+    assert "index" not in table.columns
+    assert "NO_OVERLAP" not in set(table["Term"])
+    assert set(table["Term"]) == set(expected.index)
+
+    table = table.set_index("Term").loc[expected.index]
+    assert list(table["Overlap"]) == list(expected["Overlap"])
+    assert list(table["Genes"]) == list(expected["Genes"])
+    for column in ("P-value", "Odds Ratio", "Combined Score", "Adjusted P-value"):
+        np.testing.assert_allclose(table[column], expected[column], rtol=1e-9, err_msg=column)
+    assert table.loc["BACKGROUND", "P-value"] == pytest.approx(1)
+    assert table.loc["QUERY_EXACT", "P-value"] < 1e-40
+
+
+def test_ora_matches_gseapy_enrichr(library):
+    gseapy = pytest.importorskip("gseapy")
+    sets = {term: list(library.genes[library.membership[row].indices])
+            for row, term in enumerate(library.terms)}
+    foldchange = {gene: 1.0 for gene in BACKGROUND}
+    table = ora_enrichment(library, QUERY, foldchange, padjust_cutoff=1)["LIB"].set_index("Term")
+
+    reference = gseapy.enrichr(gene_list=QUERY, gene_sets=sets, background=BACKGROUND, outdir=None,
+                               cutoff=1, no_plot=True).results.set_index("Term")
+    assert set(table.index) == set(reference.index)
+    table = table.loc[reference.index]
+    for column in ("P-value", "Adjusted P-value", "Odds Ratio", "Combined Score"):
+        np.testing.assert_allclose(table[column].astype(float), reference[column].astype(float), rtol=1e-6,
+                                   err_msg=column)
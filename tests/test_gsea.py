@@ -0,0 +1,146 @@
+"""GSEA preranked nativo (gsea.py) comparado a uma implementação direta e ao prerank do gseapy."""
+import warnings
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+
+from gsea import enrichment_scores, gsea_enrichment, gsea_statistics, null_distribution, ranked_hits  # noqa: E402
+
+
+GENES = [f"G{number:04d}" for number in range(1000)]
+
+
+@pytest.fixture
+def ranking():
+    rng = np.random.default_rng(3)
+    metric = np.sort(rng.normal(size=len(GENES)))[::-1]
+    sets = {f"RANDOM_{number:02d}": list(rng.choice(GENES, size=int(rng.integers(15, 80)), replace=False))
+            for number in range(20)}
+    sets.update({
+        # Genes no topo do ranking: NES positivo e FDR ~ 0
+        "TOP": GENES[:30:2] + GENES[100:110],
+        # Genes no fim do ranking: NES negativo e FDR ~ 0
+        "BOTTOM": GENES[-40::2],
+    })
+    return metric, sets
+
+
+def _running_sum_score(metric, members):
+    """ES pela soma corrente completa do GSEA (peso |métrica|, p = 1)."""
+    hits = np.isin(GENES, members)
+    weights = np.abs(metric)
+    running = np.cumsum(np.where(hits, weights / weights[hits].sum(), -1 / (~hits).sum()))
+    return running.max() if running.max() >= -running.min() else running.min()
+
+
+def _reference_statistics(scores, nulls):
+    """NES, p-valor e FDR termo a termo, com as contagens explícitas do GSEA (Subramanian et al., 2005)."""
+    nes, null_nes, pvalues = [], [], []
+    for score, null in zip(scores, nulls):
+        positive_mean, negative_mean = null[null >= 0].mean(), -null[null < 0].mean()
+        nes.append(score / positive_mean if score >= 0 else score / negative_mean)
+        null_nes.append(np.where(null >= 0, null / positive_mean, null / negative_mean))
+        pvalues.append((null >= score).sum() / (null >= 0).sum() if score >= 0
+                       else (null <= score).sum() / (null < 0).sum())
+    nes, null_nes = np.array(nes), np.concatenate(null_nes)
+    fdr = []
+    for value in nes:
+        if value >= 0:
+            null_fraction = (null_nes >= value).sum() / (null_nes >= 0).sum()
+            observed_fraction = (nes >= value).sum() / (nes >= 0).sum()
+        else:
+            null_fraction = (null_nes <= value).sum() / (null_nes < 0).sum()
+            observed_fraction = (nes <= value).sum() / (nes < 0).sum()
+        fdr.append(min(null_fraction / observed_fraction, 1))
+    return nes, np.array(pvalues), np.array(fdr)
+
+
+def _hits(make_libraries, metric, sets):
+    libraries = make_libraries({"LIB": sets})
+    terms, rows, positions = ranked_hits(libraries, GENES, min_size=5, max_size=500)
+    return libraries, terms, rows, positions, np.abs(metric)
+
+
+def test_enrichment_scores_match_running_sum(make_libraries, ranking):
+    metric, sets = ranking
+    libraries, terms, rows, positions, weights = _hits(make_libraries, metric, sets)
+    scores, _ = enrichment_scores(rows, positions, weights, len(terms), len(GENES))
+    expected = [_running_sum_score(metric, sets[libraries.terms[term]]) for term in terms]
+    np.testing.assert_allclose(scores, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_gsea_statistics_match_reference(make_libraries, ranking):
+    metric, sets = ranking
+    _, terms, rows, positions, weights = _hits(make_libraries, metric, sets)
+    scores, _ = enrichment_scores(rows, positions, weights, len(terms), len(GENES))
+    nulls = null_distribution(rows, positions, weights, len(terms), permutations=300, seed=1)
+
+    nes, pvalues, fdr = gsea_statistics(scores, nulls)
+    expected_nes, expected_pvalues, expected_fdr = _reference_statistics(scores, nulls)
+    np.testing.assert_allclose(nes, expected_nes, rtol=1e-12)
+    np.testing.assert_allclose(pvalues, expected_pvalues, rtol=1e-12)
+    np.testing.assert_allclose(fdr, expected_fdr, rtol=1e-12)
+
+
+def test_gsea_statistics_match_gseapy_reference(make_libraries, ranking):
+    pytest.importorskip("gseapy")
+    pytest.importorskip("joblib")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        from gseapy import algorithm
+    metric, sets = ranking
+    _, terms, rows, positions, weights = _hits(make_libraries, metric, sets)
+    scores, _ = enrichment_scores(rows, positions, weights, len(terms), len(GENES))
+    nulls = null_distribution(rows, positions, weights, len(terms), permutations=300, seed=1)
+
+    nes, pvalues, fdr = gsea_statistics(scores, nulls)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expected_nes, expected_null_nes = algorithm.normalize(scores, nulls)
+        expected_pvalues = algorithm.gsea_pval(scores, nulls)
+        expected_fdr = algorithm.gsea_fdr(expected_nes, expected_null_nes)
+    np.testing.assert_allclose(nes, expected_nes, rtol=1e-12)
+    np.testing.assert_allclose(pvalues, expected_pvalues, rtol=1e-12)
+    np.testing.assert_allclose(fdr, expected_fdr, rtol=1e-12)
+
+
+def test_null_distribution_is_reproducible(make_libraries, ranking):
+    metric, sets = ranking
+    _, terms, rows, positions, weights = _hits(make_libraries, metric, sets)
+    serial = null_distribution(rows, positions, weights, len(terms), permutations=250, seed=42)
+    np.testing.assert_array_equal(
+        serial, null_distribution(rows, positions, weights, len(terms), permutations=250, seed=42))
+    np.testing.assert_array_equal(
+        serial, null_distribution(rows, positions, weights, len(terms), permutations=250, seed=42, workers=2))
+    assert serial.shape == (len(terms), 250)
+    assert not np.array_equal(
+        serial, null_distribution(rows, positions, weights, len(terms), permutations=250, seed=7))
+
+
+def test_gsea_matches_gseapy_prerank(make_libraries, ranking):
+    gseapy = pytest.importorskip("gseapy")
+    metric, sets = ranking
+    libraries = make_libraries({"LIB": sets})
+    foldchange = dict(zip(GENES, metric))
+    table = gsea_enrichment(libraries, GENES, metric, foldchange, padjust_cutoff=1, permutations=1000, seed=42,
+                            min_size=5)["LIB"].set_index("Term")
+
+    reference = gseapy.prerank(rnk=pd.Series(metric, index=GENES), gene_sets=sets, permutation_num=1000,
+                               min_size=5, max_size=500, seed=42, outdir=None, threads=1,
+                               verbose=False).res2d.set_index("Term")
+    assert set(table.index) == set(reference.index)
+    table = table.loc[reference.index]
+
+    # ES é determinístico; NES, p-valor e FDR diferem só pelo sorteio das permutações
+    np.testing.assert_allclose(table["ES"], reference["ES"].astype(float), rtol=1e-6)
+    np.testing.assert_allclose(table["NES"], reference["NES"].astype(float), atol=0.1)
+    np.testing.assert_allclose(table["P-value"], reference["NOM p-val"].astype(float), atol=0.05)
+    np.testing.assert_allclose(table["Adjusted P-value"], reference["FDR q-val"].astype(float), atol=0.15)
+
+    significant = set(table.index[table["Adjusted P-value"] < 0.05])
+    assert significant == set(reference.index[reference["FDR q-val"].astype(float) < 0.05])
+    assert {"TOP", "BOTTOM"} <= significant
+    assert table.loc["TOP", "NES"] > 0 > table.loc["BOTTOM", "NES"]
+    # FDR nulo (abaixo da resolução das permutações) é reportado como 1 / permutações
+    assert table.loc["TOP", "Adjusted P-value"] == table.loc["BOTTOM", "Adjusted P-value"] == 1 / 1000
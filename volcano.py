@@ -0,0 +1,125 @@
+"""Volcano plot escalável para tabelas com milhares de proteínas.
+
+A regulação é classificada uma única vez, com máscaras vetorizadas, sem
+alterar a tabela de entrada. A nuvem de proteínas não significativas é
+rasterizada (ou agrupada por densidade em hexágonos quando muito grande),
+enquanto as proteínas reguladas e os rótulos continuam vetoriais; assim o
+tamanho do arquivo e o tempo de renderização variam pouco com o número de
+proteínas. Os rótulos podem ser trocados sem redesenhar o restante da figura.
+"""
+import numpy as np
+from matplotlib import pyplot as plt
+from matplotlib.lines import Line2D
+
+
+REGULATION_LABELS = ['Up-regulated', 'Down-regulated', 'Not Significant']
+
+PALETTE = {
+    'Up-regulated': '#ff4d4d',
+    'Down-regulated': '#4d4dff',
+    'Not Significant': 'darkgrey'
+}
+
+# Acima desse número de pontos não significativos, a nuvem é desenhada como densidade (hexbin)
+DENSITY_THRESHOLD = 50000
+
+IMAGE_FORMATS = ("svg", "png", "pdf")
+
+
+def classify_regulation(log2fc, pvalues, cutoff, pvalue_cutoff):
+    """Classifica cada proteína como regulada positiva (0), negativamente (1) ou não significativa (2)."""
+    log2fc = np.asarray(log2fc, dtype=np.float64)
+    significant = np.asarray(pvalues, dtype=np.float64) < pvalue_cutoff
+    regulation = np.full(len(log2fc), 2, dtype=np.int8)
+    regulation[significant & (log2fc >= cutoff)] = 0
+    regulation[significant & (log2fc <= -cutoff)] = 1
+    return regulation
+
+
+class VolcanoPlot:
+    """Figura do volcano plot com camada de pontos fixa e rótulos substituíveis.
+
+    Args:
+        df: tabela com as colunas gene_name, log2(fc), pAdjusted e -log10(pAdjusted).
+        cutoff: cutoff de log2(fc).
+        pvalue_cutoff: cutoff do p-valor ajustado.
+    """
+
+    def __init__(self, df, cutoff, pvalue_cutoff, xlim=(-3, 3)):
+        self.genes = df['gene_name'].astype(str).to_numpy()
+        self.x = df['log2(fc)'].to_numpy(dtype=np.float64)
+        if '-log10(pAdjusted)' in df:
+            self.y = df['-log10(pAdjusted)'].to_numpy(dtype=np.float64)
+        else:
+            self.y = -np.log10(df['pAdjusted'].to_numpy(dtype=np.float64))
+        self.regulation = classify_regulation(self.x, df['pAdjusted'], cutoff, pvalue_cutoff)
+        self.labels = []
+
+        with plt.style.context('seaborn-v0_8-white'):
+            self.figure, self.ax = plt.subplots(figsize=(8, 8))
+            self._draw_points()
+
+            # --- Axis and threshold lines ---
+            self.ax.axvline(x=0, color='black', linestyle='-', linewidth=0.75)
+            self.ax.axhline(y=-np.log10(pvalue_cutoff), color='dimgrey', linestyle='--', linewidth=1)
+            self.ax.axvline(x=cutoff, color='dimgrey', linestyle='--', linewidth=1)
+            self.ax.axvline(x=-cutoff, color='dimgrey', linestyle='--', linewidth=1)
+
+            # --- Final Plot Customization ---
+            self.ax.set_title('Volcano Plot', fontsize=16, fontweight='bold')
+            self.ax.set_ylabel(r'$-log_{10}(Adjusted\ p-value)$', fontsize=12)
+            self.ax.set_xlabel(r'$log_2(Fold\ Change)$', fontsize=12)
+            self.ax.set_xlim(*xlim)
+
+            present = [code for code in range(len(REGULATION_LABELS)) if (self.regulation == code).any()]
+            handles = [Line2D([], [], linestyle='none', marker='o', markersize=7, alpha=0.7,
+                              markerfacecolor=PALETTE[REGULATION_LABELS[code]], markeredgecolor='none')
+                       for code in present]
+            self.ax.legend(handles, [REGULATION_LABELS[code] for code in present], title='Regulation',
+                           frameon=False)
+
+    def _draw_points(self):
+        background = self.regulation == 2
+        if background.sum() > DENSITY_THRESHOLD:
+            self.ax.hexbin(self.x[background], self.y[background], gridsize=150, bins='log', mincnt=1,
+                           cmap='Greys', linewidths=0, rasterized=True, zorder=1)
+        else:
+            # A nuvem densa é rasterizada; apenas as proteínas reguladas ficam vetoriais
+            self.ax.scatter(self.x[background], self.y[background], s=40, alpha=0.7, edgecolors='none',
+                            color=PALETTE['Not Significant'], rasterized=True, zorder=1)
+        for code in (0, 1):
+            selected = self.regulation == code
+            self.ax.scatter(self.x[selected], self.y[selected], s=40, alpha=0.7, edgecolors='none',
+                            color=PALETTE[REGULATION_LABELS[code]], zorder=2)
+
+    def set_labels(self, proteins):
+        """Substitui os rótulos da figura pelas proteínas informadas, sem redesenhar os pontos.
+
+        Returns:
+            lista das proteínas informadas que não estão na tabela.
+        """
+        for text in self.labels:
+            text.remove()
+        proteins = list(proteins or [])
+        selected = np.flatnonzero(np.isin(self.genes, proteins))
+        self.labels = [self.ax.text(x, y, gene, ha='center', va='bottom', fontsize=9, fontweight='bold',
+                                    alpha=0.9, zorder=3)
+                       for x, y, gene in zip(self.x[selected], self.y[selected], self.genes[selected])]
+        return sorted(set(proteins) - set(self.genes[selected]))
+
+    def save(self, basepath, formats=("svg",), dpi=300):
+        """Salva a figura em cada formato pedido (svg, png, pdf) e retorna os caminhos gerados."""
+        written = []
+        for image_format in formats:
+            image_format = image_format.strip().lower()
+            if image_format not in IMAGE_FORMATS:
+                raise ValueError(f"Formato de imagem inválido para o volcano plot: {image_format}. "
+                                 f"Formatos válidos: {', '.join(IMAGE_FORMATS)}")
+            path = f"{basepath}.{image_format}"
+            self.figure.savefig(path, format=image_format, dpi=dpi, bbox_inches='tight')
+            written.append(path)
+        return written
+
+    def close(self):
+        plt.close(self.figure)
+